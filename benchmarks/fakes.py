@@ -0,0 +1,437 @@
+"""Local stand-ins for the parts of Discord the cogs touch, used by the offline benchmarks
+
+Every call that would be an HTTP request goes through FakeAPI, which waits `latency` seconds and answers
+a fraction of requests with 429. Like discord.py, rate limited requests are retried after retry_after,
+so callers only see the extra latency.
+
+configure() must be called before anything imports utils.config, it points the bot at an in-memory database.
+"""
+import os
+import json
+import random
+import asyncio
+import datetime
+import tempfile
+import collections
+from typing import Dict, List, Iterable, Optional, Any
+
+import discord
+
+# config.json used by the benchmarks, the home guild has no giveaway channels so no tickets are created
+CONFIG = {
+    'db_instance': 'memory',
+    'prefix': ['g!'],
+    'arg_delimiter': ';',
+    'guild_id': 1,
+    'giveaway_channels': [],
+    'giveaway_role_ids': [3],
+    'mod_role_ids': [4],
+    'disqualified_role_id': 5,
+    'modmail_channel_id': None,
+    'log_channel_id': 7,
+    'mod_log_channel_id': 8,
+    'write_behind_interval': 1,
+    'poll_refresh_interval': 2,
+}
+
+
+def configure(overrides: Dict[str, Any] = None) -> str:
+    """Writes a benchmark config.json to a temporary file and loads it, returns its path"""
+    file = tempfile.NamedTemporaryFile('w', suffix='.json', prefix='wfg-benchmark-', delete=False)
+    with file:
+        json.dump({**CONFIG, **(overrides or {})}, file)
+    os.environ['WFG_CONFIG'] = file.name
+    from utils import config
+    config.load(file.name)
+    return file.name
+
+
+class FakeResponse:
+    """What discord.HTTPException reads from an aiohttp response"""
+
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeAPI:
+    """Simulated HTTP layer, counts requests per route
+
+    :param latency: seconds every request takes
+    :param jitter: up to this many seconds are added to latency at random
+    :param rate_limit_chance: fraction of requests answered with 429
+    :param retry_after: seconds to wait before retrying a rate limited request
+    """
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            rate_limit_chance: float = 0.0,
+            retry_after: float = 0.05,
+            seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_chance = rate_limit_chance
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = collections.Counter()
+        self.rate_limited = 0
+
+    async def request(self, route: str):
+        while True:
+            self.requests[route] += 1
+            delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.rate_limit_chance and self.random.random() < self.rate_limit_chance:
+                self.rate_limited += 1
+                await asyncio.sleep(self.retry_after)
+                continue
+            return
+
+    def reset(self):
+        self.requests.clear()
+        self.rate_limited = 0
+
+
+class FakeUser:
+    def __init__(self, api: FakeAPI, id_: int, name: str = None, bot: bool = False):
+        self.api = api
+        self.id = id_
+        self.name = name or f'user{id_}'
+        self.bot = bot
+
+    @property
+    def mention(self) -> str:
+        return f'<@{self.id}>'
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def send(self, *args, **kwargs):
+        await self.api.request('dm')
+
+
+class FakeMember(FakeUser):
+    def __init__(self, api: FakeAPI, id_: int, guild: 'FakeGuild', role_ids: Iterable[int] = (),
+                 joined_at: datetime.datetime = None, **kwargs):
+        super().__init__(api, id_, **kwargs)
+        self.guild = guild
+        self.roles = {role_id: discord.Object(role_id) for role_id in role_ids}
+        self.joined_at = joined_at
+
+    def get_role(self, role_id: int) -> Optional[discord.Object]:
+        return self.roles.get(role_id)
+
+
+class FakeReaction:
+    """A reaction whose users() is paginated 100 per request, like GET /reactions"""
+    page_size = 100
+
+    def __init__(self, message: 'FakeMessage', emoji: str, users: List[FakeUser]):
+        self.message = message
+        self.emoji = emoji
+        self.__users = users
+
+    @property
+    def count(self) -> int:
+        return len(self.__users)
+
+    @property
+    def me(self) -> bool:
+        return any(user.bot for user in self.__users)
+
+    async def users(self, limit: int = None, after=None):
+        users = self.__users if limit is None else self.__users[:limit]
+        for start in range(0, len(users), self.page_size):
+            await self.message.api.request('reactions')
+            for user in users[start:start + self.page_size]:
+                yield user
+
+    def add(self, user: FakeUser):
+        self.__users.append(user)
+
+    def remove(self, user: FakeUser):
+        if user in self.__users:
+            self.__users.remove(user)
+
+
+class FakeMessage:
+    def __init__(self, api: FakeAPI, id_: int, channel: 'FakeChannel', content: str = None,
+                 embeds: List[discord.Embed] = None):
+        self.api = api
+        self.id = id_
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.embeds = embeds or []
+        self.reactions: List[FakeReaction] = []
+        self.attachments = []
+        self.author = None
+        self.edits = 0
+
+    @property
+    def jump_url(self) -> str:
+        return f'https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}'
+
+    def reaction(self, emoji: str) -> FakeReaction:
+        """The reaction with emoji, created if nobody reacted with it yet"""
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+        reaction = FakeReaction(self, emoji, [])
+        self.reactions.append(reaction)
+        return reaction
+
+    async def edit(self, content: str = None, embed: discord.Embed = None, **kwargs):
+        await self.api.request('edit')
+        self.edits += 1
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def add_reaction(self, emoji: str):
+        await self.api.request('add_reaction')
+        self.reaction(emoji).add(self.channel.guild.bot.user)
+
+    async def remove_reaction(self, emoji: str, member: FakeUser):
+        await self.api.request('remove_reaction')
+        self.reaction(emoji).remove(member)
+
+    async def delete(self):
+        await self.api.request('delete')
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, api: FakeAPI, id_: int, guild: 'FakeGuild'):
+        self.api = api
+        self.id = id_
+        self.guild = guild
+        self.messages: Dict[int, FakeMessage] = {}
+        self.sent: List[FakeMessage] = []
+        self.threads: List['FakeThread'] = []  # active threads, none are ever archived
+        self.__next_id = id_ << 22
+
+    @property
+    def mention(self) -> str:
+        return f'<#{self.id}>'
+
+    def next_id(self) -> int:
+        self.__next_id += 1
+        return self.__next_id
+
+    def add_message(self, embeds: List[discord.Embed] = None, id_: int = None) -> FakeMessage:
+        """Creates a message without a request, for setting up a benchmark"""
+        message = FakeMessage(self.api, id_ or self.next_id(), self, embeds=embeds)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self.api.request('fetch_message')
+        try:
+            return self.messages[int(message_id)]
+        except KeyError:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Message')
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self.messages.get(int(message_id)) or FakeMessage(self.api, int(message_id), self)
+
+    async def send(self, content: str = None, embed: discord.Embed = None, **kwargs) -> FakeMessage:
+        await self.api.request('send')
+        message = self.add_message(embeds=[embed] if embed is not None else None)
+        message.content = content
+        message.author = self.guild.bot.user
+        self.sent.append(message)
+        return message
+
+    async def history(self, after=None, limit: int = 100):
+        """Latest messages sent through the API, oldest first, `after` is ignored as fake ids aren't timestamps"""
+        await self.api.request('history')
+        for message in self.sent[-limit:]:
+            yield message
+
+    async def archived_threads(self, private: bool = False, limit: int = 50):
+        await self.api.request('archived_threads')
+        for thread in ():
+            yield thread
+
+    async def create_thread(self, name: str, **kwargs) -> 'FakeThread':
+        await self.api.request('create_thread')
+        thread = FakeThread(self.api, self.next_id(), self.guild, name)
+        self.threads.append(thread)
+        self.guild.bot.channels[thread.id] = thread
+        return thread
+
+
+class FakeThread(FakeChannel):
+    def __init__(self, api: FakeAPI, id_: int, guild: 'FakeGuild', name: str):
+        super().__init__(api, id_, guild)
+        self.name = name
+        self.starter_message = None
+
+    async def edit(self, name: str = None, **kwargs):
+        await self.api.request('edit_thread')
+        self.name = name or self.name
+        return self
+
+
+class FakeGuild:
+    def __init__(self, bot: 'FakeBot', id_: int):
+        self.bot = bot
+        self.id = id_
+        self.channels: Dict[int, FakeChannel] = {}
+
+    def add_channel(self, id_: int) -> FakeChannel:
+        channel = FakeChannel(self.bot.api, id_, self)
+        self.channels[id_] = channel
+        self.bot.channels[id_] = channel
+        return channel
+
+
+class FakeBot:
+    """The attributes of utils.bot_extension.BotExtension the cogs use, with one shard owning every guild"""
+
+    def __init__(self, api: FakeAPI, user_id: int = 1000):
+        from utils import database as db
+        from utils.leases import LeaseManager
+        from utils.winners import WinnersIndex
+        from utils.scheduler import DeadlineScheduler
+        from utils.lifecycle import Lifecycle
+        from utils.config import config
+        from utils.guild_config import GuildConfigCache, GuildSettings
+
+        self.api = api
+        self.user = FakeUser(api, user_id, 'giveaways', bot=True)
+        self.owner = FakeUser(api, user_id + 1, 'owner')
+        self.channels: Dict[int, FakeChannel] = {}
+        self.guilds: Dict[int, FakeGuild] = {}
+        self.resources = {}
+        self.leases = LeaseManager(db.collection.leases, owner='benchmark')
+        self.guild_config = GuildConfigCache(db.collection.guilds, GuildSettings.from_config(config))
+        self.winners = WinnersIndex(db.collection.winners)
+        self.scheduler = DeadlineScheduler()
+        self.lifecycle = Lifecycle()
+        self.log_channel = self.add_guild(config['guild_id']).add_channel(config['log_channel_id'])
+
+    def add_guild(self, id_: int) -> FakeGuild:
+        guild = self.guilds.get(id_) or FakeGuild(self, id_)
+        self.guilds[id_] = guild
+        return guild
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(int(channel_id))
+
+    async def fetch_channel(self, channel_id: int) -> FakeChannel:
+        await self.api.request('fetch_channel')
+        try:
+            return self.channels[int(channel_id)]
+        except KeyError:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Channel')
+
+    def shard_of(self, guild_id: int = None) -> int:
+        return 0
+
+    def owns_guild(self, guild_id: int) -> bool:
+        return True
+
+    async def wait_until_ready(self):
+        pass
+
+    async def close(self):
+        """Stops the background tasks like BotExtension.close, without flushing the shared write-behind buffers"""
+        from utils.debounce import Debouncer
+
+        await self.scheduler.close()
+        for task in self.scheduler.running.values():
+            task.cancel()
+        await Debouncer.close_all()
+        await self.leases.close()
+
+
+def reaction_event(
+        message: FakeMessage,
+        member: FakeMember,
+        emoji: str = '🎉',
+        event_type: str = 'REACTION_ADD'
+) -> discord.RawReactionActionEvent:
+    """A gateway reaction event as discord.py would dispatch it"""
+    event = discord.RawReactionActionEvent(
+        {
+            'message_id': message.id,
+            'channel_id': message.channel.id,
+            'user_id': member.id,
+            'guild_id': message.guild.id,
+            'type': 0
+        },
+        discord.PartialEmoji(name=emoji),
+        event_type
+    )
+    event.member = member
+    return event
+
+
+class FakeContext:
+    """What the cog's commands read from commands.Context"""
+
+    def __init__(self, bot: FakeBot, channel: FakeChannel, author: FakeMember, content: str):
+        self.bot = bot
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.message = channel.add_message()
+        self.message.content = content
+
+    async def reply(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+class FakeInteractionResponse:
+    def __init__(self, api: FakeAPI):
+        self.api = api
+        self.messages: List[str] = []
+        self.deferred = False
+
+    async def send_message(self, content: str = None, **kwargs):
+        await self.api.request('interaction_response')
+        self.messages.append(content)
+
+    async def defer(self, **kwargs):
+        await self.api.request('interaction_response')
+        self.deferred = True
+
+
+class FakeFollowup:
+    def __init__(self, api: FakeAPI):
+        self.api = api
+        self.messages: List[Any] = []
+
+    async def send(self, content: str = None, embed: discord.Embed = None, **kwargs):
+        await self.api.request('followup')
+        self.messages.append(content if content is not None else embed)
+
+
+class FakeInteraction:
+    """A click on a button of a message"""
+
+    def __init__(self, message: FakeMessage, user: FakeUser):
+        self.client = message.guild.bot
+        self.message = message
+        self.user = user
+        self.guild_id = message.guild.id
+        self.channel_id = message.channel.id
+        self.response = FakeInteractionResponse(message.api)
+        self.followup = FakeFollowup(message.api)
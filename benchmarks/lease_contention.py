@@ -0,0 +1,101 @@
+"""Runs two bot-like processes against one SQLite file and checks every giveaway is ended exactly once
+
+Usage:
+    python -m benchmarks.lease_contention [-n 500] [--ttl 2]
+
+The first process crashes while holding a lease, the second one takes its work over once the lease expires.
+Each "end" inserts into an `ended` table, so ending a giveaway twice raises DuplicateKeyError.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+from utils import sqlite
+from utils.storage import DuplicateKeyError
+from utils.leases import LeaseManager
+
+
+async def worker(path: str, name: str, ttl: float, crash_after: int, results):
+    collection = sqlite.Collection(path)
+    ended = sqlite.Table(collection.database, 'ended')
+    leases = LeaseManager(collection.leases, ttl=ttl, heartbeat=ttl / 4, owner=name)
+    leases.start()
+    done = 0
+    duplicates = 0
+    claim_latency = []
+    deadline = time.time() + ttl * 10
+    while time.time() < deadline:
+        documents = collection.range_by_ending(before=time.time())
+        if not documents:
+            break
+        for document in documents:
+            lease = f'giveaway:{document["_id"]}'
+            start = time.perf_counter()
+            acquired = await leases.acquire(lease)
+            claim_latency.append(time.perf_counter() - start)
+            if not acquired:
+                continue
+            if done == crash_after:
+                os._exit(1)  # crash while holding the lease
+            if not await leases.confirm(lease) or collection.get(document['_id']) is None:
+                leases.forget(lease)
+                continue
+            try:
+                ended.insert({'_id': document['_id'], 'by': name})
+            except DuplicateKeyError:
+                duplicates += 1
+            collection.delete(document['_id'])
+            leases.forget(lease)
+            done += 1
+        await asyncio.sleep(0.1)
+    claim_latency.sort()
+    results.put((name, done, duplicates, claim_latency[len(claim_latency) // 2] if claim_latency else 0))
+
+
+def run_worker(*args):
+    asyncio.run(worker(*args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=500, help='giveaways to end')
+    parser.add_argument('--ttl', type=float, default=2, help='lease ttl in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'leases.db')
+        collection = sqlite.Collection(path)
+        collection.upsert_many([{'_id': str(i), 'ending': time.time() - 1} for i in range(args.n)])
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [
+            context.Process(target=run_worker, args=(path, 'crashing', args.ttl, args.n // 4, results)),
+            context.Process(target=run_worker, args=(path, 'survivor', args.ttl, -1, results)),
+        ]
+        start = time.time()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.time() - start
+
+        ended = sqlite.Table(collection.database, 'ended')
+        by = {}
+        for document in ended.stream(batch_size=1000):
+            by[document['by']] = by.get(document['by'], 0) + 1
+        remaining = len(list(collection.ids()))
+        while not results.empty():
+            name, done, duplicates, claim = results.get()
+            print(f'{name}: ended {done}, duplicates {duplicates}, median claim {claim * 1000:.3f}ms')
+        print(f'ended per process: {by}, not ended: {remaining}, total time {elapsed:.2f}s')
+        ok = sum(by.values()) == args.n and remaining == 0
+        print('OK: every giveaway ended exactly once' if ok else 'FAILED')
+        raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
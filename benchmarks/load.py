@@ -0,0 +1,254 @@
+"""Replays a schedule of reactions, start commands and end commands against the giveaway cog, fully offline
+
+Usage (from the repository root):
+    python -m benchmarks.load [--reactions 1000] [--starts 5] [--ends 2] [--seconds 10] [--arrival poisson]
+                              [--save-trace trace.jsonl | --trace trace.jsonl] [--output run.json] [--compare base.json]
+
+Rates are per second. Arrivals are 'constant' (evenly spaced), 'poisson' (exponential gaps) or
+'burst' (every event of a second arrives at the start of that second).
+The schedule only depends on the arguments and --seed, saving it with --save-trace and passing it to --trace
+replays exactly the same load. --output writes the results with the git revision as JSON,
+--compare prints them next to an earlier --output so two commits can be compared.
+
+Latency is measured from when an event was due until the cog finished handling it.
+Backlog is the amount of events dispatched but not yet handled, sampled every 10ms.
+"""
+from benchmarks import fakes
+
+fakes.configure()  # before utils.config is imported by anything below
+
+import sys  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+import math  # noqa: E402
+import random  # noqa: E402
+import asyncio  # noqa: E402
+import argparse  # noqa: E402
+import platform  # noqa: E402
+import subprocess  # noqa: E402
+from typing import Dict, List, Any  # noqa: E402
+
+from benchmarks.storage_backends import percentile  # noqa: E402
+from benchmarks.scenarios import setup, add_giveaway  # noqa: E402
+from utils import database as db  # noqa: E402
+
+# Upper bounds in ms of the latency histogram buckets, the last bucket is everything above
+BUCKETS = [0.1 * 2 ** i for i in range(18)]
+
+
+def arrivals(rate: float, seconds: float, arrival: str, rng: random.Random) -> List[float]:
+    """Offsets in seconds of `rate` events per second over `seconds`"""
+    if rate <= 0:
+        return []
+    if arrival == 'constant':
+        return [i / rate for i in range(int(rate * seconds))]
+    if arrival == 'burst':
+        return [float(int(i / rate)) for i in range(int(rate * seconds))]
+    offsets = []
+    at = rng.expovariate(rate)
+    while at < seconds:
+        offsets.append(at)
+        at += rng.expovariate(rate)
+    return offsets
+
+
+def build_trace(args) -> List[Dict[str, Any]]:
+    """The schedule of events, sorted by when they are due"""
+    rng = random.Random(args.seed)
+    trace = []
+    for at in arrivals(args.reactions, args.seconds, args.arrival, rng):
+        # a few giveaways get most of the reactions, like a popular giveaway right after it was posted
+        target = min(int(rng.paretovariate(1.2)) - 1, args.giveaways - 1)
+        trace.append({'at': at, 'kind': 'reaction', 'target': target, 'user': len(trace)})
+    for at in arrivals(args.starts, args.seconds, args.arrival, rng):
+        trace.append({'at': at, 'kind': 'start'})
+    ended = rng.sample(range(args.giveaways), min(args.giveaways, int(args.ends * args.seconds)))
+    for at, target in zip(arrivals(args.ends, args.seconds, args.arrival, rng), ended):
+        trace.append({'at': at, 'kind': 'end', 'target': target})
+    trace.sort(key=lambda event: event['at'])
+    return trace
+
+
+def histogram(samples: List[float]) -> List[int]:
+    counts = [0] * (len(BUCKETS) + 1)
+    for sample in samples:
+        index = 0
+        while index < len(BUCKETS) and sample > BUCKETS[index]:
+            index += 1
+        counts[index] += 1
+    return counts
+
+
+def summary(samples: List[float]) -> Dict[str, Any]:
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'p50': percentile(samples, 50),
+        'p90': percentile(samples, 90),
+        'p99': percentile(samples, 99),
+        'max': max(samples),
+        'histogram': histogram(samples),
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True).stdout
+    except OSError:
+        return {'revision': None, 'dirty': None}
+    return {'revision': revision.strip() or None, 'dirty': bool(dirty.strip())}
+
+
+async def replay(trace: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    api = fakes.FakeAPI(
+        latency=args.latency, jitter=args.jitter, rate_limit_chance=args.rate_limit,
+        retry_after=args.retry_after, seed=args.seed
+    )
+    random.seed(args.seed)
+    bot, channel, cog = setup(api)
+    ending = time.time() + 86400
+    documents = [add_giveaway(cog, channel, ending, []) for _ in range(args.giveaways)]
+    staff = fakes.FakeMember(api, 10 ** 16, channel.guild, role_ids=fakes.CONFIG['giveaway_role_ids'])
+    members = {}
+
+    def member(index: int) -> fakes.FakeMember:
+        if index not in members:
+            members[index] = fakes.FakeMember(api, 10 ** 17 + index, channel.guild)
+        return members[index]
+
+    async def handle(event: Dict[str, Any]):
+        if event['kind'] == 'reaction':
+            message = channel.messages[int(documents[event['target']]['_id'])]
+            await cog.on_raw_reaction_add(fakes.reaction_event(message, member(event['user'])))
+        elif event['kind'] == 'start':
+            ctx = fakes.FakeContext(bot, channel, staff, 'g!start 1d ; 1 ; Load test')
+            await cog.start.callback(cog, ctx)
+        else:
+            ctx = fakes.FakeContext(bot, channel, staff, f'g!end {documents[event["target"]]["_id"]}')
+            await cog.end.callback(cog, ctx)
+
+    samples = {kind: [] for kind in ('reaction', 'start', 'end')}
+    errors = []
+    in_flight = set()
+
+    async def timed(event: Dict[str, Any], due: float):
+        try:
+            await handle(event)
+        except Exception as error:
+            errors.append(f'{event["kind"]}: {error!r}')
+        samples[event['kind']].append((time.time() - due) * 1000)
+
+    backlog = []
+
+    async def sample_backlog():
+        while True:
+            backlog.append(len(in_flight))
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(sample_backlog())
+    first = time.time()
+    start = time.perf_counter()
+    dispatched = 0
+    while dispatched < len(trace):
+        now = time.time()
+        while dispatched < len(trace) and first + trace[dispatched]['at'] <= now:
+            task = asyncio.create_task(timed(trace[dispatched], first + trace[dispatched]['at']))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            dispatched += 1
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*in_flight)
+    seconds = time.perf_counter() - start
+    sampler.cancel()
+    await bot.close()
+    await db.collection.buffered.close()
+    return {
+        **git_revision(),
+        'python': platform.python_version(),
+        'arguments': {key: value for key, value in vars(args).items()
+                      if key not in ('output', 'compare', 'save_trace')},
+        'events': len(trace),
+        'seconds': seconds,
+        'latency_ms': {kind: summary(kind_samples) for kind, kind_samples in samples.items()},
+        'backlog': {'p50': percentile(backlog, 50), 'p99': percentile(backlog, 99), 'max': max(backlog)},
+        'requests': dict(api.requests),
+        'rate_limited': api.rate_limited,
+        'errors': errors[:20],
+        'error_count': len(errors),
+    }
+
+
+def report(result: Dict[str, Any], baseline: Dict[str, Any] = None):
+    revision = f'{result["revision"]}{"+dirty" if result["dirty"] else ""}'
+    print(f'revision {revision}, {result["events"]} events in {result["seconds"]:.2f}s, '
+          f'{result["rate_limited"]} rate limited requests, {result["error_count"]} errors')
+    print(f'{"event":<10}{"count":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for kind, stats in result['latency_ms'].items():
+        if not stats['count']:
+            continue
+        print(f'{kind:<10}{stats["count"]:>8}{stats["p50"]:>10.2f}{stats["p90"]:>10.2f}'
+              f'{stats["p99"]:>10.2f}{stats["max"]:>10.2f}')
+        if baseline and baseline['latency_ms'].get(kind, {}).get('count'):
+            base = baseline['latency_ms'][kind]
+            changes = ''.join(
+                f'{(stats[key] - base[key]) / base[key] * 100 if base[key] else math.inf:>+9.1f}%'
+                for key in ('p50', 'p90', 'p99', 'max')
+            )
+            print(f'{"  vs " + str(baseline["revision"]):<18}{changes}')
+    backlog = result['backlog']
+    print(f'backlog   p50 {backlog["p50"]}  p99 {backlog["p99"]}  max {backlog["max"]}')
+    print('histogram (ms upper bound: count)')
+    for kind, stats in result['latency_ms'].items():
+        if stats['count']:
+            buckets = [f'{bound:g}:{count}' for bound, count in zip(BUCKETS + [math.inf], stats['histogram']) if count]
+            print(f'  {kind:<10}{" ".join(buckets)}')
+    for error in result['errors']:
+        print(f'error: {error}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reactions', type=float, default=1000, help='reactions per second')
+    parser.add_argument('--starts', type=float, default=5, help='start commands per second')
+    parser.add_argument('--ends', type=float, default=2, help='end commands per second')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of the load')
+    parser.add_argument('--arrival', choices=('constant', 'poisson', 'burst'), default='poisson')
+    parser.add_argument('--giveaways', type=int, default=200, help='running giveaways when the load starts')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds per simulated API request')
+    parser.add_argument('--jitter', type=float, default=0.002, help='up to this many seconds added per request')
+    parser.add_argument('--rate-limit', type=float, default=0.01, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=0.05, help='seconds to wait after a 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace', help='replay this trace instead of generating one')
+    parser.add_argument('--save-trace', help='write the generated trace to this file')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file written by --output to compare against')
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace, encoding='utf-8') as file:
+            trace = [json.loads(line) for line in file if line.strip()]
+        if any(event.get('target', 0) >= args.giveaways for event in trace):
+            parser.error('trace targets more giveaways than --giveaways')
+    else:
+        trace = build_trace(args)
+    if args.save_trace:
+        with open(args.save_trace, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(event) + '\n' for event in trace)
+
+    result = asyncio.run(replay(trace, args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+    report(result, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
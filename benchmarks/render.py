@@ -0,0 +1,74 @@
+"""Times rendering of giveaway embeds, nothing is sent
+
+Usage (from the repository root, no config.json needed):
+    python -m benchmarks.render [-n 5000] [--winners 1 20 1000]
+
+    running - running giveaway embed, rendered on start, edits and every entrant count refresh
+    result  - result post with --winners winners, embeds and mention content split into messages within limits
+    guide   - winner guide, rendered once per giveaway and sent in every winner's ticket
+    contact - holder field of a typed holder, and of one stored before holders had a type
+    payload - messages of a result post serialized for the API, what discord.py does before sending them
+"""
+from benchmarks import fakes
+
+fakes.configure()  # before utils.config is imported by anything below
+
+import time  # noqa: E402
+import argparse  # noqa: E402
+import statistics  # noqa: E402
+from typing import Callable, Dict, List  # noqa: E402
+
+from benchmarks.storage_backends import percentile  # noqa: E402
+from utils import template  # noqa: E402
+
+TYPED = template.Holder('<@468631903390400527>', 'holder', 'Contact holder to claim your prize',
+                        template.HolderType.ITEM_HOLDER)
+LINK = 'https://discord.com/channels/1/20/83886081'
+
+
+def measure(function: Callable[[], object], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def cases(winner_counts: List[int]) -> Dict[str, Callable[[], object]]:
+    def legacy_contact():
+        # Holder(**document['holder']) of a document without 'type', the type is read from the string
+        return template.__contact_type__(template.Holder(TYPED.mention, TYPED.tag, TYPED.string))
+
+    functions = {
+        'running': lambda: template.running_giveaway(1792420606, 3, TYPED, 'Restrictions: MR5+', 'Forma', 1200),
+        'guide': lambda: template.winner_guide('Forma', 'Restrictions: MR5+', LINK, TYPED.tag),
+        'contact': lambda: template.__contact_type__(TYPED),
+        'contact legacy': legacy_contact,
+    }
+    for count in winner_counts:
+        mentions = [f'<@{10 ** 17 + i}>' for i in range(count)]
+        functions[f'result {count}'] = lambda mentions=mentions: template.giveaway_result(
+            mentions, 'Forma', 'Restrictions: MR5+', TYPED, LINK, mention_users=True
+        )
+        result = template.giveaway_result(mentions, 'Forma', 'Restrictions: MR5+', TYPED, LINK, mention_users=True)
+        functions[f'payload {count}'] = lambda result=result: [message['embed'].to_dict() for message in result]
+    return functions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--iterations', type=int, default=5000)
+    parser.add_argument('--winners', type=int, nargs='+', default=[1, 20, 1000], help='winners of result posts')
+    args = parser.parse_args()
+
+    print(f'{"render":<16}{"mean us":>10}{"p50 us":>10}{"p99 us":>10}')
+    for name, function in cases(args.winners).items():
+        function()  # warm up
+        samples = measure(function, args.iterations)
+        print(f'{name:<16}{statistics.fmean(samples):>10.2f}{percentile(samples, 50):>10.2f}'
+              f'{percentile(samples, 99):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+"""Runs the giveaway cog against the fakes in benchmarks/fakes.py, nothing touches Discord or a database server
+
+Usage (from the repository root, no config.json needed):
+    python -m benchmarks.scenarios [ending] [draw] [storm] [--latency 0.002] [--rate-limit 0.01]
+
+    ending - 10k giveaways ending within one hour, the hour compressed into --window seconds
+    draw   - drawing a winner from 100k entrants, users() fetched 100 per request
+    weighted - role-weighted draw of 10 winners from 100k members already fetched, 15% with weighted roles
+    rules  - eligibility rules (roles, account age, tenure, win cooldown) applied to 50k fetched members
+    storm  - reaction storm of 1k reactions/s into 100 running giveaways for --seconds
+    scheduled - 500 scheduled giveaways in 50 channels due within --window seconds, 2% of them left half
+                posted by a stopped process, which have to be recovered instead of posted again
+    poll   - --voters members voting on one poll over --seconds, 10% of them changing their vote once
+    tickets - --ticket-users members clicking the modmail button over --seconds, 30% of them double clicking
+
+Latency is measured from when an end, post or reaction was due, so time spent queued behind other work counts.
+Peak memory is traced with tracemalloc in a second run, so tracing doesn't slow down the timed one.
+"""
+from benchmarks import fakes
+
+fakes.configure()  # before utils.config is imported by anything below
+
+import time  # noqa: E402
+import math  # noqa: E402
+import random  # noqa: E402
+import asyncio  # noqa: E402
+import argparse  # noqa: E402
+import collections  # noqa: E402
+import datetime  # noqa: E402
+import tracemalloc  # noqa: E402
+from typing import Dict, List, Any, Callable, Coroutine  # noqa: E402
+
+from benchmarks.storage_backends import percentile  # noqa: E402
+from cogs import giveaways  # noqa: E402
+from cogs import callvote  # noqa: E402
+from cogs import modmail  # noqa: E402
+from utils import template  # noqa: E402
+from utils import sampling  # noqa: E402
+from utils.eligibility import Rules, DISCORD_EPOCH  # noqa: E402
+from utils import database as db  # noqa: E402
+
+GIVEAWAY_CHANNEL = 20
+MODMAIL_CHANNEL = 9
+HOLDER = template.Holder('<@468631903390400527>', 'holder', 'Hosted by: holder')
+
+
+def reset_database():
+    for collection in (db.collection, db.collection.archive, db.collection.archive.cold,
+                       db.collection.leases, db.collection.guilds, db.collection.dq, db.collection.winners,
+                       db.collection.scheduled, db.collection.polls, db.collection.waits):
+        collection.truncate()
+
+
+bots: List[fakes.FakeBot] = []  # set up by the running scenario, closed once it's done
+
+
+def setup(api: fakes.FakeAPI):
+    """A fresh bot, giveaway channel and cog on an empty database"""
+    reset_database()
+    bot = fakes.FakeBot(api)
+    bots.append(bot)
+    bot.leases.start()
+    guild = bot.add_guild(fakes.CONFIG['guild_id'])
+    return bot, guild.add_channel(GIVEAWAY_CHANNEL), giveaways.Giveaways(bot)
+
+
+def add_giveaway(
+        cog: giveaways.Giveaways,
+        channel: fakes.FakeChannel,
+        ending: float,
+        entrants: List[fakes.FakeUser]
+) -> Dict[str, Any]:
+    """Posts a running giveaway with entrants already reacted and stores it like the start command"""
+    message = channel.add_message(embeds=[
+        template.running_giveaway(unix=int(ending), winners=1, holder=HOLDER, prize='Benchmark')
+    ])
+    message.reactions.append(fakes.FakeReaction(message, '🎉', [cog.bot.user, *entrants]))
+    document = {
+        '_id': str(message.id),
+        'ending': ending,
+        'winners': 1,
+        'holder': {'mention': HOLDER.mention, 'tag': HOLDER.tag, 'string': HOLDER.string},
+        'path': f'{channel.guild.id}/{channel.id}/{message.id}'
+    }
+    work = db.collection.unit_of_work()
+    work.insert(db.collection, document)
+    work.insert(db.collection.archive, document)
+    work.commit()
+    cog.archived_ids.add(0, document['_id'])
+    cog.running_ids.add(0, document['_id'])
+    return document
+
+
+async def ending(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, cog = setup(api)
+    users = [fakes.FakeUser(api, 10 ** 17 + i) for i in range(args.entrants_per_giveaway)]
+    first = time.time() + 1  # leaves time to schedule every end before the first one is due
+    for i in range(args.giveaways):
+        add_giveaway(cog, channel, first + args.window * i / args.giveaways, users)
+
+    samples = []
+    done = asyncio.Event()
+    end_giveaway = cog.end_giveaway
+
+    async def timed_end(document):
+        await end_giveaway(document)
+        samples.append((time.time() - document['ending']) * 1000)
+        if len(samples) == args.giveaways:
+            done.set()
+
+    cog.end_giveaway = timed_end
+    start = time.perf_counter()
+    await cog.check_giveaway_end()
+    await asyncio.wait_for(done.wait(), timeout=args.window * 5 + 60)
+    results = len([message for message in channel.sent if message.content])
+    return {
+        'operations': len(samples),
+        'seconds': time.perf_counter() - start,
+        'samples': samples,
+        'check': f'{results}/{args.giveaways} results sent, {len(db.collection.documents)} left running'
+    }
+
+
+async def draw(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, cog = setup(api)
+    users = [fakes.FakeUser(api, 10 ** 17 + i) for i in range(args.entrants)]
+    message = channel.add_message()
+    message.reactions.append(fakes.FakeReaction(message, '🎉', [bot.user, *users]))
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(args.draws):
+        draw_start = time.perf_counter()
+        winners = await giveaways.draw_winner(message.reactions, bot.user, winner_amount=1)
+        samples.append((time.perf_counter() - draw_start) * 1000)
+        assert winners and winners[0] != bot.user
+    return {
+        'operations': args.draws,
+        'seconds': time.perf_counter() - start,
+        'samples': samples,
+        'check': f'{args.entrants} entrants per draw'
+    }
+
+
+async def weighted(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, cog = setup(api)
+    role_weights = {100: 2.0, 101: 3.0}
+    entrants = []
+    for i in range(args.entrants):
+        roll = random.random()
+        role_ids = (100,) if roll < 0.10 else (101,) if roll < 0.15 else ()
+        entrants.append(fakes.FakeMember(api, 10 ** 17 + i, channel.guild, role_ids=role_ids))
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(args.draws):
+        draw_start = time.perf_counter()
+        winners = await giveaways.choose_winners(entrants, 10, role_weights)
+        samples.append((time.perf_counter() - draw_start) * 1000)
+        assert len(set(winners)) == 10
+    return {
+        'operations': args.draws,
+        'seconds': time.perf_counter() - start,
+        'samples': samples,
+        'check': f'{args.entrants} entrants per draw, numpy {"on" if sampling.numpy is not None else "off"}'
+    }
+
+
+async def rules(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, cog = setup(api)
+    now = time.time()
+    eligibility_rules = Rules({
+        'required_roles': [100], 'forbidden_roles': [101],
+        'min_account_age': 30 * 86400, 'min_tenure': 7 * 86400, 'win_cooldown': 7 * 86400
+    })
+    entrants = []
+    for i in range(args.rules_entrants):
+        # ids spread over the last 2 years so some accounts are too young
+        created = now - random.random() * 2 * 365 * 86400
+        id_ = int((created - DISCORD_EPOCH) * 1000) << 22 | i
+        role_ids = [role for role, chance in ((100, 0.9), (101, 0.05)) if random.random() < chance]
+        joined = datetime.datetime.fromtimestamp(now - random.random() * 60 * 86400, datetime.timezone.utc)
+        entrants.append(fakes.FakeMember(api, id_, channel.guild, role_ids=role_ids, joined_at=joined))
+    recent_winners = frozenset(entrant.id for entrant in random.sample(entrants, len(entrants) // 100))
+
+    samples = []
+    eligible = []
+    start = time.perf_counter()
+    for _ in range(args.draws):
+        filter_start = time.perf_counter()
+        eligible = eligibility_rules.filter(entrants, recent_winners)
+        samples.append((time.perf_counter() - filter_start) * 1000)
+    return {
+        'operations': args.draws,
+        'seconds': time.perf_counter() - start,
+        'samples': samples,
+        'check': f'{len(eligible)}/{len(entrants)} entrants eligible'
+    }
+
+
+async def storm(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, cog = setup(api)
+    ending_ = time.time() + 86400
+    documents = [add_giveaway(cog, channel, ending_, []) for _ in range(args.storm_giveaways)]
+    dq_role = fakes.CONFIG['disqualified_role_id']
+    total = int(args.rate * args.seconds)
+    events = []
+    for i in range(total):
+        member = fakes.FakeMember(
+            api, 10 ** 17 + i, channel.guild, role_ids=(dq_role,) if random.random() < args.dq_fraction else ()
+        )
+        message = channel.messages[int(documents[i % len(documents)]['_id'])]
+        events.append(fakes.reaction_event(message, member))
+
+    samples = []
+
+    async def handle(event, due):
+        await cog.on_raw_reaction_add(event)
+        samples.append((time.time() - due) * 1000)
+
+    tasks = []
+    first = time.time()
+    start = time.perf_counter()
+    dispatched = 0
+    while dispatched < total:
+        now = time.time()
+        # every event due by now is dispatched, like a burst of gateway events read from one socket frame
+        while dispatched < total and first + dispatched / args.rate <= now:
+            tasks.append(asyncio.create_task(handle(events[dispatched], first + dispatched / args.rate)))
+            dispatched += 1
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - start
+    await db.collection.buffered.flush()
+    counted = sum(document.get('entrant_count', 0) for document in db.collection.stream())
+    return {
+        'operations': total,
+        'seconds': seconds,
+        'samples': samples,
+        'check': f'{counted}/{total} entrants counted, {api.requests["remove_reaction"]} disqualified, '
+                 f'{api.requests["edit"]} entrant count edits'
+    }
+
+
+async def scheduled(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, cog = setup(api)
+    channels = [channel, *(channel.guild.add_channel(GIVEAWAY_CHANNEL + i) for i in range(1, args.scheduled_channels))]
+    first = time.time() + 1  # leaves time to schedule every post before the first one is due
+    interrupted = 0
+    for i in range(args.scheduled):
+        target = channels[i % len(channels)]
+        giveaway = giveaways.Giveaway(duration=86400, winners=1, description='', holder=HOLDER, prize=f'Post {i}')
+        document = giveaways.template_document(
+            giveaway, f'scheduled-{i}', f'{target.guild.id}/{target.id}', first + args.window * i / args.scheduled, None
+        )
+        if random.random() < args.interrupted:  # posted by a process that stopped before storing the giveaway
+            document['attempt'] = time.time()
+            await target.send(embed=template.running_giveaway(
+                unix=int(time.time() + giveaway.duration), winners=1, holder=HOLDER, prize=giveaway.prize,
+                reference=giveaways.post_reference(document)
+            ))
+            interrupted += 1
+        db.collection.scheduled.insert(document)
+
+    start = time.perf_counter()
+    await cog.check_giveaway_end()
+    deadline = time.time() + args.window * 5 + 60
+    while db.collection.scheduled.documents and time.time() < deadline:
+        await asyncio.sleep(0.05)
+    seconds = time.perf_counter() - start
+    titles = collections.Counter(
+        message.embeds[0].title for target in channels for message in target.sent if message.embeds
+    )
+    return {
+        'operations': args.scheduled,
+        'seconds': seconds,
+        'samples': [latency * 1000 for latency in cog.activation_latency],
+        'check': f'{len(titles)}/{args.scheduled} posted, {interrupted} recovered, '
+                 f'{sum(count > 1 for count in titles.values())} posted twice, '
+                 f'{len(db.collection.documents)} running, {len(db.collection.scheduled.documents)} left'
+    }
+
+
+async def poll(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, _ = setup(api)
+    cog = callvote.CallVote(bot)
+    options = ['Forma', 'Riven', 'Weapon slots', 'Platinum']
+    author = fakes.FakeMember(api, 10 ** 16, channel.guild)
+    await cog.callvote.callback(cog, fakes.FakeContext(
+        bot, channel, author, f'g!callvote Next giveaway ; Which prize? ; 1d ; {" ; ".join(options)}'
+    ))
+    message = channel.sent[-1]
+    clicks = []
+    for i in range(args.voters):
+        voter = fakes.FakeUser(api, 10 ** 17 + i)
+        clicks.append((voter, random.randrange(len(options))))
+        if random.random() < 0.1:
+            clicks.append((voter, random.randrange(len(options))))
+    random.shuffle(clicks)
+    rate = len(clicks) / args.seconds
+
+    samples = []
+
+    async def click(voter, option, due):
+        await cog.vote(fakes.FakeInteraction(message, voter), option)
+        samples.append((time.time() - due) * 1000)
+
+    tasks = []
+    first = time.time()
+    start = time.perf_counter()
+    dispatched = 0
+    while dispatched < len(clicks):
+        now = time.time()
+        while dispatched < len(clicks) and first + dispatched / rate <= now:
+            tasks.append(asyncio.create_task(click(*clicks[dispatched], first + dispatched / rate)))
+            dispatched += 1
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - start
+    open_poll = cog.polls[str(message.id)]
+    deadline = time.time() + cog.refreshes.interval + 10
+    while (open_poll.checkpointed != open_poll.changes or db.collection.polls.buffered.pending) \
+            and time.time() < deadline:
+        await asyncio.sleep(0.05)
+    stored = db.collection.polls.get(str(message.id))['votes']
+    await cog.close_poll(str(message.id))
+    return {
+        'operations': len(clicks),
+        'seconds': seconds,
+        'samples': samples,
+        'check': f'{len(stored)}/{len(open_poll.votes)} votes stored, '
+                 f'{"matching" if stored == open_poll.snapshot() else "NOT matching"}, '
+                 f'{db.collection.polls.buffered.flushes} db writes, {api.requests["edit"]} embed edits, '
+                 f'{len(db.collection.polls.documents)} left open'
+    }
+
+
+async def tickets(api: fakes.FakeAPI, args) -> Dict[str, Any]:
+    bot, channel, _ = setup(api)
+    bot.resources['modmail_channel'] = channel.guild.add_channel(MODMAIL_CHANNEL)
+    cog = modmail.ModMail(bot)
+    view = modmail.StartModmail(cog)
+    button = channel.add_message()
+    clicks = []
+    for i in range(args.ticket_users):
+        user = fakes.FakeUser(api, 10 ** 17 + i)
+        clicks.append((user, i / args.ticket_users * args.seconds))
+        if random.random() < 0.3:
+            clicks.append((user, i / args.ticket_users * args.seconds + 0.005))  # while the first is opening
+    clicks.sort(key=lambda click: click[1])
+
+    interactions = []
+
+    async def click(user, delay):
+        await asyncio.sleep(delay)
+        interaction = fakes.FakeInteraction(button, user)
+        interactions.append(interaction)
+        await view.contact_staff.callback(interaction)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(click(*click_) for click_ in clicks))
+    seconds = time.perf_counter() - start
+    threads = bot.resources['modmail_channel'].threads
+    linked = sum(1 for interaction in interactions if interaction.followup.messages[-1].startswith('Your ticket'))
+    return {
+        'operations': len(clicks),
+        'seconds': seconds,
+        'samples': [latency * 1000 for latency in cog.open_latency],
+        'check': f'{len(threads)}/{args.ticket_users} tickets, {linked}/{len(clicks)} clicks answered with a link, '
+                 f'{sum(len(thread.sent) for thread in threads)} messages, {api.requests["edit"]} edits'
+    }
+
+
+SCENARIOS: Dict[str, Callable[[fakes.FakeAPI, Any], Coroutine]] = {
+    'ending': ending,
+    'draw': draw,
+    'weighted': weighted,
+    'rules': rules,
+    'storm': storm,
+    'scheduled': scheduled,
+    'poll': poll,
+    'tickets': tickets,
+}
+
+
+async def run(name: str, args) -> Dict[str, Any]:
+    """Runs a scenario for timings, then again under tracemalloc for its peak memory"""
+    def api():
+        random.seed(args.seed)
+        return fakes.FakeAPI(
+            latency=args.latency, jitter=args.jitter, rate_limit_chance=args.rate_limit,
+            retry_after=args.retry_after, seed=args.seed
+        )
+
+    async def scenario(api_):
+        try:
+            return await SCENARIOS[name](api_, args)
+        finally:
+            while bots:
+                await bots.pop().close()
+
+    timed_api = api()
+    result = await scenario(timed_api)
+    result['requests'] = sum(timed_api.requests.values())
+    result['rate_limited'] = timed_api.rate_limited
+    result['peak'] = None
+    if args.memory:
+        tracemalloc.start()
+        try:
+            await scenario(api())
+            result['peak'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def report(results: Dict[str, Dict[str, Any]]):
+    print(f'{"scenario":<10}{"ops":>8}{"ops/s":>10}{"p50 ms":>10}{"p99 ms":>10}'
+          f'{"peak MiB":>10}{"requests":>10}{"429s":>6}')
+    for name, result in results.items():
+        print(f'{name:<10}{result["operations"]:>8}{result["operations"] / result["seconds"]:>10.1f}'
+              f'{percentile(result["samples"], 50):>10.2f}{percentile(result["samples"], 99):>10.2f}'
+              f'{result["peak"] / 2 ** 20 if result["peak"] is not None else math.nan:>10.1f}'
+              f'{result["requests"]:>10}{result["rate_limited"]:>6}')
+    for name, result in results.items():
+        print(f'{name}: {result["check"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', help=f'any of {", ".join(SCENARIOS)}, all of them if omitted')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds per simulated API request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds added per request')
+    parser.add_argument('--rate-limit', type=float, default=0.01, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=0.05, help='seconds to wait after a 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the tracemalloc run')
+    parser.add_argument('--giveaways', type=int, default=10000, help='ending: giveaways ending in the window')
+    parser.add_argument('--window', type=float, default=10.0, help='ending: seconds standing in for one hour')
+    parser.add_argument('--entrants-per-giveaway', type=int, default=50, help='ending: entrants per giveaway')
+    parser.add_argument('--entrants', type=int, default=100000, help='draw: entrants of the giveaway')
+    parser.add_argument('--draws', type=int, default=3, help='draw: draws to time')
+    parser.add_argument('--rules-entrants', type=int, default=50000, help='rules: entrants to filter')
+    parser.add_argument('--rate', type=float, default=1000, help='storm: reactions per second')
+    parser.add_argument('--seconds', type=float, default=5, help='storm, poll, tickets: duration of the storm, vote or clicks')
+    parser.add_argument('--storm-giveaways', type=int, default=100, help='storm: running giveaways reacted to')
+    parser.add_argument('--dq-fraction', type=float, default=0.01, help='storm: fraction of disqualified members')
+    parser.add_argument('--scheduled', type=int, default=500, help='scheduled: posts due in the window')
+    parser.add_argument('--scheduled-channels', type=int, default=50, help='scheduled: channels posted in')
+    parser.add_argument('--interrupted', type=float, default=0.02, help='scheduled: fraction left half posted')
+    parser.add_argument('--voters', type=int, default=5000, help='poll: members voting')
+    parser.add_argument('--ticket-users', type=int, default=200, help='tickets: members opening a ticket')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    async def run_all():
+        results = {name: await run(name, args) for name in args.scenarios or SCENARIOS}
+        await db.collection.buffered.close()
+        return results
+
+    report(asyncio.run(run_all()))
+
+
+if __name__ == '__main__':
+    main()
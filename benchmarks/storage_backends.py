@@ -0,0 +1,118 @@
+"""Compares storage backend latency on the giveaway start, end and reaction paths
+
+Usage (from the repository root, config.json must exist):
+    python -m benchmarks.storage_backends [-n 1000] [--mongo mongodb://localhost:27017/]
+
+    start    - active + archive insert in one unit of work
+    end      - get, archive entrant snapshot, delete
+    reaction - one write-behind flush of 100 coalesced entrant count changes
+    lookup   - archive lookup of a giveaway that was compacted into cold storage
+"""
+import time
+import random
+import argparse
+import tempfile
+import os.path
+import statistics
+from typing import Dict, List, Callable
+
+from utils import sqlite
+from utils.storage import Backend
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+def measure(function: Callable[[int], None], iterations: int) -> List[float]:
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        function(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def run(collection: Backend, iterations: int) -> Dict[str, List[float]]:
+    collection.truncate()
+    collection.archive.truncate()
+    collection.archive.cold.truncate()
+    now = time.time()
+    ids = [str(1049431042206990498 + i) for i in range(iterations)]
+    entrants = [str(468631903390400527 + i) for i in range(200)]
+
+    def start(i):
+        document = {
+            '_id': ids[i],
+            'ending': now + random.randint(60, 604800),
+            'winners': 1,
+            'holder': {'mention': '<@468631903390400527>', 'tag': 'holder#0001', 'string': 'Hosted by: holder#0001'},
+            'path': f'1/2/{ids[i]}'
+        }
+        work = collection.unit_of_work()
+        work.insert(collection, document)
+        work.insert(collection.archive, document)
+        work.commit()
+
+    def reaction(i):
+        collection.bulk_update({
+            ids[(i + j) % iterations]: {'set': {}, 'inc': {'entrant_count': 1}, 'replace': None}
+            for j in range(100)
+        })
+
+    def end(i):
+        collection.get(ids[i])
+        collection.archive.append(ids[i], {'entrants': entrants, 'winner_ids': entrants[:1]})
+        collection.delete(ids[i])
+
+    def lookup(i):
+        collection.archive.find(ids[i])
+
+    results = {
+        'start': measure(start, iterations),
+        'reaction': measure(reaction, iterations),
+        'end': measure(end, iterations),
+    }
+    collection.archive.compact(before=float('inf'))
+    results['lookup'] = measure(lookup, iterations)
+    return results
+
+
+def report(name: str, results: Dict[str, List[float]]):
+    print(f'\n{name}')
+    print(f'{"path":<10}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for path, samples in results.items():
+        print(f'{path:<10}{statistics.mean(samples):>10.3f}{percentile(samples, 50):>10.3f}'
+              f'{percentile(samples, 99):>10.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=1000, help='iterations per path')
+    parser.add_argument('--mongo', help='connection string of a MongoDB server to compare against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report('sqlite', run(sqlite.Collection(os.path.join(directory, 'benchmark.db')), args.n))
+
+    if args.mongo:
+        import pymongo
+        from utils import mongodb
+
+        class Benchmark:
+            cluster = pymongo.MongoClient(args.mongo)
+            database = cluster['giveaways_benchmark']
+            collection = database['WFG']
+            archive = database['archived_giveaways']
+            cold = database['archived_giveaways_cold']
+            dq = database['DQs']
+
+        try:
+            report('mongodb', run(mongodb.Collection(Benchmark), args.n))
+        finally:
+            Benchmark.cluster.drop_database('giveaways_benchmark')
+
+
+if __name__ == '__main__':
+    main()
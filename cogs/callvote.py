@@ -1,24 +1,185 @@
+import time
+import asyncio
+import functools
+from typing import Dict, List
+
+import discord
 from discord.ext import commands
 
+from utils import template
+from utils import errors
+from utils import database as db
+from utils import parse_commands as parse
+from utils.debounce import Debouncer
+from utils.polls import Poll, MAX_OPTIONS, MAX_OPTION_LENGTH
+from utils.shards import guild_of
+from utils.config import config
+
 
 async def setup(bot):
-    await bot.wait_until_ready()
-    await bot.add_cog(CallVote(bot))
+    instance = CallVote(bot)
+    # routes clicks on every poll by custom_id, including polls posted before a restart
+    bot.add_view(PollView(instance, [str(i + 1) for i in range(MAX_OPTIONS)]))
+    await bot.add_cog(instance)
+
+
+class PollView(discord.ui.View):
+    """One button per option of a poll"""
+
+    def __init__(self, callvote: 'CallVote', options: List[str]):
+        super().__init__(timeout=None)
+        for index, option in enumerate(options):
+            button = discord.ui.Button(label=option, custom_id=f'poll:{index}')
+            button.callback = functools.partial(callvote.vote, option=index)
+            self.add_item(button)
 
 
 class CallVote(commands.Cog):
     def __init__(self, bot: commands.Bot = None):
         self.bot = bot
+        self.polls: Dict[str, Poll] = {}  # message id -> open poll
+        # stores and shows the votes of a poll, at most once per interval per poll
+        self.refreshes = Debouncer(
+            self.refresh_poll,
+            interval=config.get('poll_refresh_interval', 10),
+            bucket_rate=config.get('channel_edit_rate', 4)
+        )
 
-    @commands.command(name='callvote')
-    async def callvote(self, ctx: commands.Context, title, description, duration, *args):
-        """Starts a poll
+    @commands.command(name='callvote', aliases=['poll'])
+    async def callvote(self, ctx: commands.Context):
+        """Starts a poll, members vote with the buttons below it
+        Syntax: g!callvote title ; description ; duration ; option ; option ; [more options]
+
+        Example usage:
+            g!callvote Next giveaway ; Which prize should be next? ; 1d ; Forma ; Riven ; Weapon slots
 
         Parameters:
             title - Title of the poll
-            description - Description of the poll
-            duration - Duration of the poll
-            *args - vote options
+            description - Description of the poll, can be empty
+            duration - Duration of the poll, takes 5 units s, m, h, d, w (seconds, minutes, hours, days, weeks)
+            options - 2 to 25 vote options
         """
+        correct_usage = 'g!callvote Next giveaway ; Which prize should be next? ; 1d ; Forma ; Riven'
+        title, description, duration, *options = parse.get_args(
+            ctx.message.content, required=5, error_msg=f'Example usage: `{correct_usage}`'
+        )
+        options = [option for option in options if option]
+        if not title or len(title) > 256:
+            raise errors.InvalidArgument('Poll title must be between 1 and 256 characters long')
+        if not 2 <= len(options) <= MAX_OPTIONS:
+            raise errors.InvalidArgument(f'Polls need 2 to {MAX_OPTIONS} options, got {len(options)}')
+        if len(set(options)) != len(options):
+            raise errors.InvalidArgument('Poll options must be different from each other')
+        too_long = [option for option in options if len(option) > MAX_OPTION_LENGTH]
+        if too_long:
+            raise errors.InvalidArgument(f'Poll options must not be longer than {MAX_OPTION_LENGTH} characters\n'
+                                         f'```\n{too_long[0]}```Is {len(too_long[0])} characters')
+        seconds = template.to_seconds(duration)
+        if seconds <= 0:
+            raise errors.InvalidArgument(f'Poll duration must be positive, got `{duration}`')
+
+        ending = int(time.time() + seconds)
+        description = description.replace('\\n', '\n')
+        message = await ctx.send(
+            embed=template.poll_results(title, description, options, [0 for _ in options], ending),
+            view=PollView(self, options)
+        )
+        document = {
+            '_id': str(message.id),
+            'path': f'{ctx.guild.id}/{ctx.channel.id}/{message.id}',
+            'title': title,
+            'description': description,
+            'options': options,
+            'ending': ending,
+            'votes': {}
+        }
+        await asyncio.to_thread(db.collection.polls.insert, document)
+        self.__open__(document)
+
+    def __open__(self, document: dict):
+        """Starts taking votes on a stored poll and schedules its close"""
+        poll = Poll(document)
+        self.polls[poll.id] = poll
+        self.bot.scheduler.schedule(f'poll:{poll.id}', document['ending'], lambda: self.close_poll(poll.id))
+
+    async def vote(self, interaction: discord.Interaction, option: int):
+        """Counts a click on one of a poll's buttons, votes are stored on the next refresh"""
+        poll = self.polls.get(str(interaction.message.id))
+        if poll is None or option >= len(poll.counts):
+            return await interaction.response.send_message('This poll is closed', ephemeral=True)
+        choice = poll.vote(interaction.user.id, option)
+        self.refreshes.touch(poll.id, bucket=interaction.channel_id)
+        if choice is None:
+            return await interaction.response.send_message('Your vote was taken back', ephemeral=True)
+        await interaction.response.send_message(
+            f'You voted for **{poll.document["options"][choice]}**', ephemeral=True
+        )
+
+    async def refresh_poll(self, poll_id: str):
+        """Buffers the votes of a poll for the next batched write and shows them on its embed, if they changed
+
+        Every vote since the last refresh is written in one checkpoint, whatever the amount of voters.
+        """
+        poll = self.polls.get(poll_id)
+        if poll is None:  # closed
+            return
+        self.__checkpoint__(poll)
+        if poll.shown == poll.counts:
+            return
+        counts = list(poll.counts)
+        channel = await template.get_channel(self.bot, int(poll.document['path'].split('/')[1]))
+        await channel.get_partial_message(int(poll_id)).edit(embed=self.__render__(poll, counts))
+        poll.shown = counts
+
+    @staticmethod
+    def __checkpoint__(poll: Poll):
+        """Buffers the votes of a poll for the next batched write, if they changed since the last checkpoint"""
+        if poll.checkpointed != poll.changes:
+            db.collection.polls.buffered.set(poll.id, {'votes': poll.snapshot()})
+            poll.checkpointed = poll.changes
+
+    async def checkpoint_all(self):
+        """Buffers the votes of every open poll, before buffers are flushed on shutdown"""
+        for poll in self.polls.values():
+            self.__checkpoint__(poll)
+
+    async def close_poll(self, poll_id: str):
+        """Stops taking votes and shows the final results, called by the scheduler when the poll ends"""
+        async with self.bot.lifecycle.work('poll close'):
+            poll = self.polls.pop(poll_id, None)
+            if poll is None:
+                return
+            await self.refreshes.discard(poll_id)
+            channel = await template.get_channel(self.bot, int(poll.document['path'].split('/')[1]))
+            await channel.get_partial_message(int(poll_id)).edit(
+                embed=self.__render__(poll, poll.counts, closed=True), view=None
+            )
+            # a checkpoint still buffered for it updates nothing once the document is gone
+            await asyncio.to_thread(db.collection.polls.delete, poll_id)
+
+    @staticmethod
+    def __render__(poll: Poll, counts: List[int], closed: bool = False) -> discord.Embed:
+        document = poll.document
+        return template.poll_results(
+            document['title'], document['description'], document['options'], counts, document['ending'], closed
+        )
+
+    async def cog_check(self, ctx):
+        if isinstance(ctx.channel, discord.DMChannel):
+            return False
+        return template.is_staff(ctx)
 
+    async def cog_load(self):
+        # Only polls in guilds of shards connected to this process, their votes are received here
+        for document in db.collection.polls.stream():
+            if self.bot.owns_guild(guild_of(document)):
+                self.__open__(document)
+        self.bot.lifecycle.before_flush.append(self.checkpoint_all)
 
+    async def cog_unload(self):
+        self.bot.lifecycle.before_flush.remove(self.checkpoint_all)
+        await self.refreshes.close()
+        for poll in self.polls.values():
+            self.bot.scheduler.cancel(f'poll:{poll.id}')
+        await self.checkpoint_all()
+        await db.collection.polls.buffered.flush()
@@ -1,35 +1,46 @@
 import time
-import json
 
 import discord
 from discord.ext import tasks, commands
-from pymongo.errors import DuplicateKeyError
 
 from utils import template, errors
-from utils import mongodb as db
+from utils.storage import DuplicateKeyError
+from utils import database as db
 from utils import parse_commands as parse
 
-with open('config.json', encoding='utf-8') as file:
-    config = json.load(file)
 
 async def setup(bot):
-    await bot.wait_until_ready()
     await bot.add_cog(Disqualify(bot))
 
 class Disqualify(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.guild = bot.get_guild(config['guild_id'])
-        self.dq_role = self.guild.get_role(config['disqualified_role_id'])
-        self.check_dq_end.start()
-        # declaring to keep linter happy
-        self.mod_log_channel = None
-        self.log_channel = None
+        # resolved by the startup orchestrator before this cog is loaded, used for the guild in config.json
+        self.guild = bot.resources['guild']
+        self.mod_log_channel = bot.resources['mod_log_channel']
+        self.log_channel = bot.resources['log_channel']
+
+    def dq_id(self, guild_id: int, member_id: int) -> str:
+        """_id of a DQ document, member id alone for the guild in config.json (as before multi-guild support)"""
+        if guild_id == self.guild.id:
+            return str(member_id)
+        return f'{guild_id}:{member_id}'
+
+    def dq_role_of(self, guild: discord.Guild) -> discord.Role:
+        role_id = template.guild_settings(self.bot, guild.id).disqualified_role_id
+        if role_id is None:
+            raise errors.InvalidArgument('No disqualified role is set for this server, see `g!settings`')
+        return guild.get_role(role_id)
+
+    async def mod_log_channel_of(self, guild: discord.Guild) -> discord.TextChannel:
+        channel_id = template.guild_settings(self.bot, guild.id).mod_log_channel_id
+        if channel_id is None or guild.id == self.guild.id:
+            return self.mod_log_channel
+        return await template.get_channel(self.bot, channel_id)
 
     async def cog_load(self):
-        self.mod_log_channel = await template.get_channel(self.bot, config['mod_log_channel_id'])
-        self.log_channel = await template.get_channel(self.bot, config['log_channel_id'])
+        self.check_dq_end.start()
 
     @commands.command(name='disqualify', aliases=['dq'])
     async def disqualify(self, ctx):
@@ -50,33 +61,35 @@ class Disqualify(commands.Cog):
 
         seconds = template.to_seconds(duration)
         member = await template.get_user(ctx=ctx, user_id=user_str, user_str=user_str, member_only=True)
-        await member.add_roles(self.dq_role)
         ending = int(time.time() + seconds)
         document = {
-            '_id': str(member.id),
-            'ending': ending
+            '_id': self.dq_id(ctx.guild.id, member.id),
+            'ending': ending,
+            'guild_id': ctx.guild.id
         }
-        try:
-            db.collection.dq.insert(document)
-        except DuplicateKeyError:
-            db.collection.dq.update(str(member.id), document)
-            await ctx.reply(embed=template.warning(f'Disqualification duration overwritten'))
+        async with self.bot.lifecycle.work('dq'):  # the role is never added without the DQ being stored
+            await member.add_roles(self.dq_role_of(ctx.guild))
+            try:
+                db.collection.dq.insert(document)
+            except DuplicateKeyError:
+                db.collection.dq.update(document['_id'], document)
+                await ctx.reply(embed=template.warning(f'Disqualification duration overwritten'))
         message = f'{member.mention} has been disqualified until <t:{ending}> ' \
                   f'by **{ctx.author}**.'
         if reason:
             message += f'\n**Reason:\n{reason}**'
         if not suppress_log:
-            await self.mod_log_channel.send(message)
+            await (await self.mod_log_channel_of(ctx.guild)).send(message)
 
     async def un_dq(self, member: discord.Member):
         try:
-            await member.remove_roles(self.dq_role)
+            await member.remove_roles(self.dq_role_of(member.guild))
             await self.log_channel.send(f'User {member.mention} disqualification removed')
         except discord.HTTPException:
             await self.log_channel.send(embed=template.error(
                 f'HTTPException when removing disqualification role from {member.mention}'
             ))
-        db.collection.dq.delete(member.id)
+        db.collection.dq.delete(self.dq_id(member.guild.id, member.id))
 
     async def cog_check(self, ctx) -> bool:
         allowed = template.is_staff(ctx)
@@ -86,11 +99,25 @@ class Disqualify(commands.Cog):
 
     @tasks.loop(seconds=5)
     async def check_dq_end(self):
-        documents = db.collection.dq.find(None, True)  # Returns all result in collection as list
-        for document in documents:
-            if document['ending'] < time.time():
-                try:
-                    member = await template.get_user(guild=self.guild, user_id=document['_id'])
-                except errors.CustomWarning:
-                    continue
-                await self.un_dq(member)
+        for document in db.collection.dq.range_by_ending(before=time.time()):
+            if not self.bot.lifecycle.accepting:
+                return  # shutting down, the rest are removed after the restart
+            guild_id = document.get('guild_id', self.guild.id)
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or not self.bot.owns_guild(guild_id):
+                continue  # handled by the process connected to the guild's shard
+            # Only one process removes each DQ
+            lease = f'dq:{document["_id"]}'
+            if not await self.bot.leases.acquire(lease):
+                continue
+            try:
+                async with self.bot.lifecycle.work('dq'):
+                    member_id = int(str(document['_id']).split(':')[-1])
+                    member = await template.get_user(guild=guild, user_id=member_id)
+                    await self.un_dq(member)
+            except errors.CustomWarning:
+                continue
+            except errors.ShuttingDown:
+                return
+            finally:
+                self.bot.leases.forget(lease)
@@ -39,5 +39,4 @@ class Error(commands.Cog):
 
 
 async def setup(bot):
-    await bot.wait_until_ready()
     await bot.add_cog(Error(bot))
@@ -1,27 +1,33 @@
 import asyncio
+import collections
+import datetime
 import json
 import random
 import re
 import time
 import traceback
-from typing import List, Iterable, Union
+from typing import List, Iterable, Union, Dict, Container, Optional
 
 import discord
 from discord import User, Member, Reaction
 from discord.ext import tasks, commands
 
 from utils import template
-from utils import mongodb as db
+from utils import database as db
 from utils import parse_commands as parse
 from utils.bot_extension import BotExtension
+from utils.shards import ShardIndex, guild_of
 from utils import errors
-
-with open('config.json', encoding='utf-8') as file:
-    config = json.load(file)
+from utils import sampling
+from utils.guild_config import weights_from_document
+from utils.eligibility import Rules
+from utils.debounce import Debouncer
+from utils.pacing import RateLimiter
+from utils import recurrence
+from utils.config import config
 
 
 async def setup(bot: BotExtension):
-    await bot.wait_until_ready()
     await bot.add_cog(Giveaways(bot))
 
 
@@ -55,17 +61,225 @@ class Giveaway(object):
 
 class Giveaways(commands.Cog):
     check_end_interval = 15
+    bulk_start_limit = 50
+    mention_wait = 604800  # seconds the holder is mentioned in a ticket if its winner replies
 
     def __init__(self, bot: BotExtension):
         self.bot = bot
-        self.pending_end = {}
-        self.stop_ending_process = {}
-        self.thread_channel = None
+        self.ending = set()  # ids of giveaways being ended by this process
+        # message ids of giveaways in the hot archive by shard, checked on every reaction instead of querying the db
+        self.archived_ids = ShardIndex()
+        # message ids of running giveaways by shard, the only ones whose entrants are counted
+        self.running_ids = ShardIndex()
+        # re-renders the entrant count of running giveaways, at most once per interval per message
+        self.entrant_counts = Debouncer(
+            self.refresh_entrant_count,
+            interval=config.get('entrant_count_interval', 10),
+            bucket_rate=config.get('channel_edit_rate', 4),
+            concurrency=config.get('entrant_count_concurrency', 2)
+        )
+        self.shown_counts = {}  # message id -> entrant count on the embed
+        self.channel_sends = RateLimiter(rate=config.get('channel_send_rate', 5), period=5)
+        self.activation_latency = collections.deque(maxlen=1000)  # seconds scheduled giveaways were posted late
+        # ticket thread id -> who to mention once its winner replies, one wait per giveaway won
+        self.mention_waits: Dict[int, List[dict]] = {}
 
     @commands.command(name='edit_giveaway')
     async def edit_giveaway(self, ctx):
-        """To be implemented"""
-        pass
+        """Edits a running giveaway, empty arguments are left unchanged
+        Syntax: !gedit_giveaway id ; [duration] ; [winners] ; [title] ; [description]
+
+        Example usage:
+            !gedit_giveaway 1049431042206990498 ; +1d
+            !gedit_giveaway 1049431042206990498 ; 2h ; 3w
+            !gedit_giveaway 1049431042206990498 ;;; Weapon Slots ; Restrictions: MR5+
+
+        Parameters:
+            id_ - message id of the giveaway
+            duration - time from now until the giveaway ends, prefix with + or - to move the current end instead
+            winners - amount of winners on the giveaway
+            title - the prize and title of the giveaway
+            description - description of the giveaway
+        """
+        correct_usage = '!edit_giveaway 1049431042206990498 ; +1d ; 2w ; Weapon Slots ; Restrictions: None'
+        message_id, duration, winners, title, description = parse.get_args(
+            ctx.message.content, return_length=5, required=1
+        )
+        if not any((duration, winners, title, description)):
+            raise errors.MissingArgument(f'Nothing to edit\nExample usage: `{correct_usage}`')
+        document = await db.collection.buffered.get(message_id)
+        if document is None:
+            raise errors.GiveawayNotFound(f'No active giveaway with ID `{message_id}` found')
+        if message_id in self.ending:
+            raise errors.InvalidArgument('This giveaway is ending right now')
+
+        changes = {}
+        if duration:
+            amount = duration.lstrip('+-')
+            seconds = int(amount) if amount.isdigit() else template.to_seconds(amount)
+            if duration[0] == '+':
+                ending = document['ending'] + seconds
+            elif duration[0] == '-':
+                ending = document['ending'] - seconds
+            else:
+                ending = time.time() + seconds
+            if ending <= time.time():
+                raise errors.InvalidArgument(f'The giveaway would end in the past, use `g!end {message_id}` instead')
+            changes['ending'] = int(ending)
+        if winners:
+            changes['winners'] = parse_winners(winners, correct_usage)
+        if title:
+            if len(title) > 256:
+                raise errors.InvalidArgument('Giveaway prize (title) length must not be longer than 256\n'
+                                             f'```\n{title}```Is {len(title)} characters')
+            changes['prize'] = title
+        if description:
+            changes['description'] = description.replace('\\n', '\n')
+
+        channel = await template.get_channel(self.bot, int(document['path'].split('/')[1]))
+        message = channel.get_partial_message(int(message_id))
+        if 'prize' not in document and 'description' not in document:
+            # started before prize and description were stored, takes them from the embed
+            message = await channel.fetch_message(int(message_id))
+            if not message.embeds:
+                raise errors.GiveawayNotFound('Embed on giveaway was deleted')
+            changes.setdefault('prize', message.embeds[0].title)
+            changes.setdefault('description', message.embeds[0].description)
+        document.update(changes)
+
+        work = db.collection.unit_of_work()
+        work.append(db.collection, message_id, changes)
+        work.append(db.collection.archive, message_id, changes)
+        await asyncio.to_thread(work.commit)
+
+        # Re-render after any entrant count edit so the old embed doesn't overwrite the new one
+        await self.entrant_counts.discard(message_id)
+        count = document.get('entrant_count', 0)
+        await message.edit(embed=template.running_giveaway(
+            unix=int(document['ending']),
+            winners=document['winners'],
+            holder=template.Holder(**document['holder']),
+            description=document.get('description'),
+            prize=document.get('prize'),
+            entrants=count
+        ))
+        self.shown_counts[message_id] = count
+
+        if 'ending' in changes:
+            if document['ending'] <= time.time() + self.check_end_interval * 60:
+                self.schedule_end(document)
+            else:  # check_giveaway_end schedules it once it's close
+                self.bot.scheduler.cancel(f'giveaway:{message_id}')
+        await ctx.message.add_reaction('✅')
+
+    @commands.command(name='weights')
+    async def weights(self, ctx):
+        """Gives entrants with some roles extra entries in one giveaway
+
+        Example usage:
+            !gweights 1049431042206990498 @Booster=2 @Supporter=1.5
+            !gweights 1049431042206990498 uniform
+            !gweights 1049431042206990498 none
+
+        Parameters:
+            id_ - message id of the giveaway
+            role=weight - entries of entrants with the role, entrants with several weighted roles get the largest,
+                          `uniform` for one entry each, `none` to use the server's role_weights setting
+        """
+        args = parse.get_args(ctx.message.content, arg_delimiter=None, required=1).split()
+        message_id, values = args[0], args[1:]
+        if not values:
+            raise errors.MissingArgument('Missing argument: role=weight pairs, `uniform` or `none`')
+        if [value.lower() for value in values] == ['none']:
+            weights = None
+        elif [value.lower() for value in values] == ['uniform']:
+            weights = {}
+        else:
+            weights = {str(role_id): weight for role_id, weight in parse.get_weights(values).items()}
+
+        if await asyncio.to_thread(db.collection.archive.find, message_id) is None:
+            raise errors.GiveawayNotFound(f'Unable to find giveaway with id `{message_id}`')
+        work = db.collection.unit_of_work()
+        work.append(db.collection, message_id, {'role_weights': weights})
+        work.append(db.collection.archive, message_id, {'role_weights': weights})
+        await asyncio.to_thread(work.commit)
+        await ctx.message.add_reaction('✅')
+
+    @commands.command(name='rules')
+    async def rules(self, ctx):
+        """Shows or sets who may win a giveaway, checked when winners are drawn
+
+        Example usage:
+            !grules 1049431042206990498
+            !grules 1049431042206990498 require=@MR14,@MR15 forbid=@Muted account_age=30d tenure=7d cooldown=7d
+            !grules 1049431042206990498 none
+
+        Parameters:
+            id_ - message id of the giveaway
+            require - entrants need at least one of these roles
+            forbid - entrants with any of these roles can't win
+            account_age - minimum age of the entrant's account
+            tenure - minimum time since the entrant joined the server
+            cooldown - entrants who won a giveaway within this time can't win
+        """
+        args = parse.get_args(ctx.message.content, arg_delimiter=None, required=1).split()
+        message_id, values = args[0], args[1:]
+        document = await asyncio.to_thread(db.collection.archive.find, message_id)
+        if document is None:
+            raise errors.GiveawayNotFound(f'Unable to find giveaway with id `{message_id}`')
+        if not values:
+            return await ctx.send(embed=template.info(Rules(document.get('rules')).describe()))
+
+        rules = Rules() if [value.lower() for value in values] == ['none'] else Rules.from_args(values)
+        work = db.collection.unit_of_work()
+        work.append(db.collection, message_id, {'rules': rules.to_document()})
+        work.append(db.collection.archive, message_id, {'rules': rules.to_document()})
+        await asyncio.to_thread(work.commit)
+        await ctx.send(embed=template.info(rules.describe()))
+
+    async def recent_winners(self, rules: Rules) -> Container[int]:
+        """Ids of users who won a giveaway within the rules' win cooldown"""
+        if not rules.win_cooldown:
+            return frozenset()
+        await asyncio.to_thread(self.bot.winners.refresh)  # wins recorded by other processes
+        return await asyncio.to_thread(self.bot.winners.recent, rules.win_cooldown)
+
+    @commands.command(name='wins')
+    async def wins(self, ctx):
+        """Shows the latest wins of a user
+
+        Example usage:
+            !gwins @user
+            !gwins 468631903390400527 25
+
+        Parameters:
+            user - mention or id of the user
+            [amount] - amount of wins to show, 10 if omitted
+        """
+        args = parse.get_args(ctx.message.content, arg_delimiter=None, required=1).split()
+        user, amount = args[0], args[1] if len(args) > 1 else '10'
+        try:
+            user_id, amount = int(user.strip('<@!>')), int(amount)
+        except ValueError:
+            raise errors.InvalidArgument(f'Expected a user mention or id and an amount, got `{user} {amount}`')
+        history = await asyncio.to_thread(self.bot.winners.history, user_id)
+        if not history:
+            return await ctx.send(embed=template.info(f'<@{user_id}> has not won any giveaway'))
+        now = time.time()
+        lines = [
+            f'<t:{int(win["ending"])}:R> [giveaway](https://discord.com/channels/{win["path"]})'
+            for win in history[:amount]
+        ]
+        summary = f'<@{user_id}> won {len(history)} giveaways, ' \
+                  f'{sum(win["ending"] >= now - 7 * 86400 for win in history)} in the last 7 days, ' \
+                  f'{sum(win["ending"] >= now - 30 * 86400 for win in history)} in the last 30 days\n\n'
+        await ctx.send(embed=template.info(summary + '\n'.join(lines)))
+
+    def role_weights(self, document: dict) -> Dict[int, float]:
+        """Role weights of a giveaway, the guild's if the giveaway has none of its own"""
+        if document.get('role_weights') is not None:
+            return weights_from_document(document['role_weights'])
+        return template.guild_settings(self.bot, guild_of(document)).role_weights
 
     @commands.command(name='end')
     async def end(self, ctx):
@@ -79,11 +293,18 @@ class Giveaways(commands.Cog):
         """
 
         message_id = parse.get_args(ctx.message.content, return_length=1, required=1)[0]
-        document = db.collection.find(message_id)
+        document = await asyncio.to_thread(db.collection.find, message_id)
         if document is None:
             raise errors.GiveawayNotFound(f'No active giveaway with ID `{message_id}` found')
+        # Stored first, a process holding the lease ends it at the new time instead of this one
         document['ending'] = time.time()
-        await self.end_giveaway(document)
+        work = db.collection.unit_of_work()
+        work.append(db.collection, message_id, {'ending': document['ending']})
+        work.append(db.collection.archive, message_id, {'ending': document['ending']})
+        await asyncio.to_thread(work.commit)
+        self.bot.scheduler.cancel(f'giveaway:{message_id}')
+        if not await self.end_giveaway(document):
+            await ctx.send(embed=template.info('This giveaway is being ended by another process'))
 
     @commands.command(name='reroll')
     async def reroll(self, ctx):
@@ -109,7 +330,7 @@ class Giveaways(commands.Cog):
             raise errors.MissingArgument('Missing argument: message id')
 
         # Find db record of giveaway
-        document = db.collection.archive.find(message_id)
+        document = await asyncio.to_thread(db.collection.archive.find, message_id)
         if not document:
             raise errors.GiveawayNotFound(f'Unable to find giveaway with id `{message_id}`.\n')
 
@@ -121,15 +342,22 @@ class Giveaways(commands.Cog):
             raise errors.GiveawayNotFound('Giveaway not found!')
 
         # draw winner and send result
+        rules = Rules(document.get('rules'))
         winners = await draw_winner(
             reactions=message.reactions,
             bot_user=self.bot.user,
-            winner_amount=winner_amount
+            winner_amount=winner_amount,
+            role_weights=self.role_weights(document),
+            rules=rules,
+            recent_winners=await self.recent_winners(rules)
         )
         if not winners:
             return await ctx.channel.send(embed=template.no_winner(
                 f'https://discord.com/channels/{document["path"]}'
             ))
+        await asyncio.to_thread(
+            self.bot.winners.record, [winner.id for winner in winners], document['_id'], document['path']
+        )
 
         # Extract giveaway title and description
         giveaway_title = message.embeds[0].title
@@ -165,78 +393,223 @@ class Giveaways(commands.Cog):
             holder - Specify a holder for this giveaway, will display the command user as the host if omitted
         """
 
-        # Initialise
-        correct_usage = '!start 3d4h ; 1w ; Weapon Slots ; Restrictions: None ; 468631903390400527'
         args = parse.get_args(ctx.message.content, return_length=5)
-        giveaway = Giveaway()
+        giveaway = parse_giveaway(args)
 
-        # Validate number of args given
-        invalid, valid = [], []
-        for arg in args:
-            if not arg:
-                invalid.append(1)
-            else:
-                valid.append(arg)
-        if len(invalid) > 2:
-            raise errors.MissingArgument(
-                "Command requires at least 3 arguments `(duration, winners, title, [description], [holder])`\n"
-                f"Found {len(valid)} arguments: `{valid}`\n"
-                f"Example usage: `{correct_usage}`\n"
-                "Type `g!help start` for more info"
-            )
+        # Find holder
+        try:
+            giveaway.holder = await user_to_holder(ctx=ctx, user_str=args[4])
+        except errors.MemberNotFoundWarning as e:
+            giveaway.holder = e.holder
+            await ctx.reply(embed=e.embed, delete_after=120)
 
-        duration, winners, title, description, holder = args
+        async with self.bot.lifecycle.work('giveaway start'):
+            document = await self.__post_giveaway__(ctx.channel, giveaway, ctx.author)
+            # Persist both records in one commit before scheduling, so the end can't race the insert
+            work = db.collection.unit_of_work()
+            work.insert(db.collection, document)
+            work.insert(db.collection.archive, document)
+            await asyncio.to_thread(work.commit)
+            self.__track__(document)
 
-        # Define description
-        if description is None:
-            description = ''
-        giveaway.description = description.replace('\\n', '\n')
+        try:
+            await ctx.message.delete()
+        except discord.errors.Forbidden:
+            pass
 
-        # Compute and validate duration
-        if duration.isdigit():
-            duration = int(duration)
-        else:
-            duration = template.to_seconds(duration)
+    @commands.command(name='bulk_start')
+    async def bulk_start(self, ctx):
+        """Starts a giveaway for every line after the command, or every line of an attached text file
+        Lines starting with a recurrence or `at` are posted on that schedule (UTC) instead of now
 
-        giveaway.duration = int(duration + time.time())
+        Example usage:
+            !gbulk_start
+            3d ; 1w ; Weapon Slots
+            1d ; 2w ; Orokin Catalyst ; Restrictions: MR5+\\nPC only ; 468631903390400527
+            every monday 18:00 ; 3d ; 1w ; Weekly Forma
+            at <t:1792432800:f> ; 1d ; 1w ; Riven Mod
 
-        # Find and validate winner amount
-        if winners.isdigit():
-            giveaway.winners = int(winners)
-        else:
-            winners_match = re.findall('^(\d*)w', winners)
-            if not winners_match:
-                raise errors.InvalidArgument(f'Winner amount not found\nCorrect usage: {correct_usage}')
-            elif len(winners_match) > 1:
-                raise errors.InvalidArgument(
-                    f'Multiple winner amounts found: {winners_match}\nCorrect usage: {correct_usage}')
-            giveaway.winners = int(winners_match[0])
+        Parameters:
+            lines - arguments of the start command, `\\n` for line breaks in the description
+            recurrence - `every monday 18:00`, `every day 18:00` or `every 12h` in front of the arguments
+            at - `at` followed by a timestamp or a duration from now in front of the arguments, see start_at
+        """
+        lines = ctx.message.content.split('\n')[1:]
+        for attachment in ctx.message.attachments:
+            lines.extend((await attachment.read()).decode('utf-8', errors='replace').splitlines())
+        lines = [(number, line.strip()) for number, line in enumerate(lines, 1)
+                 if line.strip() and not line.strip().startswith('#')]
+        if not lines:
+            raise errors.MissingArgument('Put one giveaway per line after the command, or attach a text file')
+        if len(lines) > self.bulk_start_limit:
+            raise errors.InvalidArgument(f'At most {self.bulk_start_limit} giveaways can be started at once, '
+                                         f'got {len(lines)}')
+
+        # Validate every line before anything is posted
+        giveaways, scheduled, problems, warnings = [], [], [], []
+        holders = {}  # holder argument -> (Holder, warning if the holder was replaced), each looked up once
+        for number, line in lines:
+            # padded past the last field, so extra fields are seen instead of cut off
+            args = parse.split_args(line, return_length=6 + line.count(config['arg_delimiter']))
+            try:
+                if args[0].lower().startswith('every'):
+                    first, period = recurrence.parse(args[0])
+                    args = args[1:]
+                elif args[0].lower().startswith('at '):
+                    first, period = recurrence.parse_at(args[0][3:]), None
+                    args = args[1:]
+                else:
+                    first, period = None, None
+                if any(args[5:]):
+                    raise errors.InvalidArgument(
+                        f'Too many arguments, `{next(arg for arg in args[5:] if arg)}` comes after the holder'
+                    )
+                giveaway = parse_giveaway(args[:5])
+                if args[4] not in holders:
+                    try:
+                        holders[args[4]] = (await user_to_holder(ctx=ctx, user_str=args[4]), None)
+                    except errors.MemberNotFoundWarning as warning:
+                        holders[args[4]] = (warning.holder, warning.message)
+                giveaway.holder, warning = holders[args[4]]
+            except errors.CustomError as error:
+                problems.append(f'Line {number}: {error.message}')
+                continue
+            if warning is not None:
+                warnings.append(f'Line {number}: {warning}')
+            if first is None:
+                giveaways.append(giveaway)
+            else:
+                scheduled.append(template_document(
+                    giveaway, f'{ctx.message.id}-{number}', f'{ctx.guild.id}/{ctx.channel.id}', first, period
+                ))
+        if problems:
+            raise errors.InvalidArgument(('Nothing was started, fix these lines:\n' + '\n'.join(problems))[:4000])
+        if warnings:
+            await ctx.reply(embed=template.warning('\n'.join(warnings)[:4000]), delete_after=120)
+
+        # Post at the channel's rate, then persist everything in one commit, also if posting stopped midway
+        work = db.collection.unit_of_work()
+        for document in scheduled:
+            work.insert(db.collection.scheduled, document)
+        documents = []
+        async with self.bot.lifecycle.work('giveaway start'):
+            try:
+                for giveaway in giveaways:
+                    await self.channel_sends.wait(ctx.channel.id)
+                    if not self.bot.lifecycle.accepting:
+                        break  # shutting down, the rest isn't posted
+                    document = await self.__post_giveaway__(ctx.channel, giveaway, ctx.author)
+                    work.insert(db.collection, document)
+                    work.insert(db.collection.archive, document)
+                    documents.append(document)
+            finally:
+                await asyncio.to_thread(work.commit)
+                for document in documents:
+                    self.__track__(document)
+                for document in scheduled:
+                    if document['ending'] <= time.time() + self.check_end_interval * 60:
+                        self.schedule_post(document)
+
+        summary = f'Started {len(documents)} giveaways'
+        if len(documents) < len(giveaways):
+            summary += f', the other {len(giveaways) - len(documents)} were not started as the bot is restarting'
+        if scheduled:
+            summary += f', {len(scheduled)} scheduled giveaways are posted from ' \
+                       f'<t:{min(document["ending"] for document in scheduled)}:f>, see `g!scheduled`'
+        await ctx.send(embed=template.info(summary))
+
+    @commands.command(name='start_at')
+    async def start_at(self, ctx):
+        """Starts a giveaway later, the giveaway is stored and posted in this channel at that time
+        Syntax: !gstart_at when ; duration ; winners ; title ; [description] ; [holder]
 
-        # Find holder
+        Example usage:
+            !gstart_at <t:1792432800:f> ; 3d ; 1w ; Weapon Slots
+            !gstart_at 6h ; 1d ; 2 ; Orokin Catalyst ; Restrictions: MR5+
+
+        Parameters:
+            when - unix timestamp, discord timestamp or a duration from now
+            the rest - same as the start command
+        """
+        args = parse.get_args(ctx.message.content, return_length=6, required=1)
+        first = recurrence.parse_at(args[0])
+        giveaway = parse_giveaway(args[1:])
         try:
-            giveaway.holder = await user_to_holder(ctx=ctx, user_str=holder)
+            giveaway.holder = await user_to_holder(ctx=ctx, user_str=args[5])
         except errors.MemberNotFoundWarning as e:
             giveaway.holder = e.holder
             await ctx.reply(embed=e.embed, delete_after=120)
 
-        # Set prize & description
-        giveaway.prize = title
-        giveaway.description = description
-        # Validate
-        if giveaway.prize is not None:  # Can't len(None)
-            if len(giveaway.prize) > 256:
-                raise errors.InvalidArgument('Giveaway prize (title) length must not be longer than 256\n'
-                                         f'```\n{giveaway.prize}```Is {len(giveaway.prize)} characters')
+        document = template_document(
+            giveaway, str(ctx.message.id), f'{ctx.guild.id}/{ctx.channel.id}', first, None
+        )
+        await asyncio.to_thread(db.collection.scheduled.insert, document)
+        if first <= time.time() + self.check_end_interval * 60:
+            self.schedule_post(document)
+        await ctx.send(embed=template.info(
+            f'**{giveaway.prize}** is posted here <t:{first}:R>, id `{document["_id"]}`'
+        ))
+
+    @commands.command(name='scheduled', aliases=['recurring'])
+    async def scheduled(self, ctx):
+        """Lists or removes the scheduled and recurring giveaways of this server
+
+        Example usage:
+            !gscheduled
+            !gscheduled remove 1049431042206990498-3
+
+        Parameters:
+            [remove id] - stops posting the scheduled giveaway with this id
+        """
+        args = (parse.get_args(ctx.message.content, arg_delimiter=None) or '').split()
+        if args:
+            if len(args) != 2 or args[0].lower() != 'remove':
+                raise errors.InvalidArgument('Usage: `g!scheduled` or `g!scheduled remove id`')
+            document = await asyncio.to_thread(db.collection.scheduled.get, args[1])
+            if document is None or guild_of(document) != ctx.guild.id:
+                raise errors.GiveawayNotFound(f'No scheduled giveaway with id `{args[1]}` found')
+            await asyncio.to_thread(db.collection.scheduled.delete, args[1])
+            self.bot.scheduler.cancel(f'scheduled:{args[1]}')
+            return await ctx.message.add_reaction('✅')
+
+        documents = [
+            document for document in await asyncio.to_thread(list, db.collection.scheduled.stream())
+            if guild_of(document) == ctx.guild.id
+        ]
+        if not documents:
+            return await ctx.send(embed=template.info(
+                'No scheduled giveaways, add them with `g!start_at` or `g!bulk_start`'
+            ))
+        documents.sort(key=lambda document: document['ending'])
+        lines = [
+            f'`{document["_id"]}` **{document["prize"]}** {recurrence.describe(document.get("every"))} '
+            f'in <#{document["path"].split("/")[1]}>, next <t:{int(document["ending"])}:R>'
+            for document in documents
+        ]
+        await ctx.send(embed=template.info('\n'.join(lines)[:4000]))
+
+    async def __post_giveaway__(
+            self,
+            channel: discord.TextChannel,
+            giveaway: Giveaway,
+            author: Union[Member, User] = None,
+            reference: str = None
+    ) -> dict:
+        """Posts a giveaway ending giveaway.duration seconds from now, returns its document (not stored yet)
 
-        # Send giveaway
+        :param reference: shown in the embed footer, see post_reference
+        """
+        ending = int(time.time() + giveaway.duration)
         try:
-            giveaway.message = await ctx.channel.send(
+            giveaway.message = await channel.send(
                 embed=template.running_giveaway(
-                    unix=giveaway.duration,
+                    unix=ending,
                     winners=giveaway.winners,
                     holder=giveaway.holder,
                     description=giveaway.description,
                     prize=giveaway.prize,
+                    entrants=0,
+                    reference=reference
                 )
             )
             await giveaway.message.add_reaction('🎉')
@@ -245,67 +618,152 @@ class Giveaways(commands.Cog):
             if giveaway.message is not None:
                 delete_after = 60
                 embed = template.warning(
-                    f'I need `Add Reaction` permission at {ctx.channel.mention}.\n'
+                    f'I need `Add Reaction` permission at {channel.mention}.\n'
                     f'Please manually add reaction of 🎉 to [the message]({giveaway.message.jump_url})'
                     f'\n\nThis warning message will be deleted <t:{int(time.time() + delete_after)}:R>'
                 )
 
-                await ctx.channel.send(
-                    content=ctx.author.mention,
+                await channel.send(
+                    content=author.mention if author is not None else None,
                     embed=embed,
                     delete_after=delete_after
                 )
             else:
-                raise errors.MissingPermissions(f'I need `Send Messages` permission at {ctx.channel.mention}')
-
-        # Add to running giveaways if ending after self.check_end_interval minutes
-        server_id, channel_id, message_id = giveaway.message.jump_url.split('/')[-3:]
-        document = {
-            '_id': message_id,
-            'ending': giveaway.duration,
-            'winners': giveaway.winners,
-            'holder': {
-                'mention': giveaway.holder.mention,
-                'tag': giveaway.holder.tag,
-                'string': giveaway.holder.string
-            },
-            'path': f'{server_id}/{channel_id}/{message_id}'
-        }
-
-        if not giveaway.duration > self.check_end_interval * 60 + time.time():
-            asyncio.create_task(self.end_giveaway(document))
-        db.collection.insert(document)
-        db.collection.archive.insert(document)
+                raise errors.MissingPermissions(f'I need `Send Messages` permission at {channel.mention}')
 
-        try:
-            await ctx.message.delete()
-        except discord.errors.Forbidden:
-            pass
+        return running_document(giveaway, ending)
 
-    async def end_giveaway(self, document: dict):
-        """
+    def __track__(self, document: dict):
+        """Starts counting entrants of a stored giveaway, schedules its end if it's due before the next check"""
+        self.archived_ids.add(self.bot.shard_of(guild_of(document)), document['_id'])
+        self.running_ids.add(self.bot.shard_of(guild_of(document)), document['_id'])
+        if not document['ending'] > self.check_end_interval * 60 + time.time():
+            self.schedule_end(document)
+
+    def schedule_post(self, document: dict):
+        """Posts the scheduled giveaway at document['ending'], replacing the post scheduled before"""
+        self.bot.scheduler.schedule(
+            f'scheduled:{document["_id"]}', document['ending'], lambda: self.post_scheduled(document)
+        )
+
+    async def post_scheduled(self, document: dict):
+        """Posts a scheduled or recurring giveaway, called by the scheduler when it's due
 
-        :param document:
-        :return:
+        The attempt is stored before posting, and the posted giveaway is stored in the same commit that moves a
+        recurring giveaway to its next run (or removes a one-off). If the process stops in between, the next
+        attempt finds the message it posted instead of posting it again.
         """
-        override = False
-        # method might be called from different places, return if instance already exist
-        if document['_id'] in self.pending_end:
-            if document['ending'] != self.pending_end[document['_id']]:
-                self.stop_ending_process[document['_id']] = ''
-                override = True
-            # redundancy, method may also be called again if failed to end in previous call
-            elif self.pending_end[document['_id']] + 10 > time.time():
-                return
-        self.pending_end[document['_id']] = document['ending']
+        lease = f'scheduled:{document["_id"]}'
+        async with self.bot.lifecycle.work('scheduled post'):
+            if not await self.bot.leases.acquire(lease):
+                return  # another process is posting it
+            try:
+                current = await asyncio.to_thread(db.collection.scheduled.get, document['_id'])
+                if current is None:
+                    return  # removed or posted by another process
+                if current['ending'] > time.time():  # moved or already posted by another process
+                    return self.schedule_post(current)
+                channel = await template.get_channel(self.bot, int(current['path'].split('/')[1]))
+                giveaway = Giveaway(
+                    duration=current['duration'],
+                    winners=current['winners'],
+                    description=current['description'],
+                    holder=template.Holder(**current['holder']),
+                    prize=current['prize']
+                )
+                giveaway_document = None
+                if current.get('attempt') is not None:
+                    giveaway_document = await self.__find_posted__(channel, giveaway, current)
+                if giveaway_document is None:
+                    current['attempt'] = time.time()
+                    await asyncio.to_thread(
+                        db.collection.scheduled.append, current['_id'], {'attempt': current['attempt']}
+                    )
+                    await self.channel_sends.wait(channel.id)
+                    giveaway_document = await self.__post_giveaway__(
+                        channel, giveaway, reference=post_reference(current)
+                    )
+                    self.activation_latency.append(time.time() - current['ending'])
+
+                work = db.collection.unit_of_work()
+                work.insert(db.collection, giveaway_document)
+                work.insert(db.collection.archive, giveaway_document)
+                if current.get('every'):
+                    work.append(db.collection.scheduled, current['_id'], {
+                        'ending': recurrence.next_run(current['ending'], current['every']),
+                        'attempt': None
+                    })
+                else:
+                    work.delete(db.collection.scheduled, current['_id'])
+                await asyncio.to_thread(work.commit)
+                self.__track__(giveaway_document)
+            finally:
+                self.bot.leases.forget(lease)
+
+    async def __find_posted__(self, channel: discord.TextChannel, giveaway: Giveaway, scheduled: dict):
+        """Document of the giveaway the interrupted attempt of a scheduled giveaway posted, None if it wasn't posted
+
+        Posts are told apart by the reference in their footer, giveaways with the same prize and ending could
+        be posted in the same channel.
+        """
+        after = datetime.datetime.fromtimestamp(scheduled['attempt'] - 5, tz=datetime.timezone.utc)
+        reference = f' | {post_reference(scheduled)}'
+        async for message in channel.history(after=discord.Object(discord.utils.time_snowflake(after)), limit=50):
+            if message.author.id != self.bot.user.id or not message.embeds:
+                continue
+            embed = message.embeds[0]
+            ending = [field.value for field in embed.fields if field.name == 'Ending:']
+            if not (embed.footer.text or '').endswith(reference) or not ending:
+                continue
+            if not any(str(reaction.emoji) == '🎉' for reaction in message.reactions):
+                await message.add_reaction('🎉')
+            giveaway.message = message
+            return running_document(giveaway, int(re.search(r'<t:(\d+)', ending[0])[1]))
+        return None
+
+    def schedule_end(self, document: dict):
+        """Ends the giveaway at document['ending'], replacing the end scheduled before if there is one"""
+        self.bot.scheduler.schedule(
+            f'giveaway:{document["_id"]}', document['ending'], lambda: self.end_giveaway(document)
+        )
+
+    async def end_giveaway(self, document: dict) -> bool:
+        """Draws and announces the winners, called by the scheduler when the giveaway ends
 
-        wait_duration = document['ending'] - time.time()
-        if wait_duration > 0:
-            await asyncio.sleep(wait_duration)
+        Only runs in the process holding the giveaway's lease, so replicas never end a giveaway twice.
 
-        # return if ended in another instance
-        if document['_id'] in self.stop_ending_process and not override:
+        :param document: db document of the giveaway
+        :return: False if another process holds the lease, that process ends it instead
+        """
+        # Entrants are only members with roles once guilds are cached, ends overdue since downtime wait for it
+        await self.bot.wait_until_ready()
+        if document['_id'] in self.ending:
+            return True  # already being ended by this process
+        self.ending.add(document['_id'])
+        lease = f'giveaway:{document["_id"]}'
+        try:
+            async with self.bot.lifecycle.work('giveaway end'):
+                if not await self.bot.leases.acquire(lease):
+                    return False
+                try:
+                    await self.__end_giveaway__(document, lease)
+                finally:
+                    self.bot.leases.forget(lease)
+                return True
+        finally:
+            self.ending.discard(document['_id'])
+
+    async def __end_giveaway__(self, document: dict, lease: str):
+        # return if another process took the lease over or already ended it
+        if not await self.bot.leases.confirm(lease):
             return
+        current = await asyncio.to_thread(db.collection.get, document['_id'])
+        if current is None:
+            return
+        if current['ending'] > time.time():  # edited by another process since it was scheduled
+            return self.schedule_end(current)
+        document = current
+        self.running_ids.discard([document['_id']])
 
         server_id, channel_id, message_id = [int(_id) for _id in document['path'].split('/')]
         jump_url = f'https://discord.com/channels/{document["path"]}'
@@ -313,8 +771,8 @@ class Giveaways(commands.Cog):
         try:
             channel = await template.get_channel(self.bot, channel_id)
         except (discord.NotFound, discord.Forbidden, discord.HTTPException, discord.InvalidData) as error:
-            db.collection.delete(document['_id'])
-            return self.bot.owner.send(
+            await asyncio.to_thread(db.collection.delete, document['_id'])
+            return await self.bot.owner.send(
                 embed=template.error(
                     f'{type(error).__name__}\n```{document}```'
                     f'[Jump]({jump_url})'
@@ -327,7 +785,7 @@ class Giveaways(commands.Cog):
         # if message not found try sending error message to channel
         except discord.NotFound:
             try:
-                db.collection.delete(document['_id'])
+                await asyncio.to_thread(db.collection.delete, document['_id'])
                 return await channel.send(
                     embed=template.error(
                         'Hmm I can\'t seem to find a giveaway that\'s supposed to end at this time\n'
@@ -337,7 +795,7 @@ class Giveaways(commands.Cog):
                 )
             # if no perm to send error message, send to owner
             except discord.Forbidden:
-                db.collection.delete(document['_id'])
+                await asyncio.to_thread(db.collection.delete, document['_id'])
                 return await self.bot.owner.send(
                     f'Forbidden on sending following error\n'
                     f'Giveaway not found\n```{document}```'
@@ -346,13 +804,15 @@ class Giveaways(commands.Cog):
         except Exception as error:
             tb = traceback.format_exception(type(error), error, error.__traceback__)
             tb_str = ''.join(tb[:-1]) + f'\n{tb[-1]}'
-            db.collection.delete(document['_id'])
+            await asyncio.to_thread(db.collection.delete, document['_id'])
             return await self.bot.owner.send(
                 f'```json\n{json.dumps(document, indent=4, ensure_ascii=False)}```',
                 embed=template.error(f'Failed to end giveaway\n```{tb_str}```')
             )
 
-        # Edit giveaway message
+        # Edit giveaway message, after any entrant count edit so it isn't overwritten
+        await self.entrant_counts.discard(document['_id'])
+        self.shown_counts.pop(document['_id'], None)
         if len(message.embeds) > 0:
             embed = message.embeds[0]
             fields = embed.fields
@@ -363,13 +823,28 @@ class Giveaways(commands.Cog):
             embed.colour = None
             await message.edit(embed=embed)
         else:
-            db.collection.delete(document['_id'])
+            await asyncio.to_thread(db.collection.delete, document['_id'])
             return await channel.send(embed=template.no_winner(jump_url, '**Warning:**\nEmbed on giveaway was deleted'))
 
         # Determine winner
-        winners = await draw_winner(message.reactions, self.bot.user, document['winners'])
+        entrants = await fetch_entrants(message.reactions, self.bot.user)
+        rules = Rules(document.get('rules'))
+        role_weights = self.role_weights(document)
+        if rules or role_weights:
+            entrants = await resolve_members(message.guild, entrants)
+        winners = await choose_winners(
+            entrants, document['winners'], role_weights, rules, await self.recent_winners(rules)
+        )
+        await asyncio.to_thread(db.collection.archive.append, document['_id'], {
+            'entrants': [str(user.id) for user in entrants],
+            'winner_ids': [str(user.id) for user in winners]
+        })
+        if winners:
+            await asyncio.to_thread(
+                self.bot.winners.record, [winner.id for winner in winners], document['_id'], document['path']
+            )
         if not winners:
-            db.collection.delete(document['_id'])
+            await asyncio.to_thread(db.collection.delete, document['_id'])
             return await channel.send(embed=template.no_winner(jump_url))
 
         # Extract giveaway title and description
@@ -385,29 +860,36 @@ class Giveaways(commands.Cog):
             winners=winners,
             jump_url=jump_url
         )
-        db.collection.delete(document['_id'])
+        await asyncio.to_thread(db.collection.delete, document['_id'])
 
-    async def wait_and_mention(
-            self,
-            thread_id: int,
-            mentions: Iterable[str],
-            winner_id: int,
-            ref_message: discord.Message = None
-    ) -> None:
-        """Waits for winner to send first message and mentions item holder
-
-        :param thread_id: the thread to wait for a reply
-        :param mentions: strings of user mentions
-        :param winner_id: user id to wait for message
-        :param ref_message: the message to refer to
-        """
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Mentions the item holder in a winner's ticket once the winner replied"""
+        waits = self.mention_waits.get(message.channel.id)
+        if not waits:
+            return
+        fired = [wait for wait in waits if wait['winner_id'] == message.author.id]
+        if not fired:
+            return
+        self.__forget_waits__([wait['_id'] for wait in fired])
+        for wait in fired:
+            await message.channel.send(
+                ''.join(wait['mentions']), reference=message.channel.get_partial_message(wait['reference'])
+            )
+        await asyncio.to_thread(db.collection.waits.delete_many, [wait['_id'] for wait in fired])
 
-        def check(message):
-            if message.channel.id == thread_id:
-                return message.author.id == winner_id
+    def __add_wait__(self, wait: dict):
+        thread_id = int(wait['path'].split('/')[1])
+        waits = self.mention_waits.setdefault(thread_id, [])
+        waits[:] = [pending for pending in waits if pending['_id'] != wait['_id']]
+        waits.append(wait)
 
-        response = await self.bot.wait_for('message', check=check, timeout=604800)
-        await response.channel.send(''.join(mention for mention in mentions), reference=ref_message)
+    def __forget_waits__(self, ids: Iterable[str]):
+        ids = set(ids)
+        for thread_id, waits in list(self.mention_waits.items()):
+            waits[:] = [wait for wait in waits if wait['_id'] not in ids]
+            if not waits:
+                del self.mention_waits[thread_id]
 
     async def __create_ticket__(
             self,
@@ -415,7 +897,8 @@ class Giveaways(commands.Cog):
             giveaway_title: str,
             giveaway_description: str,
             jump_url: str,
-            holder: template.Holder):
+            holder: template.Holder,
+            thread_channel: discord.TextChannel):
         """Creates modmail ticket for a giveaway
 
         Parameters:
@@ -424,28 +907,43 @@ class Giveaways(commands.Cog):
             giveaway_description: description of the giveaway
             jump_url: url of the giveaway message
             holder: giveaway item holder
+            thread_channel: modmail channel of the giveaway's guild
         """
+        # The guide is the same for every winner, rendered once
+        guide = template.winner_guide(
+            prize=giveaway_title,
+            description=giveaway_description,
+            giveaway_link=jump_url,
+            holder_tag=holder.tag
+        )
+        threads = await template.ticket_threads(thread_channel)  # scanned once for every winner
+        giveaway_id = jump_url.rsplit('/', 1)[1]
+        waits = []
         for winner in winners:
             thread, message = await template.create_ticket(
-                thread_channel=self.thread_channel,
+                thread_channel=thread_channel,
                 thread_name=f'{winner.name} | {winner.id}',
                 user_id=winner.id,
                 messages=[{
                     'content': f'<@{winner.id}>',
-                    'embed': template.winner_guide(
-                        prize=giveaway_title,
-                        description=giveaway_description,
-                        giveaway_link=jump_url,
-                        holder_tag=holder.tag
-                    )
+                    'embed': guide
                 }],
+                threads=threads
             )
-            asyncio.create_task(self.wait_and_mention(
-                thread_id=thread.id,
-                mentions=(holder.mention,),
-                winner_id=winner.id,
-                ref_message=message
-            ))
+            if holder.mention:
+                waits.append({
+                    '_id': f'{thread.id}:{giveaway_id}',  # a reused ticket keeps the waits of earlier wins
+                    'path': f'{thread_channel.guild.id}/{thread.id}',
+                    'winner_id': winner.id,
+                    'mentions': [holder.mention],
+                    'reference': message.id,
+                    'ending': int(time.time() + self.mention_wait)
+                })
+        # stored rather than awaited in a task, so the holder is still mentioned after a restart
+        if waits:
+            await asyncio.to_thread(db.collection.waits.upsert_many, waits)
+        for wait in waits:
+            self.__add_wait__(wait)
 
     async def send_result(
             self,
@@ -468,20 +966,25 @@ class Giveaways(commands.Cog):
             jump_url: url of original giveaway message
             reroll: True if used for reroll
         """
-        create_ticket = True if channel.id in config['giveaway_channels'] else False
-
-        # Send winner notification
-        await channel.send(
-            **template.giveaway_result(
-                winners=[winner.mention for winner in winners],
-                giveaway_title=giveaway_title,
-                giveaway_description=giveaway_description,
-                holder=holder,
-                giveaway_link=jump_url,
-                mention_users=not create_ticket,
-                reroll=reroll
-            )
+        settings = template.guild_settings(self.bot, channel.guild.id)
+        in_giveaway_channel = channel.id in settings.giveaway_channels
+        thread_channel = await template.modmail_channel(self.bot, channel.guild.id) if in_giveaway_channel else None
+        create_ticket = thread_channel is not None
+
+        # Send winner notification, split into as many messages as the winner list needs
+        messages = template.giveaway_result(
+            winners=[winner.mention for winner in winners],
+            giveaway_title=giveaway_title,
+            giveaway_description=giveaway_description,
+            holder=holder,
+            giveaway_link=jump_url,
+            mention_users=not create_ticket,
+            reroll=reroll
         )
+        for message in messages:
+            if len(messages) > 1:
+                await self.channel_sends.wait(channel.id)
+            await channel.send(**message)
 
         # Create ticket for winner to contact holder
         if create_ticket:
@@ -490,27 +993,109 @@ class Giveaways(commands.Cog):
                 giveaway_title=giveaway_title,
                 giveaway_description=giveaway_description,
                 jump_url=jump_url,
-                holder=holder
+                holder=holder,
+                thread_channel=thread_channel
             )
+        elif in_giveaway_channel:
+            await channel.send(embed=template.warning(
+                'No tickets were opened for the winners as this server has no modmail channel, '
+                'please contact them directly.\nStaff can set one with `g!settings modmail_channel_id`'
+            ))
 
     @tasks.loop(minutes=check_end_interval)
     async def check_giveaway_end(self):
-        documents = db.collection.find(None, True)  # Returns all result in collection as list
-        for document in documents:
-            if document['ending'] < time.time() + self.check_end_interval * 60:
-                asyncio.create_task(self.end_giveaway(document))
+        before = time.time() + self.check_end_interval * 60
+        for document in await asyncio.to_thread(db.collection.range_by_ending, before=before):
+            if self.bot.owns_guild(guild_of(document)):  # other shards' processes end the rest
+                self.schedule_end(document)
+        for document in await asyncio.to_thread(db.collection.scheduled.range_by_ending, before=before):
+            if self.bot.owns_guild(guild_of(document)):
+                self.schedule_post(document)
+        expired = await asyncio.to_thread(db.collection.waits.range_by_ending, before=time.time())
+        if expired:
+            await asyncio.to_thread(db.collection.waits.delete_many, [document['_id'] for document in expired])
+            self.__forget_waits__(document['_id'] for document in expired)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, event):
-        if db.collection.archive.find(str(event.message_id)) is not None:
+        self.count_entrant(event, 1)
+        if self.archived_ids.contains(self.bot.shard_of(event.guild_id), str(event.message_id)):
             await self.check_disqualified(event)
 
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, event):
+        self.count_entrant(event, -1)
+
+    def count_entrant(self, event: discord.RawReactionActionEvent, amount: int):
+        """Buffers a change to the entrant count of a running giveaway, written to the db in batches"""
+        if not self.running_ids.contains(self.bot.shard_of(event.guild_id), str(event.message_id)):
+            return
+        if str(event.emoji) == '🎉' and event.user_id != self.bot.user.id:
+            db.collection.buffered.inc(str(event.message_id), {'entrant_count': amount})
+            self.entrant_counts.touch(str(event.message_id), bucket=event.channel_id)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # READY starts a new session, reactions while disconnected sent no events
+        await self.reconcile_entrants()
+
+    async def reconcile_entrants(self):
+        """Sets the entrant counts of running giveaways from their 🎉 reactions, where they drifted"""
+        documents = await asyncio.to_thread(lambda: list(db.collection.stream()))
+        for document in documents:
+            if not self.bot.owns_guild(guild_of(document)):
+                continue
+            try:
+                channel = await template.get_channel(self.bot, int(document['path'].split('/')[1]))
+                message = await channel.fetch_message(int(document['_id']))
+            except discord.HTTPException:  # reported when the giveaway ends
+                continue
+            reaction = discord.utils.get(message.reactions, emoji='🎉')
+            count = reaction.count - reaction.me if reaction is not None else 0
+            if count != document.get('entrant_count', 0):
+                db.collection.buffered.set(document['_id'], {'entrant_count': count})
+                self.entrant_counts.touch(document['_id'], bucket=channel.id)
+
+    async def refresh_entrant_count(self, message_id: str):
+        """Shows the current entrant count on a running giveaway's embed, if it changed since the last edit"""
+        document = await db.collection.buffered.get(message_id)
+        if document is None or document['ending'] <= time.time():  # ended or being ended
+            self.shown_counts.pop(message_id, None)
+            if document is None:  # ended by another process
+                self.running_ids.discard([message_id])
+            return
+        count = document.get('entrant_count', 0)
+        if self.shown_counts.get(message_id) == count:
+            return
+        channel = await template.get_channel(self.bot, int(document['path'].split('/')[1]))
+        if document.get('prize') is not None or document.get('description') is not None:
+            embed = template.running_giveaway(
+                unix=int(document['ending']),
+                winners=document['winners'],
+                holder=template.Holder(**document['holder']),
+                description=document.get('description'),
+                prize=document.get('prize'),
+                entrants=count
+            )
+            await channel.get_partial_message(int(message_id)).edit(embed=embed)
+        else:  # started before prize and description were stored, edits the embed on the message
+            message = await channel.fetch_message(int(message_id))
+            if not message.embeds:
+                return
+            await message.edit(embed=template.set_entrants(message.embeds[0], count))
+        self.shown_counts[message_id] = count
+
+    def forget_archived(self, message_ids: Iterable[str]):
+        """Stops checking reactions of giveaways that were moved out of the hot archive"""
+        self.archived_ids.discard(message_ids)
+
     async def check_disqualified(self, event: discord.RawReactionActionEvent) -> None:
         """checks if a user who entered giveaway has disqualified role, removes reaction if yes"""
         channel = await template.get_channel(self.bot, event.channel_id)
         partial_message = channel.get_partial_message(event.message_id)
         message_link = f'https://discord.com/channels/{event.guild_id}/{event.channel_id}/{event.message_id}'
-        if config['disqualified_role_id'] in [role.id for role in event.member.roles]:
+        dq_role_id = template.guild_settings(self.bot, event.guild_id).disqualified_role_id
+        if dq_role_id is not None and event.member.get_role(dq_role_id) is not None:
             await partial_message.remove_reaction('🎉', event.member)
             embed = discord.Embed(
                 title='Reaction removed',
@@ -534,27 +1119,209 @@ class Giveaways(commands.Cog):
         return allowed
 
     async def cog_load(self):
-        if config['modmail_channel_id']:
-            self.thread_channel = await template.get_channel(self.bot, config['modmail_channel_id'])
+        # Only index giveaways in guilds of shards connected to this process
+        for message_id, path in await asyncio.to_thread(lambda: list(db.collection.archive.ids('path'))):
+            guild_id = guild_of({'path': path})
+            if self.bot.owns_guild(guild_id):
+                self.archived_ids.add(self.bot.shard_of(guild_id), message_id)
+        for message_id, path in await asyncio.to_thread(lambda: list(db.collection.ids('path'))):
+            guild_id = guild_of({'path': path})
+            if self.bot.owns_guild(guild_id):
+                self.running_ids.add(self.bot.shard_of(guild_id), message_id)
+        for document in await asyncio.to_thread(lambda: list(db.collection.waits.stream())):
+            if self.bot.owns_guild(guild_of(document)):
+                self.__add_wait__(document)
         self.check_giveaway_end.start()
+        if self.bot.is_ready():  # reloaded, on_ready already happened
+            asyncio.create_task(self.reconcile_entrants())
+
+    async def cog_unload(self):
+        self.check_giveaway_end.cancel()
+        await self.entrant_counts.close()
 
 
-async def draw_winner(reactions: List[Reaction], bot_user, winner_amount: int = 1) -> List[Union[User, Member]]:
-    winners = []
+async def fetch_entrants(reactions: List[Reaction], bot_user) -> List[Union[User, Member]]:
+    """Returns every user that reacted with 🎉, excluding the bot"""
     for reaction in reactions:
         if reaction.emoji == '🎉':
-            reacted_users: List[Union[User, Member]]
-            reacted_users = [user async for user in reaction.users()]
-            while len(winners) < winner_amount:
-                if len(reacted_users) == 0:
-                    break
-                random_index = random.randint(0, len(reacted_users) - 1)
-                if reacted_users[random_index] == bot_user:
-                    reacted_users.pop(random_index)
-                    continue
-                winners.append(reacted_users[random_index])
-                reacted_users.pop(random_index)
-    return winners
+            return [user async for user in reaction.users() if user != bot_user]
+    return []
+
+
+def parse_giveaway(args: List[str]) -> Giveaway:
+    """Validates the arguments of the start command `duration ; winners ; title ; [description] ; [holder]`
+
+    The holder is left for the caller to look up, duration is in seconds from when the giveaway is posted.
+    """
+    correct_usage = '!start 3d4h ; 1w ; Weapon Slots ; Restrictions: None ; 468631903390400527'
+    giveaway = Giveaway()
+
+    # Validate number of args given
+    valid = [arg for arg in args if arg]
+    if len(args) - len(valid) > 2:
+        raise errors.MissingArgument(
+            "Command requires at least 3 arguments `(duration, winners, title, [description], [holder])`\n"
+            f"Found {len(valid)} arguments: `{valid}`\n"
+            f"Example usage: `{correct_usage}`\n"
+            "Type `g!help start` for more info"
+        )
+
+    duration, winners, title, description, holder = args
+
+    # Define description
+    if description is None:
+        description = ''
+    giveaway.description = description.replace('\\n', '\n')
+
+    # Compute and validate duration
+    if duration.isdigit():
+        giveaway.duration = int(duration)
+    else:
+        giveaway.duration = template.to_seconds(duration)
+
+    # Find and validate winner amount
+    giveaway.winners = parse_winners(winners, correct_usage)
+
+    # Set & validate prize
+    giveaway.prize = title
+    if giveaway.prize is not None:  # Can't len(None)
+        if len(giveaway.prize) > 256:
+            raise errors.InvalidArgument('Giveaway prize (title) length must not be longer than 256\n'
+                                         f'```\n{giveaway.prize}```Is {len(giveaway.prize)} characters')
+    return giveaway
+
+
+def post_reference(scheduled: dict) -> str:
+    """Identifies the post of a scheduled giveaway's attempt, unique per schedule and attempt"""
+    return f'{scheduled["_id"]}@{int(scheduled["attempt"])}'
+
+
+def running_document(giveaway: Giveaway, ending: int) -> dict:
+    """Document of a posted giveaway"""
+    server_id, channel_id, message_id = giveaway.message.jump_url.split('/')[-3:]
+    return {
+        '_id': message_id,
+        'ending': ending,
+        'winners': giveaway.winners,
+        'holder': holder_document(giveaway.holder),
+        'prize': giveaway.prize,
+        'description': giveaway.description,
+        'path': f'{server_id}/{channel_id}/{message_id}'
+    }
+
+
+def holder_document(holder: template.Holder) -> dict:
+    return {
+        'mention': holder.mention,
+        'tag': holder.tag,
+        'string': holder.string,
+        'type': holder.type.name
+    }
+
+
+def template_document(giveaway: Giveaway, _id: str, path: str, first: int, period: Optional[int]) -> dict:
+    """Document of a scheduled giveaway, posted once if period is None
+
+    `ending` is when it's posted next, so due posts are found on the ending index like due giveaway ends.
+    """
+    return {
+        '_id': _id,
+        'ending': first,
+        'every': period,
+        'duration': giveaway.duration,
+        'winners': giveaway.winners,
+        'holder': holder_document(giveaway.holder),
+        'prize': giveaway.prize,
+        'description': giveaway.description,
+        'path': path
+    }
+
+
+def parse_winners(winners: str, correct_usage: str) -> int:
+    """Parses a winner amount given as `5` or `5w`"""
+    if winners.isdigit():
+        return int(winners)
+    winners_match = re.findall('^(\\d*)w', winners)
+    if not winners_match:
+        raise errors.InvalidArgument(f'Winner amount not found\nCorrect usage: {correct_usage}')
+    elif len(winners_match) > 1:
+        raise errors.InvalidArgument(
+            f'Multiple winner amounts found: {winners_match}\nCorrect usage: {correct_usage}')
+    return int(winners_match[0])
+
+
+async def resolve_members(guild: Optional[discord.Guild], entrants: List[Union[User, Member]]
+                          ) -> List[Union[User, Member]]:
+    """Replaces entrants received as Users by the guild's members, chunking the guild first if it isn't cached
+
+    Weights and rules need the roles and join date of members, entrants left as Users are not in the guild.
+    """
+    if guild is None or not any(isinstance(entrant, User) for entrant in entrants):
+        return entrants
+    if not guild.chunked:
+        await guild.chunk()
+    return [(guild.get_member(entrant.id) or entrant) if isinstance(entrant, User) else entrant
+            for entrant in entrants]
+
+
+def pick_winners(entrants: List[Union[User, Member]], winner_amount: int = 1) -> List[Union[User, Member]]:
+    """Picks winner_amount distinct entrants uniformly at random"""
+    return random.sample(entrants, min(winner_amount, len(entrants)))
+
+
+def entry_weights(entrants: List[Union[User, Member]], role_weights: Dict[int, float]) -> List[float]:
+    """Entries of each entrant, the largest weight of the weighted roles they have, 1 if they have none"""
+    weights = []
+    for entrant in entrants:
+        get_role = getattr(entrant, 'get_role', None)  # Users that left the guild have no roles
+        held = [weight for role_id, weight in role_weights.items() if get_role is not None and get_role(role_id)]
+        weights.append(max(held) if held else 1.0)
+    return weights
+
+
+# Draws with more entrants than this run in a worker thread so reactions keep being handled meanwhile
+offload_draw_above = 5000
+
+
+async def choose_winners(
+        entrants: List[Union[User, Member]],
+        winner_amount: int = 1,
+        role_weights: Dict[int, float] = None,
+        rules: Rules = None,
+        recent_winners: Container[int] = frozenset()
+) -> List[Union[User, Member]]:
+    """Picks winner_amount distinct eligible entrants, with chances proportional to their entry weights
+
+    :param rules: eligibility rules of the giveaway, everyone is eligible if None
+    :param recent_winners: ids of users who won within the rules' win_cooldown
+    """
+    if not role_weights and not rules:
+        return pick_winners(entrants, winner_amount)
+
+    def pick():
+        eligible = rules.filter(entrants, recent_winners) if rules else entrants
+        if not role_weights:
+            return pick_winners(eligible, winner_amount)
+        indices = sampling.weighted_sample(entry_weights(eligible, role_weights), winner_amount)
+        return [eligible[index] for index in indices]
+
+    if len(entrants) > offload_draw_above:
+        return await asyncio.to_thread(pick)
+    return pick()
+
+
+async def draw_winner(
+        reactions: List[Reaction],
+        bot_user,
+        winner_amount: int = 1,
+        role_weights: Dict[int, float] = None,
+        rules: Rules = None,
+        recent_winners: Container[int] = frozenset()
+) -> List[Union[User, Member]]:
+    entrants = await fetch_entrants(reactions, bot_user)
+    if (rules or role_weights) and reactions:
+        entrants = await resolve_members(reactions[0].message.guild, entrants)
+    return await choose_winners(entrants, winner_amount, role_weights, rules, recent_winners)
 
 
 async def user_to_holder(ctx: commands.Context, user_str: str) -> template.Holder:
@@ -572,14 +1339,14 @@ async def user_to_holder(ctx: commands.Context, user_str: str) -> template.Holde
     id_ = int(match_) if match_ else None
     try:
         member = await template.get_user(ctx=ctx, user_id=id_, user_str=user_str)
-        holder.populate(member, f'Contact {str(member)} to claim your prize')
+        holder.populate(member, template.HolderType.ITEM_HOLDER)
         return holder
     except errors.MemberNotFoundWarning as e:
         # Set holder to author if member not found
-        holder.populate(ctx.author, f'Hosted by: {str(ctx.author)}')
+        holder.populate(ctx.author, template.HolderType.HOST)
         raise errors.MemberNotFoundWarning(f'{e.message}\nItem holder has been set to command author.', holder=holder)
     except errors.MissingArgument:  # Holder not given in command
-        holder.populate(ctx.author, f'Hosted by: {str(ctx.author)}')
+        holder.populate(ctx.author, template.HolderType.HOST)
         return holder
 
 if __name__ == '__main__':
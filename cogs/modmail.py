@@ -1,24 +1,25 @@
-import json
+import time
 import asyncio
+import collections
+from typing import Dict
 
 import discord
 from discord.ext import commands
 
 from utils import template
+from utils import timing
+from utils import errors
+from utils.config import config
 
 
 async def setup(bot: commands.Bot):
     """for bot.load_extension"""
     if config['modmail_channel_id']:
-        await bot.wait_until_ready()
         instance = ModMail(bot)
         bot.add_view(StartModmail(instance))
         await bot.add_cog(instance)
 
 
-with open('config.json', encoding='utf-8') as file:
-    config = json.load(file)
-
 class StartModmail(discord.ui.View):
     def __init__(self, modmail_instance):
         super().__init__(timeout=None)
@@ -30,23 +31,55 @@ class StartModmail(discord.ui.View):
         emoji='📥'
     )
     async def contact_staff(self, interaction: discord.Interaction, button: discord.ui.Button):
-        ticket, _ = await template.create_ticket(
-            thread_channel=self.modmail.channel,
-            thread_name=f'{interaction.user.name} | {interaction.user.id}',
-            user_id=interaction.user.id,
-            messages=[
-                f'<@{interaction.user.id}>',
-                str([f'<@&{id_}>' for id_ in config["mod_role_ids"]]),
-                f'<@{interaction.user.id}>\nDescribe your issue here'
-            ]
-        )
-        await interaction.response.send_message(f'Your ticket: <#{ticket.id}>', ephemeral=True)
+        started = time.perf_counter()
+        # answered before the ticket is opened, which can take longer than the 3 seconds Discord waits
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            ticket = await self.modmail.open_ticket(interaction.guild_id, interaction.user)
+        except errors.CustomError as error:
+            return await interaction.followup.send(embed=error.embed, ephemeral=True)
+        except Exception:
+            await interaction.followup.send(
+                embed=template.error('Unable to open a ticket, please try again later'), ephemeral=True
+            )
+            raise
+        await interaction.followup.send(f'Your ticket: <#{ticket.id}>', ephemeral=True)
+        self.modmail.open_latency.append(time.perf_counter() - started)
 
 
 class ModMail(commands.Cog):
     def __init__(self, bot: commands.Bot = None):
         self.bot = bot
-        self.channel = None
+        self.opening: Dict[int, asyncio.Task] = {}  # user id -> ticket being opened
+        self.open_latency = collections.deque(maxlen=1000)  # seconds from click to the ticket link
+
+    async def open_ticket(self, guild_id: int, user: discord.abc.User) -> discord.Thread:
+        """Opens the user's ticket, clicks made while it is being opened wait for the same ticket"""
+        task = self.opening.get(user.id)
+        if task is None:
+            task = asyncio.create_task(self.__open_ticket__(guild_id, user))
+            self.opening[user.id] = task
+            task.add_done_callback(lambda _: self.opening.pop(user.id, None))
+        return await asyncio.shield(task)  # a cancelled click doesn't cancel the others
+
+    async def __open_ticket__(self, guild_id: int, user: discord.abc.User) -> discord.Thread:
+        settings = template.guild_settings(self.bot, guild_id)
+        channel = await template.modmail_channel(self.bot, guild_id)
+        if channel is None:
+            raise errors.InvalidArgument('Tickets are not set up in this server, please ask staff to set a '
+                                         'modmail channel with `g!settings modmail_channel_id`')
+        async with self.bot.lifecycle.work('ticket'):
+            ticket, _ = await template.create_ticket(
+                thread_channel=channel,
+                thread_name=f'{user.name} | {user.id}',
+                user_id=user.id,
+                messages=[
+                    ' '.join(f'<@&{id_}>' for id_ in settings.mod_role_ids),
+                    f'<@{user.id}>\nDescribe your issue here'
+                ],
+                silent=True  # mods aren't notified of every ticket, the user gets the link as a reply
+            )
+        return ticket
 
     @commands.command(name='ticket')
     async def setup_ticket(self, ctx: commands.Context):
@@ -59,6 +92,11 @@ class ModMail(commands.Cog):
         await ctx.channel.send(embed=embed, view=StartModmail(self))
         return
 
+    @commands.command(name='tickets')
+    async def tickets(self, ctx: commands.Context):
+        """Shows how long the latest tickets took to open, from the click to the link being sent"""
+        await ctx.send(f'```\n{timing.percentiles("ticket open", self.open_latency)}```')
+
     async def cog_check(self, ctx):
         if ctx.author == ctx.guild.owner:
             return True
@@ -69,8 +107,3 @@ class ModMail(commands.Cog):
 
         return False
 
-    async def setup(self):
-        self.channel = await template.get_channel(self.bot, config['modmail_channel_id'])
-
-    async def cog_load(self):
-        asyncio.create_task(self.setup())
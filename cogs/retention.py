@@ -0,0 +1,65 @@
+import time
+import asyncio
+
+from discord.ext import tasks, commands
+
+from utils import template
+from utils import database as db
+from utils.bot_extension import BotExtension
+from utils.config import config
+
+
+async def setup(bot: BotExtension):
+    await bot.add_cog(Retention(bot))
+
+
+class Retention(commands.Cog):
+    """Keeps the archive small by compacting old giveaways into the cold collection
+
+    Config:
+        archive_hot_days - days after ending a giveaway stays in the archive, defaults to 30
+        archive_cold_ttl_days - days after ending a compacted giveaway is deleted, kept forever if omitted
+    """
+    compact_interval = 6
+
+    def __init__(self, bot: BotExtension):
+        self.bot = bot
+        self.hot_seconds = int(config.get('archive_hot_days', 30) * 86400)
+        ttl_days = config.get('archive_cold_ttl_days')
+        self.ttl = int(ttl_days * 86400) if ttl_days else None
+
+    async def compact(self) -> int:
+        """Compacts archived giveaways that ended before the hot window, returns the amount compacted"""
+        compacted = await asyncio.to_thread(
+            db.collection.archive.compact,
+            before=time.time() - self.hot_seconds,
+            ttl=self.ttl
+        )
+        giveaways = self.bot.get_cog('Giveaways')
+        if giveaways is not None:
+            giveaways.forget_archived(compacted)
+        return len(compacted)
+
+    @commands.command(name='compact')
+    async def compact_command(self, ctx):
+        """Compacts the giveaway archive now instead of waiting for the background task"""
+        amount = await self.compact()
+        await ctx.reply(embed=template.info(f'Compacted {amount} archived giveaways'))
+
+    @tasks.loop(hours=compact_interval)
+    async def compact_archive(self):
+        amount = await self.compact()
+        if amount and self.bot.log_channel:
+            await self.bot.log_channel.send(embed=template.info(f'Compacted {amount} archived giveaways'))
+
+    async def cog_check(self, ctx) -> bool:
+        allowed = template.is_staff(ctx)
+        if allowed:
+            await self.bot.log_channel.send(embed=template.command_used(ctx))
+        return allowed
+
+    async def cog_load(self):
+        self.compact_archive.start()
+
+    async def cog_unload(self):
+        self.compact_archive.cancel()
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+import discord
+from discord.ext import tasks, commands
+
+from utils import template, errors
+from utils import parse_commands as parse
+from utils.guild_config import GuildSettings
+from utils.bot_extension import BotExtension
+
+
+async def setup(bot: BotExtension):
+    await bot.add_cog(Settings(bot))
+
+
+class Settings(commands.Cog):
+    """Per-guild settings, stored in the db and cached in bot.guild_config"""
+    refresh_interval = 60
+
+    def __init__(self, bot: BotExtension):
+        self.bot = bot
+
+    @commands.command(name='settings')
+    async def settings(self, ctx, key: str = None, *values: str):
+        """Shows or changes this server's settings
+
+        Syntax:
+            g!settings
+            g!settings key value [value ...]
+
+        Example usage:
+            g!settings giveaway_channels 1049431042206990498 1049431042206990499
+            g!settings disqualified_role_id 1049431042206990500
+            g!settings modmail_channel_id none
+            g!settings role_weights @Booster=2 @Supporter=1.5
+        """
+        if key is None:
+            document = self.bot.guild_config.get(ctx.guild.id).to_document()
+            lines = [f'{name}: {document[name]}' for name in GuildSettings.keys]
+            return await ctx.send(embed=template.info('```\n' + '\n'.join(lines) + '```'))
+
+        if key not in GuildSettings.keys:
+            raise errors.InvalidArgument(f'Unknown setting `{key}`\nSettings: `{", ".join(GuildSettings.keys)}`')
+        if GuildSettings.keys[key] == 'weights':
+            value = parse.get_weights(values)
+            await asyncio.to_thread(self.bot.guild_config.set, ctx.guild.id, **{key: value})
+            return await ctx.message.add_reaction('✅')
+        try:
+            ids = [int(value.strip('<#@&>')) for value in values if value.lower() != 'none']
+        except ValueError:
+            raise errors.InvalidArgument(f'Values of `{key}` must be ids or mentions, got `{values}`')
+        if GuildSettings.keys[key] == 'ids':
+            value = ids
+        elif len(ids) > 1:
+            raise errors.InvalidArgument(f'`{key}` takes 1 id, got {len(ids)}')
+        else:
+            value = ids[0] if ids else None
+
+        await asyncio.to_thread(self.bot.guild_config.set, ctx.guild.id, **{key: value})
+        await ctx.message.add_reaction('✅')
+
+    @tasks.loop(seconds=refresh_interval)
+    async def refresh(self):
+        """Picks up changes made by other processes"""
+        await asyncio.to_thread(self.bot.guild_config.refresh)
+
+    async def cog_check(self, ctx) -> bool:
+        if isinstance(ctx.channel, discord.DMChannel):
+            return False
+        allowed = ctx.author == ctx.guild.owner or ctx.author.guild_permissions.administrator
+        if allowed:
+            await self.bot.log_channel.send(embed=template.command_used(ctx))
+        return allowed
+
+    @staticmethod
+    def log_change(settings: GuildSettings):
+        logging.getLogger(__name__).info(f'Settings of guild {settings.guild_id} changed: {settings.to_document()}')
+
+    async def cog_load(self):
+        self.bot.guild_config.subscribe(self.log_change)
+        self.refresh.start()
+
+    async def cog_unload(self):
+        self.refresh.cancel()
@@ -1,22 +1,29 @@
+from utils import timing  # first, so the startup breakdown includes import time
 import asyncio
 import json
+import itertools
 import traceback
 import aiohttp
 import logging
+import tempfile
 import time
+from typing import Iterator, List
 
 import discord
 from discord.ext import tasks, commands
 
 from utils import template
-from utils import mongodb as db
+from utils import database as db
 from utils import parse_commands as parse
-from utils.bot_extension import BotExtension
+from utils.bot_extension import BotExtension, ShardedBotExtension
+from utils.startup import Orchestrator
+from utils.leases import LeaseManager
+from utils.winners import WinnersIndex
+from utils.guild_config import GuildConfigCache, GuildSettings
 from utils import errors
+from utils.config import config
 
-# load config
-with open('config.json', encoding='utf-8') as file:
-    config = json.load(file)
+timing.mark('imports')
 
 # logging
 async def on_request_start(_, __, params):
@@ -37,16 +44,29 @@ trace_config.on_request_end.append(on_request_end)
 trace_config.on_request_chunk_sent.append(on_request_chunk_sent)
 
 # define bot
-bot = BotExtension(
-    command_prefix=commands.when_mentioned_or(*config['prefix']),
-    intents=discord.Intents.all(),
-    http_trace=trace_config
-)
+# sharded: one gateway connection per shard, shard_count/shard_ids split shards across processes
+if config.get('sharded'):
+    bot = ShardedBotExtension(
+        command_prefix=commands.when_mentioned_or(*config['prefix']),
+        intents=discord.Intents.all(),
+        http_trace=trace_config,
+        shard_count=config.get('shard_count'),
+        shard_ids=config.get('shard_ids')
+    )
+else:
+    bot = BotExtension(
+        command_prefix=commands.when_mentioned_or(*config['prefix']),
+        intents=discord.Intents.all(),
+        http_trace=trace_config
+    )
+
+bot.shutdown_timeout = config.get('shutdown_timeout', 30)
 
 @bot.command(name='die', aliases=['exit', 'quit'])
 @commands.check(template.is_staff)
 async def die(ctx):
-    await ctx.channel.send('Exiting...')
+    """Shuts down after the giveaway ends, tickets and DQs in flight finished (or shutdown_timeout passed)"""
+    await ctx.channel.send(f'Exiting, waiting for {ctx.bot.lifecycle.describe()} in flight...')
     await ctx.bot.close()
     raise SystemExit
 
@@ -90,44 +110,239 @@ async def sync_tree(ctx):
 
 @bot.command(name='db')
 @commands.check(template.is_staff)
-async def db_(ctx, col=''):
-    """Prints all documents in database"""
-    message = '```json\n'
-    if col not in ['c', 'a', 'd']:
+async def db_(ctx, col='', *options):
+    """Prints documents in database
+
+    Syntax:
+        g!db c|a|d|w|s|p [limit=n] [since=duration] [after=unix] [before=unix] [from=id] [to=id] [file]
+
+    Example usage:
+        g!db a since=7d file
+        (uploads every giveaway that ended in the last 7 days as a .ndjson file)
+    """
+    if col not in ['c', 'a', 'd', 'w', 's', 'p']:
         return await ctx.reply(embed=template.error(
             '```Requires 1 literal argument:\n'
             'c for active giveaways\n'
             'a for all giveaways\n'
-            'd for active disqualifications\n\n'
-            'Example:\ng!db c\n(this prints all active giveaways)```'
+            'd for active disqualifications\n'
+            'w for wins\n'
+            's for scheduled giveaways\n'
+            'p for open polls\n\n'
+            'Optional filters:\n'
+            'limit=n, since=duration, after=unix, before=unix, from=id, to=id\n'
+            'file to upload as an attachment instead of sending messages\n\n'
+            'Example:\ng!db c\n(this prints all active giveaways)\n'
+            'g!db a since=7d file\n(uploads giveaways ending in the last 7 days)```'
         ))
     collection = {
         'c': db.collection,
         'a': db.collection.archive,
-        'd': db.collection.dq
+        'd': db.collection.dq,
+        'w': db.collection.winners,
+        's': db.collection.scheduled,
+        'p': db.collection.polls
     }[col]
-    for document in collection.find(None, True):
-        document = json.dumps(document, indent=4, ensure_ascii=False)
-        if len(message) + len(document) + 3 > 2000:
-            await ctx.send(message+'```')
-            message = '```json\n'
-        message += '\n' + document
+
+    as_file = False
+    filters = {}
+    for option in options:
+        if option == 'file':
+            as_file = True
+            continue
+        key, _, value = option.partition('=')
+        try:
+            if key == 'limit':
+                filters['limit'] = int(value)
+            elif key == 'since':
+                filters['ending_after'] = time.time() - template.to_seconds(value)
+            elif key == 'after':
+                filters['ending_after'] = int(value)
+            elif key == 'before':
+                filters['ending_before'] = int(value)
+            elif key == 'from':
+                filters['id_after'] = value
+            elif key == 'to':
+                filters['id_before'] = value
+            else:
+                raise errors.InvalidArgument(f'Unknown option `{option}`')
+        except ValueError:
+            raise errors.InvalidArgument(f'Invalid value for `{key}`: `{value}`')
+
+    # The stream reads the db as it's iterated, so it's only iterated in threads
+    documents = iter(collection.stream(**filters))
+    if as_file:
+        return await _send_dump_file(ctx, documents, f'{collection.name}.ndjson')
+
+    message = '```json\n'
+    while True:
+        batch = await asyncio.to_thread(_next_documents, documents, 100)
+        if not batch:
+            break
+        for document in batch:
+            if len(message) + len(document) + 3 > 2000:
+                await ctx.send(message+'```')
+                message = '```json\n'
+            message += '\n' + document
     await ctx.send(message + '```')
 
+def _next_documents(documents: Iterator[dict], amount: int) -> List[str]:
+    """Reads and serialises the next amount documents of a stream"""
+    return [json.dumps(document, indent=4, ensure_ascii=False) for document in itertools.islice(documents, amount)]
+
+def _write_dump(documents: Iterator[dict], file_, limit: int) -> int:
+    """Writes documents as NDJSON until the file passes limit bytes, returns how many were written"""
+    count = 0
+    for document in documents:
+        file_.write(json.dumps(document, ensure_ascii=False).encode('utf-8') + b'\n')
+        count += 1
+        if file_.tell() > limit:
+            break
+    return count
+
+async def _send_dump_file(ctx, documents: Iterator[dict], filename: str):
+    """Streams documents as NDJSON into a temporary file and uploads it"""
+    with tempfile.SpooledTemporaryFile(max_size=1024*1024) as file_:
+        limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+        count = await asyncio.to_thread(_write_dump, documents, file_, limit)
+        if file_.tell() > limit:
+            return await ctx.reply(embed=template.error(
+                f'Dump is over the upload limit of {limit} bytes after {count} documents.\n'
+                'Narrow it down with `limit=`, `since=`, `after=`, `before=`, `from=` or `to=`'
+            ))
+        file_.seek(0)
+        await ctx.reply(f'{count} documents', file=discord.File(file_, filename=filename))
+
 @bot.command(name='re')
 @commands.check(template.is_bot_owner)
 async def reload_extension(ctx, extension: str):
     await bot.reload_extension(extension)
     await ctx.message.add_reaction('✅')
 
+@bot.command(name='shards')
+@commands.check(template.is_staff)
+async def shards(ctx):
+    """Shows latency, guilds, event rate and indexed giveaways of each shard connected to this process"""
+    giveaways = bot.get_cog('Giveaways')
+    indexed = giveaways.archived_ids.sizes() if giveaways else {}
+    guilds = {}
+    for guild_ in bot.guilds:
+        guilds[bot.shard_of(guild_.id)] = guilds.get(bot.shard_of(guild_.id), 0) + 1
+    lines = [f'{"shard":<7}{"latency":>10}{"guilds":>8}{"events/s":>10}{"indexed":>9}']
+    for shard_id, latency in bot.shard_latencies():
+        lines.append(
+            f'{shard_id:<7}{latency * 1000:>8.0f}ms{guilds.get(shard_id, 0):>8}'
+            f'{bot.metrics.rate(shard_id):>10.2f}{indexed.get(shard_id, 0):>9}'
+        )
+    await ctx.send('```\n' + '\n'.join(lines) + '```')
+
+@bot.command(name='scheduler')
+@commands.check(template.is_staff)
+async def scheduler(ctx):
+    """Shows pending scheduled jobs and how late the latest ones ran"""
+    giveaways = bot.get_cog('Giveaways')
+    lines = [
+        f'pending {len(bot.scheduler)}, running {len(bot.scheduler.running)}',
+        timing.percentiles('job start', bot.scheduler.lateness)
+    ]
+    if giveaways:
+        lines.append(timing.percentiles('scheduled post', giveaways.activation_latency))
+    await ctx.send('```\n' + '\n'.join(lines) + '```')
+
+@bot.command(name='startup')
+@commands.check(template.is_staff)
+async def startup(ctx):
+    """Shows how long each startup stage took"""
+    await ctx.send(f'```\n{timing.breakdown()}```')
+
+# Startup: every cog is loaded as soon as what it needs is available, only cogs requiring 'ready'
+# (guild and member cache) wait for READY
+orchestrator = Orchestrator(bot)
+
+@orchestrator.resource('database')
+async def provide_database(_):
+    return await asyncio.to_thread(db.connect)
+
+@orchestrator.resource('leases', requires=('database',))
+async def provide_leases(bot_):
+    bot_.leases = LeaseManager(
+        db.collection.leases,
+        ttl=config.get('lease_ttl', 60),
+        heartbeat=config.get('lease_heartbeat', 20)
+    )
+    bot_.leases.start()
+    return bot_.leases
+
+@orchestrator.resource('owner')
+async def provide_owner(bot_):
+    bot_.owner = await template.get_user(bot=bot_, user_id=468631903390400527)
+    return bot_.owner
+
+@orchestrator.resource('log_channel')
+async def provide_log_channel(bot_):
+    if config.get('log_channel_id'):
+        bot_.log_channel = await template.get_channel(bot=bot_, channel_id=config['log_channel_id'])
+    return bot_.log_channel
+
+@orchestrator.resource('mod_log_channel')
+async def provide_mod_log_channel(bot_):
+    return await template.get_channel(bot_, config['mod_log_channel_id'])
+
+@orchestrator.resource('modmail_channel')
+async def provide_modmail_channel(bot_):
+    if config.get('modmail_channel_id'):
+        return await template.get_channel(bot_, config['modmail_channel_id'])
+
+@orchestrator.resource('shard_count')
+async def provide_shard_count(bot_):
+    """Resolves once shards are known, shard indexes built before would put every guild on shard 0"""
+    if isinstance(bot_, commands.AutoShardedBot) and bot_.shard_count is None:
+        await bot_.wait_for('connect')  # launch_shards sets shard_count before the first shard connects
+    return bot_.shard_count
+
+@orchestrator.resource('guild', requires=('ready',))
+async def provide_guild(bot_):
+    return bot_.get_guild(config['guild_id'])
+
+@orchestrator.resource('winners', requires=('database',))
+async def provide_winners(bot_):
+    bot_.winners = WinnersIndex(db.collection.winners, window=config.get('win_cache_days', 30) * 86400)
+    await asyncio.to_thread(bot_.winners.refresh)
+    return bot_.winners
+
+@orchestrator.resource('guild_config', requires=('database',))
+async def provide_guild_config(bot_):
+    bot_.guild_config = GuildConfigCache(db.collection.guilds, GuildSettings.from_config(config))
+    await asyncio.to_thread(bot_.guild_config.refresh)
+    return bot_.guild_config
+
+orchestrator.extension('cogs.errorhandle', requires=('owner',))
+orchestrator.extension('cogs.callvote', requires=('database', 'guild_config', 'shard_count'))
+orchestrator.extension('cogs.modmail', requires=('guild_config', 'modmail_channel'))
+orchestrator.extension(
+    'cogs.giveaways',
+    requires=('leases', 'guild_config', 'winners', 'owner', 'log_channel', 'modmail_channel', 'shard_count')
+)
+orchestrator.extension('cogs.retention', requires=('database', 'log_channel'))
+orchestrator.extension(
+    'cogs.disqualify', requires=('leases', 'guild_config', 'log_channel', 'mod_log_channel', 'guild')
+)
+orchestrator.extension('cogs.settings', requires=('guild_config',))
+
+async def load_extensions():
+    failed = await orchestrator.run()
+    if failed:
+        report = orchestrator.report()
+        try:
+            owner_ = await orchestrator.get('owner')
+            await owner_.send(embed=template.error(f'```{report[-4000:]}```'))
+        except Exception:
+            logging.getLogger(__name__).exception('Unable to send startup failures to owner')
+
 @bot.event
 async def setup_hook():
-    asyncio.create_task(bot.load_extension('cogs.giveaways'))
-    asyncio.create_task(bot.load_extension('cogs.modmail'))
-    asyncio.create_task(bot.load_extension('cogs.errorhandle'))
-    asyncio.create_task(bot.load_extension('cogs.callvote'))
-    asyncio.create_task(bot.load_extension('cogs.disqualify'))
-    asyncio.create_task(bot.setup())
+    timing.mark('login')
+    asyncio.create_task(load_extensions())
 
 
 if __name__ == '__main__':
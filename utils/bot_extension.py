@@ -1,23 +1,81 @@
-import json
+import logging
+from typing import List, Tuple
 
 from discord.ext import commands
 
-from utils import template
+from utils.write_behind import WriteBehind
+from utils.debounce import Debouncer
+from utils.scheduler import DeadlineScheduler
+from utils.lifecycle import Lifecycle
+from utils.shards import shard_of, ShardMetrics
 
 
-with open('config.json', encoding='utf-8') as file:
-    config = json.load(file)
+class ExtensionMixin:
+    """adds owner attribute (as a user object) to commands.Bot
 
-
-class BotExtension(commands.Bot):
-    """adds owner attribute (as a user object) to commands.Bot"""
+    owner, log_channel and everything else in resources are populated by utils.startup.Orchestrator
+    """
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.owner = None
         self.log_channel = None
+        self.resources = {}
+        self.leases = None
+        self.guild_config = None
+        self.winners = None
+        self.scheduler = DeadlineScheduler()  # giveaway ends and other jobs due at a time
+        self.lifecycle = Lifecycle()
+        self.shutdown_timeout = 30  # seconds close() waits for work in flight
+        self.metrics = ShardMetrics()
+        for event in ('on_raw_reaction_add', 'on_raw_reaction_remove'):
+            self.add_listener(self.__count_event__, event)
+        self.add_listener(self.__count_message__, 'on_message')
+
+    async def __count_event__(self, event):
+        self.metrics.record(self.shard_of(event.guild_id))
+
+    async def __count_message__(self, message):
+        self.metrics.record(self.shard_of(message.guild.id if message.guild else None))
+
+    def shard_of(self, guild_id: int = None) -> int:
+        """Shard receiving a guild's events, DMs are received on shard 0"""
+        return shard_of(guild_id, self.shard_count) if guild_id else 0
+
+    def owned_shards(self) -> List[int]:
+        """Shards this process is connected to"""
+        if not self.shard_count:
+            return [0]
+        return list(self.shard_ids) if self.shard_ids is not None else list(range(self.shard_count))
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """True if this process receives the guild's events, only those giveaways and DQs are handled here"""
+        return not self.shard_count or self.shard_of(guild_id) in self.owned_shards()
+
+    def shard_latencies(self) -> List[Tuple[int, float]]:
+        return [(0, self.latency)]
+
+    async def close(self):
+        """Stops taking new work, waits for work in flight, then flushes everything buffered
+
+        Pending scheduled jobs are not stored, they are loaded again from their documents on startup.
+        """
+        await self.scheduler.close()
+        self.lifecycle.stop()
+        await self.lifecycle.drain(self.shutdown_timeout, self.scheduler.running.values())
+        logging.getLogger(__name__).info(f'{len(self.scheduler)} scheduled jobs are picked up again on startup')
+        await Debouncer.close_all()
+        await WriteBehind.close_all()
+        if self.leases is not None:
+            await self.leases.close()  # lets other processes take over right away
+        await super().close()
+
+
+class BotExtension(ExtensionMixin, commands.Bot):
+    """Single gateway connection"""
+
+
+class ShardedBotExtension(ExtensionMixin, commands.AutoShardedBot):
+    """One gateway connection per shard, each process can run a subset with shard_ids"""
 
-    async def setup(self):
-        await self.wait_until_ready()
-        self.owner = await template.get_user(bot=self, user_id=468631903390400527)
-        if config.get('log_channel_id'):
-            self.log_channel = await template.get_channel(bot=self, channel_id=config['log_channel_id'])
+    def shard_latencies(self) -> List[Tuple[int, float]]:
+        return self.latencies
@@ -0,0 +1,35 @@
+"""config.json, read once and shared by every module
+
+The path can be overridden with the WFG_CONFIG environment variable,
+otherwise config.json in the working directory or the repository root is used.
+"""
+import os
+import json
+import time
+from typing import Dict, Any
+
+config: Dict[str, Any] = {}
+load_seconds = 0.0
+
+
+def find_path() -> str:
+    if os.environ.get('WFG_CONFIG'):
+        return os.environ['WFG_CONFIG']
+    if os.path.exists('config.json'):
+        return 'config.json'
+    return os.path.join(os.path.dirname(__file__), '..', 'config.json')
+
+
+def load(path: str = None) -> Dict[str, Any]:
+    """(Re)loads the config in place, so modules holding a reference see the new values"""
+    global load_seconds
+    start = time.perf_counter()
+    with open(path or find_path(), encoding='utf-8') as file:
+        values = json.load(file)
+    config.clear()
+    config.update(values)
+    load_seconds = time.perf_counter() - start
+    return config
+
+
+load()
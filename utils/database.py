@@ -0,0 +1,45 @@
+"""Selects the storage backend from config['db_instance']
+
+    'production' / 'test' - MongoDB cluster at config['connection_string']
+    'sqlite' - embedded SQLite file at config['sqlite_path'] (defaults to giveaways.db)
+    'memory' - in-memory, nothing is persisted, for offline benchmarks
+
+The backend is created on first access of `collection`, so importing this module never connects.
+Call connect() in a thread at startup to open the connection while the gateway logs in.
+"""
+import threading
+
+from utils import storage
+from utils.config import config
+
+_lock = threading.Lock()
+_collection = None
+
+
+def get_collection() -> storage.Backend:
+    global _collection
+    with _lock:
+        if _collection is None:
+            if config['db_instance'] == 'sqlite':
+                from utils import sqlite
+                _collection = sqlite.Collection(config.get('sqlite_path', 'giveaways.db'))
+            elif config['db_instance'] == 'memory':
+                from utils import memory
+                _collection = memory.Collection()
+            else:
+                from utils import mongodb
+                _collection = mongodb.Collection(mongodb.instance)
+    return _collection
+
+
+def connect() -> storage.Backend:
+    """Creates the backend and waits until it answers, blocking"""
+    collection_ = get_collection()
+    collection_.ping()
+    return collection_
+
+
+def __getattr__(name):
+    if name == 'collection':
+        return get_collection()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,130 @@
+import time
+import heapq
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+from utils.pacing import RateLimiter
+
+
+class Debouncer:
+    """Runs callback(key) after touch(key), at most once per `interval` seconds per key
+
+    Touches made before the call runs are coalesced into it, touches made while it runs schedule one more call.
+    Calls are also limited to `bucket_rate` per `bucket_period` seconds per bucket (e.g. the channel, to stay
+    within its edit rate limit) and to `concurrency` at once, so busy keys leave room for other API requests.
+
+    Example:
+        edits = Debouncer(refresh_embed, interval=10)
+        edits.touch(message_id, bucket=channel_id)
+    """
+    instances: Set['Debouncer'] = set()  # debouncers started since they were last closed
+
+    def __init__(
+            self,
+            callback: Callable[[Hashable], Awaitable[Any]],
+            interval: float = 10,
+            bucket_rate: int = 4,
+            bucket_period: float = 5,
+            concurrency: int = 2
+    ):
+        self.callback = callback
+        self.interval = interval
+        self.due: Dict[Hashable, float] = {}  # scheduled key -> time.monotonic() it is due
+        self.buckets: Dict[Hashable, Hashable] = {}
+        self.last_call: Dict[Hashable, float] = {}
+        self.running: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.__heap: List[Tuple[float, int, Hashable]] = []
+        self.__counter = 0
+        self.__bucket_calls = RateLimiter(bucket_rate, bucket_period)
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__wake = asyncio.Event()
+        self.__task = None
+
+    def touch(self, key: Hashable, bucket: Hashable = None):
+        """Schedules a call for key unless one is already scheduled"""
+        if key in self.due:
+            return
+        now = time.monotonic()
+        self.buckets[key] = bucket
+        self.__schedule(key, max(now, self.last_call.get(key, float('-inf')) + self.interval))
+        if self.__task is None or self.__task.done():
+            Debouncer.instances.add(self)
+            self.__task = asyncio.create_task(self.__run__())
+
+    def __schedule(self, key: Hashable, due: float):
+        self.due[key] = due
+        self.__counter += 1
+        heapq.heappush(self.__heap, (due, self.__counter, key))
+        self.__wake.set()
+
+    async def discard(self, key: Hashable):
+        """Cancels the scheduled call of key and waits for a running one to finish"""
+        self.due.pop(key, None)
+        self.buckets.pop(key, None)
+        self.last_call.pop(key, None)
+        task = self.running.get(key)
+        if task is not None:
+            await asyncio.wait({task})
+
+    async def __run__(self):
+        while True:
+            if not self.__heap:
+                self.__wake.clear()
+                await self.__wake.wait()
+                continue
+            due, _, key = self.__heap[0]
+            now = time.monotonic()
+            if self.due.get(key) != due:  # discarded or rescheduled
+                heapq.heappop(self.__heap)
+                continue
+            if due > now:
+                self.__wake.clear()
+                try:
+                    await asyncio.wait_for(self.__wake.wait(), timeout=due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.__heap)
+            bucket = self.buckets.get(key)
+            slot = self.__bucket_calls.slot(bucket, now)
+            if slot > now:
+                self.__schedule(key, slot)
+                continue
+            await self.__semaphore.acquire()
+            if self.due.get(key) != due:  # discarded while waiting for a free slot
+                self.__semaphore.release()
+                continue
+            del self.due[key]
+            self.__bucket_calls.record(bucket)
+            self.last_call[key] = time.monotonic()
+            self.running[key] = asyncio.create_task(self.__invoke__(key))
+
+    async def __invoke__(self, key: Hashable):
+        try:
+            self.calls += 1
+            await self.callback(key)
+        except Exception:
+            logging.getLogger(__name__).exception(f'Debounced call for {key} failed')
+        finally:
+            self.running.pop(key, None)
+            self.__semaphore.release()
+
+    async def close(self):
+        """Stops scheduling calls and waits for running ones"""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        Debouncer.instances.discard(self)
+        if self.running:
+            await asyncio.wait(set(self.running.values()))
+
+    @classmethod
+    async def close_all(cls):
+        """Stops every debouncer and waits for their running calls, to be called on shutdown"""
+        for instance in list(cls.instances):
+            try:
+                await instance.close()
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to close debouncer on shutdown')
@@ -0,0 +1,134 @@
+import time
+from typing import Dict, Any, Container, FrozenSet, Iterable, List, Optional, Union
+
+from discord import User, Member
+
+from utils import errors
+from utils import template
+
+DISCORD_EPOCH = 1420070400  # unix timestamp of the first snowflake
+
+
+def created_at(snowflake: int) -> float:
+    """Unix timestamp of when a Discord id was created, e.g. the account age of a user id"""
+    return (snowflake >> 22) / 1000 + DISCORD_EPOCH
+
+
+class Rules:
+    """Who may win a giveaway, stored in its document under 'rules'
+
+    Every rule is optional:
+        required_roles - entrants must have at least one of these roles
+        forbidden_roles - entrants must have none of these roles
+        min_account_age - seconds since the entrant's account was created
+        min_tenure - seconds since the entrant joined the guild
+        win_cooldown - seconds since the entrant last won a giveaway
+    Rules needing roles or the join date exclude entrants that are no longer members of the guild.
+    """
+    keys = ('required_roles', 'forbidden_roles', 'min_account_age', 'min_tenure', 'win_cooldown')
+    # argument of the rules command -> key
+    arguments = {
+        'require': 'required_roles',
+        'forbid': 'forbidden_roles',
+        'account_age': 'min_account_age',
+        'tenure': 'min_tenure',
+        'cooldown': 'win_cooldown',
+    }
+
+    def __init__(self, document: Dict[str, Any] = None):
+        document = document or {}
+        self.required_roles: FrozenSet[int] = frozenset(int(id_) for id_ in document.get('required_roles') or ())
+        self.forbidden_roles: FrozenSet[int] = frozenset(int(id_) for id_ in document.get('forbidden_roles') or ())
+        self.min_account_age: Optional[int] = document.get('min_account_age')
+        self.min_tenure: Optional[int] = document.get('min_tenure')
+        self.win_cooldown: Optional[int] = document.get('win_cooldown')
+
+    def __bool__(self):
+        return any((self.required_roles, self.forbidden_roles, self.min_account_age, self.min_tenure,
+                    self.win_cooldown))
+
+    @classmethod
+    def from_args(cls, values: Iterable[str]) -> 'Rules':
+        """Parses `require=@Role,@Role forbid=@Role account_age=30d tenure=7d cooldown=7d`"""
+        document = {}
+        for value in values:
+            argument, _, rule = value.partition('=')
+            key = cls.arguments.get(argument.lower())
+            if key is None or not rule:
+                raise errors.InvalidArgument(
+                    f'Rules must look like `{"=... ".join(cls.arguments)}=...`, got `{value}`'
+                )
+            if key.endswith('roles'):
+                try:
+                    document[key] = [int(role.strip('<@&>')) for role in rule.split(',') if role]
+                except ValueError:
+                    raise errors.InvalidArgument(f'Roles must be ids or mentions separated by `,`, got `{rule}`')
+            else:
+                document[key] = template.to_seconds(rule)
+        return cls(document)
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            'required_roles': sorted(self.required_roles),
+            'forbidden_roles': sorted(self.forbidden_roles),
+            'min_account_age': self.min_account_age,
+            'min_tenure': self.min_tenure,
+            'win_cooldown': self.win_cooldown,
+        }
+
+    def describe(self) -> str:
+        lines = []
+        if self.required_roles:
+            lines.append('Requires one of ' + ', '.join(f'<@&{id_}>' for id_ in sorted(self.required_roles)))
+        if self.forbidden_roles:
+            lines.append('Excludes ' + ', '.join(f'<@&{id_}>' for id_ in sorted(self.forbidden_roles)))
+        if self.min_account_age:
+            lines.append(f'Account at least {self.min_account_age // 86400} days old')
+        if self.min_tenure:
+            lines.append(f'Member for at least {self.min_tenure // 86400} days')
+        if self.win_cooldown:
+            lines.append(f'No wins in the last {self.win_cooldown // 86400} days')
+        return '\n'.join(lines) or 'Everyone can win'
+
+    def filter(
+            self,
+            entrants: List[Union[User, Member]],
+            recent_winners: Container[int] = frozenset(),
+            now: float = None
+    ) -> List[Union[User, Member]]:
+        """Entrants who satisfy every rule, in one pass over cached member data, no API calls
+
+        :param recent_winners: ids of users who won within win_cooldown, see WinnersIndex.recent
+        """
+        if not self:
+            return entrants
+        now = time.time() if now is None else now
+        # Everything that doesn't depend on the entrant is computed once
+        created_before = now - self.min_account_age if self.min_account_age else None
+        joined_before = now - self.min_tenure if self.min_tenure else None
+        required = tuple(self.required_roles)
+        forbidden = tuple(self.forbidden_roles)
+        needs_member = bool(required or joined_before is not None)
+        cooldown = bool(self.win_cooldown and recent_winners)
+
+        eligible = []
+        for entrant in entrants:
+            if created_before is not None and created_at(entrant.id) > created_before:
+                continue
+            if cooldown and entrant.id in recent_winners:
+                continue
+            get_role = getattr(entrant, 'get_role', None)
+            if get_role is None:
+                if needs_member:
+                    continue
+            else:
+                if required and not any(get_role(id_) for id_ in required):
+                    continue
+                if forbidden and any(get_role(id_) for id_ in forbidden):
+                    continue
+                if joined_before is not None:
+                    joined_at = getattr(entrant, 'joined_at', None)
+                    if joined_at is None or joined_at.timestamp() > joined_before:
+                        continue
+            eligible.append(entrant)
+        return eligible
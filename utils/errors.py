@@ -61,6 +61,9 @@ class GiveawayNotFound(CustomError):
 class MissingPermissions(CustomError):
     """Raised when insufficient arguments were provided"""
 
+class ShuttingDown(CustomError):
+    """Raised when work is started while the bot is shutting down"""
+
 class CustomWarning(CustomError):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, type_='warning', **kwargs)
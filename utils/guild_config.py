@@ -0,0 +1,117 @@
+import logging
+from typing import Dict, Any, Callable, FrozenSet, List, Optional
+
+from utils.storage import Backend
+
+
+def weights_from_document(weights: Optional[Dict[Any, Any]]) -> Dict[int, float]:
+    """Role weights as stored in a document ({'role id': weight}) to {role id: weight}"""
+    return {int(role_id): float(weight) for role_id, weight in (weights or {}).items()}
+
+
+class GuildSettings:
+    """Settings of one guild, id lists are precomputed as frozensets for constant time membership checks"""
+    # key -> type, 'ids' are lists of ids, 'id' a single id, 'weights' maps role ids to entry multipliers
+    keys = {
+        'giveaway_channels': 'ids',
+        'giveaway_role_ids': 'ids',
+        'mod_role_ids': 'ids',
+        'disqualified_role_id': 'id',
+        'modmail_channel_id': 'id',
+        'mod_log_channel_id': 'id',
+        'role_weights': 'weights',
+    }
+
+    def __init__(self, guild_id: int, values: Dict[str, Any] = None):
+        values = values or {}
+        self.guild_id = guild_id
+        self.giveaway_channels: FrozenSet[int] = frozenset(values.get('giveaway_channels') or ())
+        self.giveaway_role_ids: FrozenSet[int] = frozenset(values.get('giveaway_role_ids') or ())
+        self.mod_role_ids: FrozenSet[int] = frozenset(values.get('mod_role_ids') or ())
+        self.staff_role_ids: FrozenSet[int] = self.giveaway_role_ids | self.mod_role_ids
+        self.disqualified_role_id: Optional[int] = values.get('disqualified_role_id')
+        self.modmail_channel_id: Optional[int] = values.get('modmail_channel_id')
+        self.mod_log_channel_id: Optional[int] = values.get('mod_log_channel_id')
+        self.role_weights: Dict[int, float] = weights_from_document(values.get('role_weights'))
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'GuildSettings':
+        """Settings of the guild in config.json, the defaults before anything is stored in the db"""
+        return cls(config['guild_id'], {key: config.get(key) for key in cls.keys})
+
+    def to_document(self) -> Dict[str, Any]:
+        document = {'_id': str(self.guild_id)}
+        for key, type_ in self.keys.items():
+            value = getattr(self, key)
+            if type_ == 'ids':
+                value = sorted(value)
+            elif type_ == 'weights':
+                value = {str(role_id): weight for role_id, weight in value.items()}  # mongo keys must be strings
+            document[key] = value
+        return document
+
+    def replace(self, **changes) -> 'GuildSettings':
+        """Returns a copy with changes applied"""
+        document = self.to_document()
+        document.update(changes)
+        return GuildSettings(self.guild_id, document)
+
+
+class GuildConfigCache:
+    """Per-guild settings stored in the db and cached in memory
+
+    get() never touches the db. Changes made through set() are written through and announced to subscribers,
+    changes made by other processes are picked up by refresh().
+    """
+
+    def __init__(self, collection: Backend, defaults: GuildSettings = None):
+        self.collection = collection
+        self.defaults = defaults
+        self.settings: Dict[int, GuildSettings] = {}
+        self.subscribers: List[Callable[[GuildSettings], Any]] = []
+
+    def get(self, guild_id: int) -> GuildSettings:
+        settings = self.settings.get(guild_id)
+        if settings is None:
+            if self.defaults is not None and self.defaults.guild_id == guild_id:
+                settings = self.defaults
+            else:
+                settings = GuildSettings(guild_id)
+            self.settings[guild_id] = settings
+        return settings
+
+    def subscribe(self, callback: Callable[[GuildSettings], Any]):
+        """Calls callback(settings) whenever a guild's settings change"""
+        self.subscribers.append(callback)
+
+    def __notify__(self, settings: GuildSettings):
+        for callback in self.subscribers:
+            try:
+                callback(settings)
+            except Exception:
+                logging.getLogger(__name__).exception('Guild config subscriber failed')
+
+    def set(self, guild_id: int, **changes) -> GuildSettings:
+        """Writes changes to the db and the cache, blocking"""
+        unknown = set(changes) - set(GuildSettings.keys)
+        if unknown:
+            raise KeyError(f'Unknown settings: {sorted(unknown)}')
+        settings = self.get(guild_id).replace(**changes)
+        self.collection.update(str(guild_id), settings.to_document())
+        self.settings[guild_id] = settings
+        self.__notify__(settings)
+        return settings
+
+    def refresh(self) -> List[GuildSettings]:
+        """Reloads every stored guild, blocking, returns the settings that changed"""
+        changed = []
+        for document in self.collection.stream(batch_size=500):
+            guild_id = int(document['_id'])
+            settings = GuildSettings(guild_id, document)
+            current = self.settings.get(guild_id)
+            if current is None or current.to_document() != settings.to_document():
+                self.settings[guild_id] = settings
+                changed.append(settings)
+        for settings in changed:
+            self.__notify__(settings)
+        return changed
@@ -0,0 +1,89 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Set
+
+from utils.storage import LeaseStore
+
+
+class LeaseManager:
+    """Claims leases for this process and keeps them alive with heartbeats
+
+    Work guarded by a lease (ending a giveaway, expiring a DQ) is only done by the process holding it.
+    If a process dies its leases expire after ttl seconds and any other process may take the work over.
+
+    :param store: where leases are stored, shared by every process
+    :param ttl: seconds a lease stays valid without a heartbeat
+    :param heartbeat: seconds between renewals, must be well below ttl
+    """
+
+    def __init__(self, store: LeaseStore, ttl: float = 60, heartbeat: float = 20, owner: str = None):
+        self.store = store
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.held: Set[str] = set()
+        self.__task = None
+
+    def start(self):
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.create_task(self.__heartbeat__())
+
+    async def __heartbeat__(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if not self.held:
+                continue
+            keys = list(self.held)
+            try:
+                renewed = set(await asyncio.to_thread(self.store.renew, keys, self.owner, self.ttl))
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to renew leases')
+                continue
+            lost = set(keys) - renewed
+            if lost:
+                logging.getLogger(__name__).warning(f'Lost leases to another process: {sorted(lost)}')
+            self.held -= lost
+
+    async def acquire(self, key: str) -> bool:
+        """Claims a lease, returns False if another process holds it"""
+        if await asyncio.to_thread(self.store.claim, key, self.owner, self.ttl):
+            self.held.add(key)
+            return True
+        self.held.discard(key)
+        return False
+
+    async def confirm(self, key: str) -> bool:
+        """Renews a lease now, returns whether it is still held, to be checked right before doing the work"""
+        if key not in self.held:
+            return False
+        if await asyncio.to_thread(self.store.renew, [key], self.owner, self.ttl):
+            return True
+        self.held.discard(key)
+        return False
+
+    def forget(self, key: str):
+        """Stops renewing a lease once its work is done
+
+        The lease is left to expire instead of being released, so a process acting on a stale read
+        of the work can't claim it again right away.
+        """
+        self.held.discard(key)
+
+    async def release(self, key: str):
+        """Gives a lease up immediately so another process can take the work over"""
+        self.held.discard(key)
+        await asyncio.to_thread(self.store.release, key, self.owner)
+
+    async def close(self):
+        """Stops heartbeats and releases every held lease"""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        for key in list(self.held):
+            try:
+                await self.release(key)
+            except Exception:
+                logging.getLogger(__name__).exception(f'Failed to release lease {key}')
@@ -0,0 +1,78 @@
+import time
+import asyncio
+import logging
+import contextlib
+from typing import Any, Awaitable, Callable, Collection, Dict, List, Tuple
+
+from utils import errors
+
+
+class Lifecycle:
+    """Lets work in flight finish when the bot shuts down instead of cutting it off halfway
+
+    Work that would leave something half done if stopped (a giveaway with its embed edited but no result
+    sent, a DQ role added but not stored) runs inside `work()`. Once stop() was called no new work starts,
+    drain() waits for the work already running.
+
+    Example:
+        async with bot.lifecycle.work('end'):
+            ...
+    """
+
+    def __init__(self):
+        self.accepting = True
+        # done when the work finished -> (kind, task doing it), the task can outlive it like a loop's does
+        self.in_flight: Dict[asyncio.Future, Tuple[str, asyncio.Task]] = {}
+        # coroutines buffering state kept in memory, awaited after draining and before buffers are flushed
+        self.before_flush: List[Callable[[], Awaitable[Any]]] = []
+
+    @contextlib.asynccontextmanager
+    async def work(self, kind: str):
+        """Marks the enclosed block as work to wait for on shutdown
+
+        :raises errors.ShuttingDown: if the bot is shutting down, nothing should be started
+        """
+        if not self.accepting:
+            raise errors.ShuttingDown('The bot is restarting, please try again in a moment')
+        done = asyncio.get_running_loop().create_future()
+        self.in_flight[done] = (kind, asyncio.current_task())
+        try:
+            yield
+        finally:
+            del self.in_flight[done]
+            done.set_result(None)
+
+    def stop(self):
+        """Refuses new work"""
+        self.accepting = False
+
+    def describe(self) -> str:
+        """Amount of work in flight per kind"""
+        kinds: Dict[str, int] = {}
+        for kind, _ in self.in_flight.values():
+            kinds[kind] = kinds.get(kind, 0) + 1
+        return ', '.join(f'{amount} {kind}' for kind, amount in sorted(kinds.items())) or 'nothing'
+
+    async def drain(self, timeout: float, tasks: Collection[asyncio.Task] = ()) -> bool:
+        """Waits up to timeout seconds for work in flight and tasks, returns whether all of it finished"""
+        started = time.monotonic()
+        current = asyncio.current_task()
+        # work of the current task can't finish while it waits here
+        waiting = {done for done, (_, task) in self.in_flight.items() if task is not current}
+        waiting |= {task for task in tasks if task is not current}
+        drained = True
+        if waiting:
+            logging.getLogger(__name__).info(f'Waiting for {self.describe()} in flight, {len(waiting)} tasks')
+            _, pending = await asyncio.wait(waiting, timeout=timeout)
+            if pending:
+                logging.getLogger(__name__).warning(
+                    f'{self.describe()} still in flight after {timeout}s, shutting down anyway'
+                )
+                drained = False
+        for callback in self.before_flush:
+            try:
+                await callback()
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to buffer in-memory state on shutdown')
+        logging.getLogger(__name__).info(f'Drained in {time.monotonic() - started:.2f}s')
+        return drained
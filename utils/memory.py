@@ -0,0 +1,204 @@
+import copy
+import time
+import threading
+from typing import Union, Dict, Any, Iterator, List
+
+from utils import storage
+
+
+class UnitOfWork(storage.UnitOfWork):
+    """Applies every collected write under one lock, duplicate inserts are checked before anything is written"""
+
+    def __init__(self, lock: threading.RLock):
+        self.lock = lock
+        self.operations = []
+        self.inserts = []
+
+    def insert(self, collection: 'Table', document: Dict[str, Any]) -> 'UnitOfWork':
+        self.inserts.append((collection, document))
+        self.operations.append(lambda: collection.insert(document))
+        return self
+
+    def update(self, collection: 'Table', _id, document: Dict[str, Any]) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.update(_id, document))
+        return self
+
+    def append(self, collection: 'Table', _id, dict_: Dict[str, Any]) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.append(_id, dict_))
+        return self
+
+    def delete(self, collection: 'Table', _id) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.delete(_id))
+        return self
+
+    def commit(self):
+        with self.lock:
+            for collection, document in self.inserts:
+                if str(document['_id']) in collection.documents:
+                    raise storage.DuplicateKeyError(f'Duplicate _id {document["_id"]} in {collection.name}')
+            for operation in self.operations:
+                operation()
+
+
+class Table(storage.Backend):
+    """Documents kept in a dict, for tests and offline benchmarks, nothing is persisted"""
+
+    def __init__(self, name: str, lock: threading.RLock = None):
+        self.name = name
+        self.lock = lock or threading.RLock()
+        self.documents: Dict[str, Dict[str, Any]] = {}
+
+    def unit_of_work(self) -> UnitOfWork:
+        return UnitOfWork(self.lock)
+
+    def get(self, _id):
+        with self.lock:
+            document = self.documents.get(str(_id))
+            return copy.deepcopy(document) if document is not None else None
+
+    def insert(self, _id: Union[int, str, dict], dict_: Dict[str, Any] = None):
+        document = _id if type(_id) == dict else {'_id': _id, **dict_}
+        with self.lock:
+            if str(document['_id']) in self.documents:
+                raise storage.DuplicateKeyError(f'Duplicate _id {document["_id"]} in {self.name}')
+            self.documents[str(document['_id'])] = copy.deepcopy(document)
+
+    def delete(self, message_id: Union[int, str]):
+        with self.lock:
+            self.documents.pop(str(message_id), None)
+
+    def delete_many(self, ids: List[Any]):
+        with self.lock:
+            for _id in ids:
+                self.documents.pop(str(_id), None)
+
+    def truncate(self):
+        with self.lock:
+            self.documents.clear()
+
+    def append(self, _id, dict_: Dict[str, Any]):
+        with self.lock:
+            if str(_id) in self.documents:
+                self.documents[str(_id)].update(copy.deepcopy(dict_))
+
+    def update(self, _id, dict_: Dict[str, Any]):
+        with self.lock:
+            self.documents[str(_id)] = {**copy.deepcopy(dict_), '_id': _id}
+
+    def upsert_many(self, documents: List[Dict[str, Any]]):
+        with self.lock:
+            for document in documents:
+                self.documents[str(document['_id'])] = copy.deepcopy(document)
+
+    def bulk_update(self, pending: Dict[Any, Dict[str, Any]]):
+        with self.lock:
+            for _id, entry in pending.items():
+                if entry['replace'] is not None:
+                    self.documents[str(_id)] = {**copy.deepcopy(entry['replace']), '_id': _id}
+                    continue
+                document = self.documents.get(str(_id))
+                if document is None:
+                    continue
+                document.update(entry['set'])
+                for key, amount in entry['inc'].items():
+                    document[key] = document.get(key, 0) + amount
+
+    def ids(self, field: str = None) -> Iterator[Any]:
+        with self.lock:
+            documents = sorted(self.documents.items())
+        for _, document in documents:
+            yield document['_id'] if field is None else (document['_id'], document.get(field))
+
+    def stream(
+            self,
+            ending_after: float = None,
+            ending_before: float = None,
+            id_after: str = None,
+            id_before: str = None,
+            limit: int = 0,
+            batch_size: int = 100
+    ) -> Iterator[Dict[str, Any]]:
+        with self.lock:
+            documents = sorted(self.documents.items())
+        yielded = 0
+        for key, document in documents:
+            if id_after is not None and key <= str(id_after):
+                continue
+            if id_before is not None and key >= str(id_before):
+                continue
+            if ending_after is not None and not document.get('ending', float('-inf')) >= ending_after:
+                continue
+            if ending_before is not None and not document.get('ending', float('inf')) < ending_before:
+                continue
+            yield copy.deepcopy(document)
+            yielded += 1
+            if yielded == limit:
+                return
+
+    def range_by_ending(self, before: float, after: float = None, limit: int = 0) -> List[Dict[str, Any]]:
+        with self.lock:
+            documents = [
+                copy.deepcopy(document) for document in self.documents.values()
+                if document.get('ending') is not None and document['ending'] < before
+                and (after is None or document['ending'] >= after)
+            ]
+        documents.sort(key=lambda document: document['ending'])
+        return documents[:limit] if limit else documents
+
+
+class Archive(storage.ArchiveMixin, Table):
+    def __init__(self, name: str, lock: threading.RLock, cold: 'ColdArchive'):
+        super().__init__(name, lock)
+        self.cold = cold
+
+
+class ColdArchive(storage.ColdStorage, Table):
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            for _id in [_id for _id, document in self.documents.items() if document.get('expire_at', now) < now]:
+                del self.documents[_id]
+
+
+class Leases(storage.LeaseStore, Table):
+    """The ending key holds the expiry of the lease"""
+
+    def claim(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self.lock:
+            lease = self.documents.get(key)
+            if lease is not None and lease['ending'] >= now and lease['owner'] != owner:
+                return False
+            self.documents[key] = {'_id': key, 'owner': owner, 'ending': now + ttl}
+            return True
+
+    def renew(self, keys: List[str], owner: str, ttl: float) -> List[str]:
+        renewed = []
+        with self.lock:
+            for key in keys:
+                lease = self.documents.get(key)
+                if lease is not None and lease['owner'] == owner:
+                    lease['ending'] = time.time() + ttl
+                    renewed.append(key)
+        return renewed
+
+    def release(self, key: str, owner: str):
+        with self.lock:
+            if self.documents.get(key, {}).get('owner') == owner:
+                del self.documents[key]
+
+
+class Collection(Table):
+    """Same layout as utils.mongodb.Collection, held in memory"""
+
+    def __init__(self):
+        lock = threading.RLock()
+        super().__init__('WFG', lock)
+        self.archive = Archive('archived_giveaways', lock, ColdArchive('archived_giveaways_cold', lock))
+        self.dq = Table('DQs', lock)
+        self.leases = Leases('leases', lock)
+        self.guilds = Table('guild_config', lock)
+        self.winners = Table('winners', lock)
+        self.scheduled = Table('scheduled', lock)
+        self.polls = Table('polls', lock)
+        self.waits = Table('mention_waits', lock)
@@ -1,68 +1,178 @@
-import json
-from typing import Union, Dict, Any
+import time
+import datetime
+from typing import Union, Dict, Any, Iterator, List
 
 import pymongo
+from pymongo.errors import OperationFailure
 from bson.objectid import ObjectId
 
-with open(r'config.json', encoding='utf-8') as file:
-    config = json.load(file)
-    conn = config['connection_string']
+from utils import storage
+from utils.config import config
 
-class Local:
-    cluster = pymongo.MongoClient("mongodb://localhost:27017/")
-    database = cluster["discord"]
-    collection = database['WFG']
-    archive = database['archived_giveaways']
-
-
-cluster = pymongo.MongoClient(conn)
+# Only imported by utils.database when the backend is first used, so this is created lazily
+cluster = pymongo.MongoClient(config.get('connection_string'))
 class Cloud:
     cluster = cluster
     database = cluster['discord']
     collection = database['WFG']
     archive = database['archived_giveaways']
+    cold = database['archived_giveaways_cold']
     dq = database['DQs']
+    leases = database['leases']
+    guilds = database['guild_config']
+    winners = database['winners']
+    scheduled = database['scheduled']
+    polls = database['polls']
+    waits = database['mention_waits']
 
 class TestCloud:
     cluster = cluster
     database = cluster['Test']
     collection = database['WFG']
     archive = database['archived_giveaways']
+    cold = database['archived_giveaways_cold']
     dq = database['DQs']
+    leases = database['leases']
+    guilds = database['guild_config']
+    winners = database['winners']
+    scheduled = database['scheduled']
+    polls = database['polls']
+    waits = database['mention_waits']
+
+class UnitOfWork(storage.UnitOfWork):
+    """Collects writes across collections and commits them together
+
+    Commits in a transaction when the deployment supports it (replica set or sharded cluster),
+    otherwise falls back to one unordered bulk write per collection.
+    """
+    # Set to False after the server rejects a transaction, skips the failing attempt on later commits
+    transactions_supported = True
+
+    def __init__(self, cluster: pymongo.MongoClient):
+        self.cluster = cluster
+        self.operations = {}  # pymongo collection -> list of write models
+
+    def __queue__(self, collection: 'Collection', operation):
+        self.operations.setdefault(collection.collection, []).append(operation)
+        return self
 
-class Collection:
+    def insert(self, collection: 'Collection', document: Dict[str, Any]) -> 'UnitOfWork':
+        return self.__queue__(collection, pymongo.InsertOne(document))
+
+    def update(self, collection: 'Collection', _id, document: Dict[str, Any]) -> 'UnitOfWork':
+        return self.__queue__(collection, pymongo.ReplaceOne({'_id': _id}, document, upsert=True))
+
+    def append(self, collection: 'Collection', _id, dict_: Dict[str, Any]) -> 'UnitOfWork':
+        return self.__queue__(collection, pymongo.UpdateOne({'_id': _id}, {'$set': dict_}))
+
+    def delete(self, collection: 'Collection', _id) -> 'UnitOfWork':
+        return self.__queue__(collection, pymongo.DeleteOne({'_id': str(_id)}))
+
+    def __write__(self, session=None):
+        for collection, operations in self.operations.items():
+            collection.bulk_write(operations, ordered=session is not None, session=session)
+
+    def commit(self):
+        """Writes every collected operation, returns once the server acknowledged all of them"""
+        if not self.operations:
+            return
+        if UnitOfWork.transactions_supported:
+            try:
+                with self.cluster.start_session() as session:
+                    session.with_transaction(self.__write__)
+                return
+            except OperationFailure as error:
+                if error.code != 20:  # IllegalOperation: standalone server without transactions
+                    raise
+                UnitOfWork.transactions_supported = False
+        self.__write__()
+
+
+class Collection(storage.Backend):
     def __init__(self, instance):
+        self.cluster = instance.cluster
         self.collection = instance.collection
-        self.archive = Archive(instance.archive)
-        self.dq = Dq(instance.dq)
+        self.archive = Archive(self.cluster, instance.archive, instance.cold)
+        self.dq = Dq(self.cluster, instance.dq)
+        self.leases = Leases(self.cluster, instance.leases)
+        self.guilds = SubCollection(self.cluster, instance.guilds)
+        self.winners = SubCollection(self.cluster, instance.winners)
+        self.scheduled = SubCollection(self.cluster, instance.scheduled)
+        self.polls = SubCollection(self.cluster, instance.polls)
+        self.waits = SubCollection(self.cluster, instance.waits)
+
+    @property
+    def name(self) -> str:
+        return self.collection.name
+
+    def unit_of_work(self) -> UnitOfWork:
+        """Returns a UnitOfWork for writing to several collections in one commit"""
+        return UnitOfWork(self.cluster)
+
+    def ping(self):
+        self.cluster.admin.command('ping')
+
+    def get(self, _id: Union[int, str, ObjectId]):
+        return self.collection.find_one({'_id': _id})
 
     def delete(self, message_id: Union[int, ObjectId]):
         """Deletes a document by _id"""
         return self.collection.delete_one({'_id': str(message_id)})
 
+    def delete_many(self, ids: List[Any]):
+        return self.collection.delete_many({'_id': {'$in': ids}})
+
     def truncate(self):
         """Clears the collection"""
         return self.collection.delete_many({})
 
-    def find(self, _id: Union[int, str, ObjectId, None], return_cursor=False):
-        """
+    def ids(self, field: str = None) -> Iterator[Any]:
+        projection = {'_id': True}
+        if field is not None:
+            projection[field] = True
+        for document in self.collection.find({}, projection):
+            yield document['_id'] if field is None else (document['_id'], document.get(field))
 
-        :param _id: Searches document by _id, returns whole document if _id is None
-        :param return_cursor:
-        :return:
-        """
-        if _id is None:
-            results = self.collection.find({})
-            return [result for result in results] if return_cursor else results
-        return self.collection.find_one({'_id': _id})
+    def stream(
+            self,
+            ending_after: float = None,
+            ending_before: float = None,
+            id_after: str = None,
+            id_before: str = None,
+            limit: int = 0,
+            batch_size: int = 100
+    ) -> Iterator[Dict[str, Any]]:
+        query = {}
+        if ending_after is not None or ending_before is not None:
+            query['ending'] = {}
+            if ending_after is not None:
+                query['ending']['$gte'] = ending_after
+            if ending_before is not None:
+                query['ending']['$lt'] = ending_before
+        if id_after is not None or id_before is not None:
+            query['_id'] = {}
+            if id_after is not None:
+                query['_id']['$gt'] = id_after
+            if id_before is not None:
+                query['_id']['$lt'] = id_before
+        cursor = self.collection.find(query).sort('_id', pymongo.ASCENDING).batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        with cursor:
+            yield from cursor
+
+    def range_by_ending(self, before: float, after: float = None, limit: int = 0) -> List[Dict[str, Any]]:
+        query = {'$lt': before}
+        if after is not None:
+            query['$gte'] = after
+        return list(self.collection.find({'ending': query}).sort('ending', pymongo.ASCENDING).limit(limit))
 
     def insert(self, _id: Union[int, str, ObjectId, dict], dict_: Dict[str, Any] = None):
-        if type(_id) == dict:
-            return self.collection.insert_one(_id)
-        return self.collection.insert_one({
-            '_id': _id,
-            **dict_
-        })
+        document = _id if type(_id) == dict else {'_id': _id, **dict_}
+        try:
+            return self.collection.insert_one(document)
+        except pymongo.errors.DuplicateKeyError as error:
+            raise storage.DuplicateKeyError(str(error)) from error
 
     def append(self, _id: int, dict_: Dict[str, Any]):
         return self.collection.update_one({'_id': _id}, {'$set': dict_})
@@ -70,19 +180,81 @@ class Collection:
     def update(self, _id: int, dict_: Dict[str, Any]):
         return self.collection.replace_one({'_id': _id}, dict_, upsert=True)
 
-class Archive(Collection):
-    def __init__(self, collection):
-        self.collection = collection
+    def upsert_many(self, documents: List[Dict[str, Any]]):
+        if documents:
+            return self.collection.bulk_write(
+                [pymongo.ReplaceOne({'_id': document['_id']}, document, upsert=True) for document in documents],
+                ordered=False
+            )
 
-class Dq(Collection):
-    def __init__(self, collection):
+    def bulk_update(self, pending: Dict[Any, Dict[str, Any]]):
+        """Writes changes coalesced by WriteBehind in one unordered bulk write"""
+        operations = []
+        for _id, entry in pending.items():
+            if entry['replace'] is not None:
+                operations.append(pymongo.ReplaceOne({'_id': _id}, entry['replace'], upsert=True))
+                continue
+            update = {}
+            if entry['set']:
+                update['$set'] = entry['set']
+            if entry['inc']:
+                update['$inc'] = entry['inc']
+            if update:
+                operations.append(pymongo.UpdateOne({'_id': _id}, update))
+        if operations:
+            return self.collection.bulk_write(operations, ordered=False)
+
+class SubCollection(Collection):
+    def __init__(self, cluster, collection):
+        self.cluster = cluster
         self.collection = collection
 
+class Archive(storage.ArchiveMixin, SubCollection):
+    def __init__(self, cluster, collection, cold):
+        super().__init__(cluster, collection)
+        self.cold = ColdArchive(cluster, cold)
+
+class ColdArchive(storage.ColdStorage, SubCollection):
+    def upsert_many(self, documents: List[Dict[str, Any]]):
+        """TTL indexes only work on dates, converts expire_at from unix timestamp"""
+        for document in documents:
+            if isinstance(document.get('expire_at'), (int, float)):
+                document['expire_at'] = datetime.datetime.fromtimestamp(
+                    document['expire_at'], tz=datetime.timezone.utc
+                )
+        return super().upsert_many(documents)
+
+    def expire(self):
+        """Lets the server expire compacted documents once their expire_at passes"""
+        return self.collection.create_index('expire_at', expireAfterSeconds=0)
+
+class Dq(SubCollection):
+    pass
+
+class Leases(storage.LeaseStore, SubCollection):
+    def claim(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        query = {'_id': key, '$or': [{'ending': {'$lt': now}}, {'owner': owner}]}
+        try:
+            self.collection.update_one(query, {'$set': {'owner': owner, 'ending': now + ttl}}, upsert=True)
+        except pymongo.errors.DuplicateKeyError:  # Upsert collided with a lease held by someone else
+            return False
+        return True
+
+    def renew(self, keys: List[str], owner: str, ttl: float) -> List[str]:
+        if not keys:
+            return []
+        query = {'_id': {'$in': list(keys)}, 'owner': owner}
+        self.collection.update_many(query, {'$set': {'ending': time.time() + ttl}})
+        return [document['_id'] for document in self.collection.find(query, {'_id': True})]
+
+    def release(self, key: str, owner: str):
+        return self.collection.delete_one({'_id': key, 'owner': owner})
+
 instance = {
     'test': TestCloud,
     'production': Cloud
-}[config['db_instance']]
-collection = Collection(instance)
+}.get(config['db_instance'], Cloud)
 
 if __name__ == '__main__':
     collection = Collection(TestCloud)
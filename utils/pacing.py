@@ -0,0 +1,44 @@
+import time
+import asyncio
+import collections
+from typing import Deque, Dict, Hashable
+
+
+class RateLimiter:
+    """Allows at most `rate` calls per `period` seconds per bucket (e.g. a channel), over a sliding window
+
+    Keeps batches of requests to one channel under its rate limit instead of relying on 429 retries.
+
+    Example:
+        sends = RateLimiter(rate=5, period=5)
+        await sends.wait(channel.id)
+        await channel.send(...)
+    """
+
+    def __init__(self, rate: int = 5, period: float = 5):
+        self.rate = rate
+        self.period = period
+        self.__calls: Dict[Hashable, Deque[float]] = {}
+
+    def slot(self, bucket: Hashable, now: float = None) -> float:
+        """Earliest time.monotonic() the bucket allows another call"""
+        now = time.monotonic() if now is None else now
+        calls = self.__calls.setdefault(bucket, collections.deque())
+        while calls and calls[0] <= now - self.period:
+            calls.popleft()
+        if len(calls) < self.rate:
+            return now
+        return calls[0] + self.period
+
+    def record(self, bucket: Hashable, now: float = None):
+        """Counts a call made in the bucket"""
+        self.__calls.setdefault(bucket, collections.deque()).append(time.monotonic() if now is None else now)
+
+    async def wait(self, bucket: Hashable):
+        """Waits until the bucket allows another call and counts it"""
+        while True:
+            now = time.monotonic()
+            slot = self.slot(bucket, now)
+            if slot <= now:
+                return self.record(bucket, now)
+            await asyncio.sleep(slot - now)
@@ -1,18 +1,10 @@
 import re
-import json
-from typing import Union, List
+from typing import Union, List, Dict, Iterable
 
 from discord.ext import commands
 
 from utils import errors
-
-if __name__ == '__main__':
-    import os.path
-    with open(os.path.dirname(__file__) + '/../config.json', encoding='utf-8') as file:
-        config = json.load(file)
-else:
-    with open('config.json', encoding='utf-8') as file:
-        config = json.load(file)
+from utils.config import config
 
 
 class IncorrectCommandFormat(Exception):
@@ -79,6 +71,29 @@ def get_args(content: str,
     return output
 
 
+def split_args(args: str, return_length: int, arg_delimiter: str = config['arg_delimiter']) -> List[str]:
+    """Splits arguments without a command in front, e.g. one line of a bulk command, padded to return_length"""
+    output = [arg.strip(' \t') for arg in args.split(arg_delimiter)][:return_length]
+    return output + ['' for _ in range(return_length - len(output))]
+
+
+def get_weights(values: Iterable[str]) -> Dict[int, float]:
+    """Parses `role=weight` pairs, roles as ids or mentions, `none` for no weights"""
+    weights = {}
+    for value in values:
+        if value.lower() == 'none':
+            continue
+        role, _, weight = value.partition('=')
+        try:
+            role_id, weight = int(role.strip('<@&>')), float(weight)
+        except ValueError:
+            raise errors.InvalidArgument(f'Role weights must look like `@Role=2` or `role_id=2`, got `{value}`')
+        if weight < 0:
+            raise errors.InvalidArgument(f'Role weights must not be negative, got `{value}`')
+        weights[role_id] = weight
+    return weights
+
+
 if __name__ == "__main__":
     print(get_args('''g-start 10s ; 1w ; PC | R3764
 Vulkar vexi-critacan ; 
@@ -0,0 +1,48 @@
+from typing import Dict, Any, List, Optional
+
+MAX_OPTIONS = 25  # buttons on one message
+MAX_OPTION_LENGTH = 80  # button label
+
+
+class Poll:
+    """Votes of an open poll kept in memory, one vote per user
+
+    votes maps user id to the index of the option voted for, counts per option are kept alongside
+    so rendering the results doesn't walk every vote. `changes` counts votes since the poll was opened,
+    compare it with `checkpointed` to know if the stored votes are behind.
+    """
+
+    def __init__(self, document: Dict[str, Any]):
+        self.document = document
+        self.votes: Dict[int, int] = {}
+        self.counts = [0 for _ in document['options']]
+        for user_id, option in document.get('votes', {}).items():
+            if 0 <= option < len(self.counts):
+                self.votes[int(user_id)] = option
+                self.counts[option] += 1
+        self.changes = 0
+        self.checkpointed = 0
+        self.shown: Optional[List[int]] = None  # counts on the embed
+
+    @property
+    def id(self) -> str:
+        return self.document['_id']
+
+    def vote(self, user_id: int, option: int) -> Optional[int]:
+        """Records a user's vote, voting for the same option again takes it back
+
+        :return: index of the option the user now votes for, None if the vote was taken back
+        """
+        previous = self.votes.pop(user_id, None)
+        if previous is not None:
+            self.counts[previous] -= 1
+        self.changes += 1
+        if previous == option:
+            return None
+        self.votes[user_id] = option
+        self.counts[option] += 1
+        return option
+
+    def snapshot(self) -> Dict[str, int]:
+        """Votes as they are stored, user ids as strings"""
+        return {str(user_id): option for user_id, option in self.votes.items()}
@@ -0,0 +1,73 @@
+import math
+import re
+import time
+from typing import Tuple
+
+from utils import errors
+from utils import template
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+DAY = 86400
+WEEK = 7 * DAY
+
+
+def parse(expression: str, now: float = None) -> Tuple[int, int]:
+    """Parses when a recurring giveaway is posted, times are in UTC
+
+    Accepts `every monday 18:00`, `every fri 18:00`, `every day 6:30 UTC`
+    or `every 12h` (first post one period from now)
+    :return: (unix timestamp of the first post, seconds between posts)
+    """
+    now = time.time() if now is None else now
+    words = expression.lower().replace(' utc', '').split()
+    if len(words) < 2 or words[0] != 'every':
+        raise errors.InvalidArgument(
+            f'Recurrence must look like `every monday 18:00`, `every day 18:00` or `every 12h`, got `{expression}`'
+        )
+    if len(words) == 2:
+        period = template.to_seconds(words[1])
+        if period < 3600:
+            raise errors.InvalidArgument('Recurring giveaways can be posted at most once an hour')
+        return int(now + period), period
+
+    day, clock = words[1], words[2]
+    weekday = next((i for i, name in enumerate(WEEKDAYS) if len(day) >= 3 and name.startswith(day)), None)
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', clock)
+    if (day != 'day' and weekday is None) or match is None or int(match[1]) > 23 or int(match[2]) > 59:
+        raise errors.InvalidArgument(
+            f'Recurrence must look like `every monday 18:00` or `every day 18:00`, got `{expression}`'
+        )
+    seconds_of_day = int(match[1]) * 3600 + int(match[2]) * 60
+    if day == 'day':
+        first = now - now % DAY + seconds_of_day
+        return next_run(first, DAY, now) if first <= now else int(first), DAY
+    # 1970-01-01 was a thursday
+    monday = now - (now - 4 * DAY) % WEEK
+    first = monday + weekday * DAY + seconds_of_day
+    return next_run(first, WEEK, now) if first <= now else int(first), WEEK
+
+
+def parse_at(value: str, now: float = None) -> int:
+    """Parses when a scheduled giveaway is posted: a unix timestamp, `<t:1792432800:f>` or a duration from now"""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r'<t:(\d+)(:\w)?>|(\d{10,})', value.strip())
+    at = int(match[1] or match[3]) if match else int(now + template.to_seconds(value.strip()))
+    if at <= now:
+        raise errors.InvalidArgument(f'Scheduled giveaways must be posted in the future, got <t:{at}:f>')
+    return at
+
+
+def next_run(previous: float, period: float, now: float = None) -> int:
+    """First run after now, runs missed while the bot was offline are skipped"""
+    now = time.time() if now is None else now
+    return int(previous + period * max(1, math.floor((now - previous) / period) + 1))
+
+
+def describe(period: int = None) -> str:
+    if not period:
+        return 'once'
+    if period == WEEK:
+        return 'weekly'
+    if period == DAY:
+        return 'daily'
+    return f'every {period // 3600}h'
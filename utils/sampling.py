@@ -0,0 +1,45 @@
+"""Weighted sampling without replacement (Efraimidis-Spirakis)
+
+Every item gets the key log(u) / weight with u uniform in (0, 1], the k largest keys are the sample.
+Keys are computed in bulk with NumPy when it is installed, with the random module otherwise.
+"""
+import math
+import heapq
+import random
+from typing import List, Sequence
+
+try:
+    import numpy
+except ImportError:  # optional, only makes large weighted draws faster
+    numpy = None
+
+
+def weighted_sample(weights: Sequence[float], k: int) -> List[int]:
+    """Picks k distinct indices, each one with probability proportional to its weight
+
+    Indices with a weight of 0 or less are never picked, fewer than k are returned if there aren't enough.
+    The result is in draw order, the first index is the one that would have been picked for k=1.
+    """
+    if k <= 0 or not len(weights):
+        return []
+    if numpy is not None:
+        return __numpy_sample__(weights, k)
+    keys = []
+    for index, weight in enumerate(weights):
+        if weight > 0:
+            keys.append((math.log(1.0 - random.random()) / weight, index))
+    return [index for _, index in heapq.nlargest(k, keys)]
+
+
+def __numpy_sample__(weights: Sequence[float], k: int) -> List[int]:
+    weights = numpy.asarray(weights, dtype=numpy.float64)
+    candidates = numpy.flatnonzero(weights > 0)
+    if candidates.size == 0:
+        return []
+    # seeded from the random module so random.seed() makes draws reproducible either way
+    generator = numpy.random.default_rng(random.getrandbits(64))
+    keys = numpy.log1p(-generator.random(candidates.size)) / weights[candidates]
+    k = min(k, candidates.size)
+    top = numpy.argpartition(-keys, k - 1)[:k]
+    top = top[numpy.argsort(-keys[top])]
+    return candidates[top].tolist()
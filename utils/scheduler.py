@@ -0,0 +1,100 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import collections
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class DeadlineScheduler:
+    """Runs jobs at their deadline (unix timestamp), at most one pending job per key
+
+    Jobs are kept in a heap ordered by deadline and a single task sleeps until the earliest one.
+    Rescheduling a key pushes a new heap entry and invalidates the old one, so schedule() and cancel()
+    are O(log n) and a job never runs twice for one schedule.
+
+    Example:
+        scheduler.schedule(f'giveaway:{_id}', ending, lambda: self.end_giveaway(document))
+    """
+
+    def __init__(self):
+        self.jobs: Dict[Hashable, Tuple[float, int, Callable[[], Awaitable[Any]]]] = {}
+        self.running: Dict[Hashable, asyncio.Task] = {}
+        self.lateness: Deque[float] = collections.deque(maxlen=1000)  # seconds jobs started after their deadline
+        self.closed = False
+        self.__heap: List[Tuple[float, int, Hashable]] = []
+        self.__versions = itertools.count()
+        self.__wake = asyncio.Event()
+        self.__task = None
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.jobs
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        job = self.jobs.get(key)
+        return job[0] if job is not None else None
+
+    def schedule(self, key: Hashable, deadline: float, job: Callable[[], Awaitable[Any]]):
+        """Runs job() at deadline, replacing the pending job of key if there is one"""
+        current = self.jobs.get(key)
+        if current is not None and current[0] == deadline:
+            self.jobs[key] = (deadline, current[1], job)
+            return
+        version = next(self.__versions)
+        self.jobs[key] = (deadline, version, job)
+        heapq.heappush(self.__heap, (deadline, version, key))
+        if self.__heap[0][1] == version:  # new earliest deadline, the runner has to wake up sooner
+            self.__wake.set()
+        if not self.closed and (self.__task is None or self.__task.done()):
+            self.__task = asyncio.create_task(self.__run__())
+
+    def cancel(self, key: Hashable) -> bool:
+        """Removes the pending job of key, returns whether there was one"""
+        return self.jobs.pop(key, None) is not None
+
+    def __pop_stale(self):
+        while self.__heap:
+            deadline, version, key = self.__heap[0]
+            job = self.jobs.get(key)
+            if job is not None and job[1] == version:
+                return
+            heapq.heappop(self.__heap)
+
+    async def __run__(self):
+        while True:
+            self.__pop_stale()
+            self.__wake.clear()
+            if not self.__heap:
+                await self.__wake.wait()
+                continue
+            delay = self.__heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.__wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            deadline, _, key = heapq.heappop(self.__heap)
+            _, _, job = self.jobs.pop(key)
+            self.lateness.append(time.time() - deadline)
+            self.running[key] = asyncio.create_task(self.__invoke__(key, job))
+
+    async def __invoke__(self, key: Hashable, job: Callable[[], Awaitable[Any]]):
+        try:
+            await job()
+        except Exception:
+            logging.getLogger(__name__).exception(f'Scheduled job {key} failed')
+        finally:
+            if self.running.get(key) is asyncio.current_task():
+                del self.running[key]
+
+    async def close(self):
+        """Stops running jobs at their deadline, pending jobs are kept and running ones continue"""
+        self.closed = True
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
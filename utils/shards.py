@@ -0,0 +1,64 @@
+import time
+from collections import deque
+from typing import Dict, Set, Iterable, Tuple, Deque, Optional
+
+
+def shard_of(guild_id: int, shard_count: Optional[int]) -> int:
+    """Shard a guild's events are received on, see Discord's sharding formula"""
+    return (int(guild_id) >> 22) % (shard_count or 1)
+
+
+def guild_of(document: dict) -> int:
+    """Guild id of a giveaway document, from its server_id/channel_id/message_id path"""
+    return int(document['path'].split('/')[0])
+
+
+class ShardIndex:
+    """A set of ids partitioned by the shard of the guild they belong to
+
+    Lookups only touch the partition of the event's shard, and a process only loads the shards it owns.
+    """
+
+    def __init__(self):
+        self.partitions: Dict[int, Set[str]] = {}
+
+    def add(self, shard_id: int, id_: str):
+        self.partitions.setdefault(shard_id, set()).add(id_)
+
+    def contains(self, shard_id: int, id_: str) -> bool:
+        partition = self.partitions.get(shard_id)
+        return partition is not None and id_ in partition
+
+    def discard(self, ids: Iterable[str]):
+        ids = set(ids)
+        for partition in self.partitions.values():
+            partition.difference_update(ids)
+
+    def sizes(self) -> Dict[int, int]:
+        return {shard_id: len(partition) for shard_id, partition in self.partitions.items()}
+
+
+class ShardMetrics:
+    """Per-shard event counters over a sliding window of `window` seconds, kept in one second buckets"""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self.buckets: Dict[int, Deque[Tuple[int, int]]] = {}  # shard id -> (second, events) oldest first
+        self.totals: Dict[int, int] = {}
+
+    def record(self, shard_id: int):
+        now = int(time.monotonic())
+        buckets = self.buckets.setdefault(shard_id, deque())
+        if buckets and buckets[-1][0] == now:
+            buckets[-1] = (now, buckets[-1][1] + 1)
+        else:
+            buckets.append((now, 1))
+            while buckets[0][0] <= now - self.window:
+                buckets.popleft()
+        self.totals[shard_id] = self.totals.get(shard_id, 0) + 1
+
+    def rate(self, shard_id: int) -> float:
+        """Events per second on a shard over the window"""
+        buckets = self.buckets.get(shard_id, ())
+        cutoff = int(time.monotonic()) - self.window
+        return sum(count for second, count in buckets if second > cutoff) / self.window
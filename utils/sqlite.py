@@ -0,0 +1,289 @@
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+from typing import Union, Dict, Any, Iterator, List
+
+from utils import storage
+
+
+class Database:
+    """A SQLite file shared by every table, safe to use from asyncio.to_thread workers
+
+    Runs in WAL mode so readers don't block the writer, statements are cached by the sqlite3 module
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path,
+            timeout=30,
+            isolation_level=None,  # transactions are managed by self.transaction()
+            check_same_thread=False,
+            cached_statements=256
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.RLock()
+        self.__depth = 0
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs the block in a write transaction, nested blocks join the outermost one"""
+        with self.lock:
+            if self.__depth == 0:
+                self.connection.execute('BEGIN IMMEDIATE')
+            self.__depth += 1
+            try:
+                yield self.connection
+            except BaseException:
+                self.__depth -= 1
+                if self.__depth == 0:
+                    self.connection.execute('ROLLBACK')
+                raise
+            self.__depth -= 1
+            if self.__depth == 0:
+                self.connection.execute('COMMIT')
+
+    def read(self, sql: str, parameters=()) -> List[tuple]:
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class UnitOfWork(storage.UnitOfWork):
+    """Collects writes across tables and commits them in one SQLite transaction"""
+
+    def __init__(self, database: Database):
+        self.database = database
+        self.operations = []
+
+    def insert(self, collection: 'Table', document: Dict[str, Any]) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.insert(document))
+        return self
+
+    def update(self, collection: 'Table', _id, document: Dict[str, Any]) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.update(_id, document))
+        return self
+
+    def append(self, collection: 'Table', _id, dict_: Dict[str, Any]) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.append(_id, dict_))
+        return self
+
+    def delete(self, collection: 'Table', _id) -> 'UnitOfWork':
+        self.operations.append(lambda: collection.delete(_id))
+        return self
+
+    def commit(self):
+        with self.database.transaction():
+            for operation in self.operations:
+                operation()
+
+
+class Table(storage.Backend):
+    """Documents stored as JSON, with _id and ending extracted into indexed columns"""
+
+    def __init__(self, database: Database, name: str):
+        self.database = database
+        self.name = name
+        table = f'"{name}"'
+        with database.transaction() as connection:
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} (_id TEXT PRIMARY KEY, ending REAL, document TEXT NOT NULL)'
+            )
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}_ending" ON {table} (ending)')
+        # Built once so every call reuses the same cached prepared statement
+        self.sql_get = f'SELECT document FROM {table} WHERE _id = ?'
+        self.sql_insert = f'INSERT INTO {table} (_id, ending, document) VALUES (?, ?, ?)'
+        self.sql_upsert = f'INSERT OR REPLACE INTO {table} (_id, ending, document) VALUES (?, ?, ?)'
+        self.sql_update = f'UPDATE {table} SET ending = ?, document = ? WHERE _id = ?'
+        self.sql_delete = f'DELETE FROM {table} WHERE _id = ?'
+        self.sql_truncate = f'DELETE FROM {table}'
+        self.sql_ids = f'SELECT _id FROM {table} WHERE _id > ? ORDER BY _id LIMIT ?'
+        self.sql_ids_field = f'SELECT _id, json_extract(document, ?) FROM {table} WHERE _id > ? ORDER BY _id LIMIT ?'
+        self.sql_range = f'SELECT document FROM {table} WHERE ending >= ? AND ending < ? ORDER BY ending LIMIT ?'
+        self.sql_stream = f'SELECT _id, document FROM {table} ' \
+                          f'WHERE _id > ? AND _id < ? AND ending >= ? AND ending < ? ORDER BY _id LIMIT ?'
+        self.sql_stream_all = f'SELECT _id, document FROM {table} WHERE _id > ? AND _id < ? ORDER BY _id LIMIT ?'
+
+    @staticmethod
+    def __row__(document: Dict[str, Any]) -> tuple:
+        return str(document['_id']), document.get('ending'), json.dumps(document, ensure_ascii=False)
+
+    def unit_of_work(self) -> UnitOfWork:
+        return UnitOfWork(self.database)
+
+    def ping(self):
+        self.database.read('SELECT 1')
+
+    def get(self, _id):
+        rows = self.database.read(self.sql_get, (str(_id),))
+        return json.loads(rows[0][0]) if rows else None
+
+    def insert(self, _id: Union[int, str, dict], dict_: Dict[str, Any] = None):
+        document = _id if type(_id) == dict else {'_id': _id, **dict_}
+        try:
+            with self.database.transaction() as connection:
+                connection.execute(self.sql_insert, self.__row__(document))
+        except sqlite3.IntegrityError as error:
+            raise storage.DuplicateKeyError(str(error)) from error
+
+    def delete(self, message_id: Union[int, str]):
+        with self.database.transaction() as connection:
+            connection.execute(self.sql_delete, (str(message_id),))
+
+    def delete_many(self, ids: List[Any]):
+        with self.database.transaction() as connection:
+            connection.executemany(self.sql_delete, [(str(_id),) for _id in ids])
+
+    def truncate(self):
+        with self.database.transaction() as connection:
+            connection.execute(self.sql_truncate)
+
+    def append(self, _id, dict_: Dict[str, Any]):
+        with self.database.transaction():
+            document = self.get(_id)
+            if document is None:
+                return
+            document.update(dict_)
+            self.__write__(document)
+
+    def __write__(self, document: Dict[str, Any]):
+        _id, ending, serialised = self.__row__(document)
+        self.database.connection.execute(self.sql_update, (ending, serialised, _id))
+
+    def update(self, _id, dict_: Dict[str, Any]):
+        with self.database.transaction() as connection:
+            connection.execute(self.sql_upsert, self.__row__({**dict_, '_id': _id}))
+
+    def upsert_many(self, documents: List[Dict[str, Any]]):
+        with self.database.transaction() as connection:
+            connection.executemany(self.sql_upsert, [self.__row__(document) for document in documents])
+
+    def bulk_update(self, pending: Dict[Any, Dict[str, Any]]):
+        with self.database.transaction() as connection:
+            for _id, entry in pending.items():
+                if entry['replace'] is not None:
+                    connection.execute(self.sql_upsert, self.__row__({**entry['replace'], '_id': _id}))
+                    continue
+                document = self.get(_id)
+                if document is None:
+                    continue
+                document.update(entry['set'])
+                for key, amount in entry['inc'].items():
+                    document[key] = document.get(key, 0) + amount
+                self.__write__(document)
+
+    def ids(self, field: str = None) -> Iterator[Any]:
+        last = ''
+        while True:
+            if field is None:
+                rows = self.database.read(self.sql_ids, (last, 1000))
+            else:
+                rows = self.database.read(self.sql_ids_field, (f'$.{field}', last, 1000))
+            for row in rows:
+                yield row[0] if field is None else row
+            if len(rows) < 1000:
+                return
+            last = rows[-1][0]
+
+    def stream(
+            self,
+            ending_after: float = None,
+            ending_before: float = None,
+            id_after: str = None,
+            id_before: str = None,
+            limit: int = 0,
+            batch_size: int = 100
+    ) -> Iterator[Dict[str, Any]]:
+        # Keyset pagination, the lock is only held while a batch is read
+        last = '' if id_after is None else str(id_after)
+        upper = '\U0010ffff' if id_before is None else str(id_before)
+        remaining = limit or -1
+        while remaining:
+            size = batch_size if remaining < 0 else min(batch_size, remaining)
+            if ending_after is None and ending_before is None:
+                rows = self.database.read(self.sql_stream_all, (last, upper, size))
+            else:
+                rows = self.database.read(self.sql_stream, (
+                    last, upper,
+                    float('-inf') if ending_after is None else ending_after,
+                    float('inf') if ending_before is None else ending_before,
+                    size
+                ))
+            for _, document in rows:
+                yield json.loads(document)
+            if len(rows) < size:
+                return
+            last = rows[-1][0]
+            remaining -= len(rows) if remaining > 0 else 0
+
+    def range_by_ending(self, before: float, after: float = None, limit: int = 0) -> List[Dict[str, Any]]:
+        rows = self.database.read(self.sql_range, (
+            float('-inf') if after is None else after, before, limit or -1
+        ))
+        return [json.loads(row[0]) for row in rows]
+
+
+class Archive(storage.ArchiveMixin, Table):
+    def __init__(self, database: Database, name: str, cold: 'ColdArchive'):
+        super().__init__(database, name)
+        self.cold = cold
+
+
+class ColdArchive(storage.ColdStorage, Table):
+    def expire(self):
+        """SQLite has no TTL indexes, deletes expired documents whenever the archive is compacted"""
+        with self.database.transaction() as connection:
+            connection.execute(
+                f'DELETE FROM "{self.name}" WHERE json_extract(document, \'$.expire_at\') < ?', (time.time(),)
+            )
+
+
+class Leases(storage.LeaseStore, Table):
+    """The ending column holds the expiry of the lease"""
+
+    def __init__(self, database: Database, name: str):
+        super().__init__(database, name)
+        table = f'"{name}"'
+        self.sql_claim = f'INSERT INTO {table} (_id, ending, document) VALUES (?, ?, ?) ' \
+                         f'ON CONFLICT(_id) DO UPDATE SET ending = excluded.ending, document = excluded.document ' \
+                         f'WHERE ending < ? OR json_extract(document, \'$.owner\') = ?'
+        self.sql_renew = f'UPDATE {table} SET ending = ? WHERE _id = ? AND json_extract(document, \'$.owner\') = ?'
+        self.sql_release = f'DELETE FROM {table} WHERE _id = ? AND json_extract(document, \'$.owner\') = ?'
+
+    def claim(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        row = self.__row__({'_id': key, 'owner': owner, 'ending': now + ttl})
+        with self.database.transaction() as connection:
+            return connection.execute(self.sql_claim, (*row, now, owner)).rowcount == 1
+
+    def renew(self, keys: List[str], owner: str, ttl: float) -> List[str]:
+        expires = time.time() + ttl
+        with self.database.transaction() as connection:
+            return [key for key in keys if connection.execute(self.sql_renew, (expires, key, owner)).rowcount == 1]
+
+    def release(self, key: str, owner: str):
+        with self.database.transaction() as connection:
+            connection.execute(self.sql_release, (key, owner))
+
+
+class Collection(Table):
+    """Same layout as utils.mongodb.Collection, active giveaways with archive and dq as attributes"""
+
+    def __init__(self, path: str):
+        database = Database(path)
+        super().__init__(database, 'WFG')
+        self.archive = Archive(
+            database, 'archived_giveaways', ColdArchive(database, 'archived_giveaways_cold')
+        )
+        self.dq = Table(database, 'DQs')
+        self.leases = Leases(database, 'leases')
+        self.guilds = Table(database, 'guild_config')
+        self.winners = Table(database, 'winners')
+        self.scheduled = Table(database, 'scheduled')
+        self.polls = Table(database, 'polls')
+        self.waits = Table(database, 'mention_waits')
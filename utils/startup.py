@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import traceback
+from typing import Callable, Coroutine, Dict, Iterable, Any, List, Tuple
+
+from discord.ext import commands
+
+from utils import timing
+
+
+class ResourceFailed(Exception):
+    """Raised when a resource an extension requires could not be resolved"""
+
+
+class Orchestrator:
+    """Loads extensions concurrently, each one as soon as the resources it requires are available
+
+    Resources are named values produced once by an async provider, e.g. the log channel or the DQ role.
+    The built-in resource 'ready' resolves when the bot is ready (guilds and members cached),
+    extensions that don't require it are registered before READY.
+    Resolved values are stored in bot.resources, per stage timings in utils.timing.
+
+    Example:
+        orchestrator = Orchestrator(bot)
+
+        @orchestrator.resource('log_channel')
+        async def log_channel(bot):
+            return await template.get_channel(bot, config['log_channel_id'])
+
+        orchestrator.extension('cogs.giveaways', requires=('log_channel',))
+        await orchestrator.run()
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        if not hasattr(bot, 'resources'):
+            bot.resources = {}
+        self.providers: Dict[str, Tuple[Callable[..., Coroutine], Tuple[str, ...]]] = {
+            'ready': (self.__wait_until_ready__, ())
+        }
+        self.extensions: Dict[str, Tuple[str, ...]] = {}
+        self.futures: Dict[str, asyncio.Task] = {}
+        self.failed: List[Tuple[str, BaseException]] = []
+
+    @staticmethod
+    async def __wait_until_ready__(bot: commands.Bot):
+        await bot.wait_until_ready()
+        return True
+
+    def resource(self, name: str, requires: Iterable[str] = ()):
+        """Decorator registering an async provider, called with the bot once `requires` are resolved"""
+        def decorator(function: Callable[..., Coroutine]):
+            self.providers[name] = (function, tuple(requires))
+            return function
+        return decorator
+
+    def extension(self, name: str, requires: Iterable[str] = ()):
+        """Registers an extension to be loaded once `requires` are resolved"""
+        self.extensions[name] = tuple(requires)
+
+    async def get(self, name: str) -> Any:
+        """Returns the value of a resource, resolving it (once) if needed"""
+        if name not in self.futures:
+            if name not in self.providers:
+                raise KeyError(f'No provider registered for resource {name!r}')
+            self.futures[name] = asyncio.create_task(self.__resolve__(name))
+        return await self.futures[name]
+
+    async def __resolve__(self, name: str) -> Any:
+        function, requires = self.providers[name]
+        await self.__require__(f'resource {name!r}', requires)
+        try:
+            value = await function(self.bot)
+        except Exception as error:
+            self.__fail__(f'resource {name!r}', error)
+            raise ResourceFailed(f'resource {name!r} failed: {error!r}') from error
+        self.bot.resources[name] = value
+        timing.mark(f'resource:{name}')
+        return value
+
+    async def __require__(self, dependant: str, requires: Iterable[str]):
+        results = await asyncio.gather(*(self.get(name) for name in requires), return_exceptions=True)
+        for name, result in zip(requires, results):
+            if isinstance(result, BaseException):
+                raise ResourceFailed(f'{dependant} requires {name!r} which failed') from result
+
+    async def __load__(self, name: str):
+        try:
+            await self.__require__(f'extension {name!r}', self.extensions[name])
+            await self.bot.load_extension(name)
+        except ResourceFailed as error:
+            self.failed.append((name, error))
+            logging.getLogger(__name__).error(str(error))
+            return
+        except Exception as error:
+            self.__fail__(f'extension {name!r}', error)
+            return
+        timing.mark(f'cog:{name}')
+
+    def __fail__(self, what: str, error: BaseException):
+        self.failed.append((what, error))
+        logging.getLogger(__name__).error(f'{what} failed to load', exc_info=error)
+
+    async def run(self) -> List[Tuple[str, BaseException]]:
+        """Loads every registered extension concurrently, returns what failed"""
+        await asyncio.gather(*(self.__load__(name) for name in self.extensions))
+        timing.mark('cogs')
+        logging.getLogger(__name__).info(f'startup breakdown\n{timing.breakdown()}')
+        return self.failed
+
+    def report(self) -> str:
+        """Tracebacks of everything that failed to load, empty if nothing did"""
+        return '\n'.join(
+            f'{what}:\n' + ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+            for what, error in self.failed
+        )
@@ -0,0 +1,213 @@
+from abc import ABC, abstractmethod
+from typing import Union, Dict, Any, Iterator, List
+
+from utils.write_behind import WriteBehind
+
+
+class DuplicateKeyError(Exception):
+    """Raised when inserting a document whose _id already exists"""
+
+
+class UnitOfWork(ABC):
+    """Collects writes across collections of one backend and commits them together"""
+
+    @abstractmethod
+    def insert(self, collection: 'Backend', document: Dict[str, Any]) -> 'UnitOfWork':
+        pass
+
+    @abstractmethod
+    def update(self, collection: 'Backend', _id, document: Dict[str, Any]) -> 'UnitOfWork':
+        pass
+
+    @abstractmethod
+    def append(self, collection: 'Backend', _id, dict_: Dict[str, Any]) -> 'UnitOfWork':
+        pass
+
+    @abstractmethod
+    def delete(self, collection: 'Backend', _id) -> 'UnitOfWork':
+        pass
+
+    @abstractmethod
+    def commit(self):
+        """Writes every collected operation, returns once all of them are durable"""
+
+
+class Backend(ABC):
+    """A collection of documents keyed by _id, the operations the cogs use on storage
+
+    Documents may have a numeric `ending` (unix timestamp) which is indexed for range queries.
+    Implementations: utils.mongodb.Collection, utils.sqlite.Table, utils.memory.Table
+    """
+    name: str
+
+    @abstractmethod
+    def get(self, _id) -> Union[Dict[str, Any], None]:
+        """Returns the document with _id, None if not found"""
+
+    @abstractmethod
+    def insert(self, _id: Union[int, str, dict], dict_: Dict[str, Any] = None):
+        """Inserts a document, raises DuplicateKeyError if _id exists"""
+
+    @abstractmethod
+    def delete(self, message_id: Union[int, str]):
+        """Deletes a document by _id"""
+
+    @abstractmethod
+    def delete_many(self, ids: List[Any]):
+        """Deletes every document whose _id is in ids"""
+
+    @abstractmethod
+    def truncate(self):
+        """Clears the collection"""
+
+    @abstractmethod
+    def append(self, _id, dict_: Dict[str, Any]):
+        """Sets the keys of dict_ on an existing document"""
+
+    @abstractmethod
+    def update(self, _id, dict_: Dict[str, Any]):
+        """Replaces the document with _id, inserts it if it doesn't exist"""
+
+    @abstractmethod
+    def upsert_many(self, documents: List[Dict[str, Any]]):
+        """Replaces or inserts every document in one round trip"""
+
+    @abstractmethod
+    def bulk_update(self, pending: Dict[Any, Dict[str, Any]]):
+        """Writes changes coalesced by WriteBehind in one round trip"""
+
+    @abstractmethod
+    def ids(self, field: str = None) -> Iterator[Any]:
+        """Iterates over _id of every document, without fetching the rest of the document
+
+        :param field: also return this top level field, yields (_id, value) tuples instead
+        """
+
+    @abstractmethod
+    def stream(
+            self,
+            ending_after: float = None,
+            ending_before: float = None,
+            id_after: str = None,
+            id_before: str = None,
+            limit: int = 0,
+            batch_size: int = 100
+    ) -> Iterator[Dict[str, Any]]:
+        """Iterates over documents in _id order without loading the whole collection into memory
+
+        :param ending_after: only documents with ending >= this unix timestamp
+        :param ending_before: only documents with ending < this unix timestamp
+        :param id_after: only documents with _id > this value
+        :param id_before: only documents with _id < this value
+        :param limit: maximum amount of documents to yield, 0 for no limit
+        :param batch_size: amount of documents fetched per round trip
+        """
+
+    @abstractmethod
+    def range_by_ending(self, before: float, after: float = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """Returns documents with after <= ending < before, sorted by ending"""
+
+    @abstractmethod
+    def unit_of_work(self) -> UnitOfWork:
+        """Returns a UnitOfWork for writing to several collections of this backend in one commit"""
+
+    def ping(self):
+        """Blocks until the backend is reachable"""
+
+    def find(self, _id: Union[int, str, None], return_cursor=False):
+        """
+
+        :param _id: Searches document by _id, returns whole document if _id is None
+        :param return_cursor:
+        :return:
+        """
+        if _id is None:
+            results = self.stream()
+            return [result for result in results] if return_cursor else results
+        return self.get(_id)
+
+    @property
+    def buffered(self) -> WriteBehind:
+        """Write-behind buffer for fields that change too often to write one by one"""
+        if getattr(self, '_buffered', None) is None:
+            from utils.config import config
+            self._buffered = WriteBehind(
+                self,
+                interval=config.get('write_behind_interval', 5),
+                max_pending=config.get('write_behind_max_pending', 1000),
+                max_staleness=config.get('write_behind_max_staleness', 30)
+            )
+        return self._buffered
+
+
+class ColdStorage(Backend, ABC):
+    @abstractmethod
+    def expire(self):
+        """Enforces expire_at (unix timestamp) on compacted documents"""
+
+
+class LeaseStore(ABC):
+    """Expiring ownership records, lets several bot processes split work without doing it twice
+
+    A lease is held by one owner until it expires, only the owner can renew or release it.
+    """
+
+    @abstractmethod
+    def claim(self, key: str, owner: str, ttl: float) -> bool:
+        """Takes the lease if it is free, expired or already held by owner, returns whether it is now held"""
+
+    @abstractmethod
+    def renew(self, keys: List[str], owner: str, ttl: float) -> List[str]:
+        """Extends leases held by owner, returns the keys that are still held"""
+
+    @abstractmethod
+    def release(self, key: str, owner: str):
+        """Gives up a lease held by owner"""
+
+
+class ArchiveMixin:
+    """Giveaways that were started recently, older entries are compacted into the cold collection
+
+    Requires `cold` to be a ColdStorage
+    """
+    # Keys kept when compacting, everything else is dropped
+    slim_keys = ('_id', 'ending', 'winners', 'winner_ids', 'entrants', 'holder', 'path', 'role_weights', 'rules')
+    cold: ColdStorage
+
+    def find(self, _id: Union[int, str, None], return_cursor=False):
+        """Same as Backend.find, falls back to the cold collection when _id is not found"""
+        document = super().find(_id, return_cursor)
+        if document is None and _id is not None:
+            return self.cold.find(_id)
+        return document
+
+    def compact(self, before: float, ttl: int = None, batch_size: int = 500) -> List[str]:
+        """Moves slim copies of documents ending before a timestamp into the cold collection
+
+        :param before: unix timestamp, documents with an earlier ending are compacted
+        :param ttl: seconds to keep compacted documents in the cold collection, kept forever if None
+        :param batch_size: amount of documents moved per round trip
+        :return: _id of every compacted document
+        """
+        compacted = []
+        batch = []
+        for document in self.stream(ending_before=before, batch_size=batch_size):
+            slim = {key: document[key] for key in self.slim_keys if key in document}
+            if ttl is not None:
+                slim['expire_at'] = document['ending'] + ttl
+            batch.append(slim)
+            if len(batch) >= batch_size:
+                compacted.extend(self.__move__(batch))
+                batch = []
+        if batch:
+            compacted.extend(self.__move__(batch))
+        if ttl is not None:
+            self.cold.expire()
+        return compacted
+
+    def __move__(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Upserts documents into the cold collection then deletes them from this one"""
+        ids = [document['_id'] for document in documents]
+        self.cold.upsert_many(documents)
+        self.delete_many(ids)
+        return ids
@@ -1,31 +1,62 @@
-import json
 import re
-from typing import Union, Iterable, Dict, Tuple, List
+import enum
+import datetime
+from typing import Union, Iterable, Dict, Tuple, List, FrozenSet, Optional
 
 import discord
 from discord import User, Member
 from discord.ext import commands
 
 from utils import errors
+from utils.config import config
+from utils.guild_config import GuildSettings
 
-with open('config.json', encoding='utf-8') as file:
-    config = json.load(file)
+
+class HolderType(enum.Enum):
+    """How the holder is shown on a giveaway, the value is the name of its embed field"""
+    HOST = 'Hosted by:'
+    ITEM_HOLDER = 'Item Holder:'
+
+    def describe(self, name: str) -> str:
+        if self is HolderType.ITEM_HOLDER:
+            return f'Contact {name} to claim your prize'
+        return f'Hosted by: {name}'
+
+    @classmethod
+    def of(cls, string: str = None) -> 'HolderType':
+        """Type of a holder stored before types were, read from its string"""
+        if string and not re.search('Hosted by: .*', string, re.IGNORECASE) \
+                and re.search('Contact (.*) to claim your prize', string, re.IGNORECASE):
+            return cls.ITEM_HOLDER
+        return cls.HOST
 
 
 class Holder(object):
-    def __init__(self, mention: str = None, tag: str = None, string: str = None):
+    def __init__(self, mention: str = None, tag: str = None, string: str = None,
+                 type: Union[HolderType, str] = None):
         self.mention = mention
         self.tag = tag
         self.string = string  # Contact <name> to claim your prize / Hosted by: <name>
+        if isinstance(type, str):  # name of the type, as stored in documents
+            type = HolderType[type]
+        self.type = type if type is not None else HolderType.of(string)
 
     def __str__(self):
         return self.string
 
-    def populate(self, user: Union[User, Member], string: str):
+    def populate(self, user: Union[User, Member], type_: HolderType):
         """Takes a user object and populates the attributes of the current instance"""
         self.tag = str(user)
         self.mention = user.mention
-        self.string = string
+        self.type = type_
+        self.string = type_.describe(str(user))
+
+
+# Parts of embeds that are the same on every render, built once
+RUNNING_COLOUR = discord.Colour.green()
+RESULT_COLOUR = discord.Colour.blue()
+REROLL_COLOUR = discord.Colour.dark_blue()
+GUIDE_INSTRUCTIONS = '**Please tell us your ingame name and at what times you are available to trade**\n'
 
 
 def error(message: str, jump_url: str = '') -> discord.Embed:
@@ -59,8 +90,14 @@ def running_giveaway(
         winners: int,
         holder: Holder,
         description: str = None,
-        prize: str = None) \
+        prize: str = None,
+        entrants: int = None,
+        reference: str = None) \
         -> discord.Embed:
+    """Embed of a running giveaway
+
+    :param reference: shown at the end of the footer, identifies the post of a scheduled giveaway's attempt
+    """
 
     if (description is None) and (prize is None):
         raise Exception('description and prize must not both be None')
@@ -68,11 +105,13 @@ def running_giveaway(
     embed = discord.Embed(
         title=prize,
         description=description,
-        colour=discord.Colour.green()
+        colour=RUNNING_COLOUR
     )
 
     embed.add_field(**__contact_type__(holder))
     embed.add_field(name='Ending:', value=f'<t:{unix}:R> (<t:{unix}>)')
+    if entrants is not None:
+        embed.add_field(name='Entrants:', value=str(entrants))
 
     footer_text = f'{winners} winner'
     if winners > 1:
@@ -80,10 +119,98 @@ def running_giveaway(
     if holder.tag:  # Mentions don't work for footer
         if str(holder):
             footer_text += f' | {holder}'
+    if reference:
+        footer_text += f' | {reference}'
     embed.set_footer(text=footer_text)
     return embed
 
 
+def set_entrants(embed: discord.Embed, entrants: int) -> discord.Embed:
+    """Sets the entrant count of a running giveaway embed, adds the field to embeds made before it existed"""
+    for i, field in enumerate(embed.fields):
+        if field.name == 'Entrants:':
+            return embed.set_field_at(i, name='Entrants:', value=str(entrants))
+    return embed.add_field(name='Entrants:', value=str(entrants))
+
+
+POLL_COLOUR = discord.Colour.purple()
+POLL_BAR_WIDTH = 12
+
+
+def poll_results(
+        title: str,
+        description: str,
+        options: List[str],
+        counts: List[int],
+        unix: int,
+        closed: bool = False) \
+        -> discord.Embed:
+    """Poll embed with a bar per option, ending shown as the footer timestamp"""
+    embed = discord.Embed(
+        title=title if not closed else f'{title} (closed)',
+        description=description or None,
+        colour=POLL_COLOUR if not closed else RESULT_COLOUR,
+        timestamp=datetime.datetime.fromtimestamp(unix, tz=datetime.timezone.utc)
+    )
+    total = sum(counts)
+    for option, count in zip(options, counts):
+        share = count / total if total else 0
+        bar = '█' * round(share * POLL_BAR_WIDTH)
+        embed.add_field(name=option, value=f'`{bar:░<{POLL_BAR_WIDTH}}` {count} ({share:.0%})', inline=False)
+    votes = f'{total} vote' if total == 1 else f'{total} votes'
+    embed.set_footer(text=f'{votes} | Closed' if closed else f'{votes} | Ends')
+    return embed
+
+
+# Discord's limits on one message
+CONTENT_LIMIT = 2000
+EMBED_LIMIT = 6000
+FIELD_LIMIT = 1024
+FIELDS_LIMIT = 25
+PAGE_TITLE_RESERVE = 12  # ' (999/999)' added to titles of results sent in several messages
+
+
+def paginate(
+        items: List[str],
+        first_page_size: int,
+        first_page_fields: int,
+        page_size: int,
+        in_content: bool,
+        field_name: str = 'Winners:'
+) -> List[List[str]]:
+    """Packs items into embed fields and fields into messages within Discord's limits, in one pass
+
+    Items are joined with line breaks in fields and, if in_content, with spaces in the message content.
+    :param first_page_size: characters the first message's embed uses without the items
+    :param first_page_fields: fields the first message's embed has without the items
+    :param page_size: characters each following message's embed uses without the items
+    :return: per message, the values of its item fields
+    """
+    pages = [[]]
+    field_size = embed_size = content_size = 0
+    budget, fields_left = EMBED_LIMIT - first_page_size, FIELDS_LIMIT - first_page_fields
+    for item in items:
+        page = pages[-1]
+        new_field = not page or field_size + 1 + len(item) > FIELD_LIMIT
+        added = len(field_name) + len(item) if new_field else 1 + len(item)
+        if page and (embed_size + added > budget or (new_field and len(page) >= fields_left)
+                     or (in_content and content_size + 1 + len(item) > CONTENT_LIMIT)):
+            pages.append([])
+            page = pages[-1]
+            embed_size = content_size = 0
+            budget, fields_left = EMBED_LIMIT - page_size, FIELDS_LIMIT
+            new_field, added = True, len(field_name) + len(item)
+        if new_field:
+            page.append(item)
+            field_size = len(item)
+        else:
+            page[-1] += '\n' + item
+            field_size += 1 + len(item)
+        embed_size += added
+        content_size += len(item) + (1 if content_size else 0)
+    return pages
+
+
 def giveaway_result(
         winners: Iterable[str],
         giveaway_title: str,
@@ -92,46 +219,61 @@ def giveaway_result(
         giveaway_link: str,
         mention_users: Union[Iterable[str], bool] = False,
         reroll: bool = False) \
-        -> Dict[str, Union[discord.Embed, str]]:
-    """Return value to be used as kwargs for discord.abc.Messageable.send()"""
-
-    # sets message content to winner arg if True
-    # sets message content to mention_users if mention_users
-    # sets message content to None if False
-    if mention_users is True:
-        mention_winners = ' '.join(winners)
-    elif mention_users:
-        mention_winners = ' '.join(mention_users)
-    else:
-        mention_winners = ''
+        -> List[Dict[str, Union[discord.Embed, str]]]:
+    """Messages of a result post, each one to be used as kwargs for discord.abc.Messageable.send()
 
+    Winners are split over as many messages as Discord's content and embed limits need, the first one
+    has the giveaway and holder, following ones continue the winner list.
+    """
+    winners = list(winners)
     if reroll:
         title = 'Giveaway was rerolled'
-        colour = discord.Colour.dark_blue()
+        colour = REROLL_COLOUR
     else:
         title = 'Giveaway result'
-        colour = discord.Colour.blue()
+        colour = RESULT_COLOUR
 
     description = ''
     if giveaway_title:
         description += f'**{giveaway_title}**'
     if giveaway_description:
         description += f'\n{giveaway_description}'
-
-    embed = discord.Embed(
-        colour=colour,
-        title=title,
-        description=description
+    contact = __contact_type__(holder)
+    jump = f'[to giveaway]({giveaway_link})'
+
+    # sets message content to winners if True
+    # sets message content of the first message to mention_users if mention_users
+    # sets message content to '' if False
+    header_size = len(title) + PAGE_TITLE_RESERVE + len(description) + len(contact['name']) \
+        + len(contact['value']) + len('Jump') + len(jump) + len(str(holder))
+    pages = paginate(
+        winners, header_size, first_page_fields=2, page_size=len(title) + PAGE_TITLE_RESERVE,
+        in_content=mention_users is True
     )
-    embed.add_field(**__contact_type__(holder))
-    embed.add_field(name='Winners:', value='\n'.join(winners), inline=False)
-    embed.add_field(name='Jump', value=f'[to giveaway]({giveaway_link})', inline=False)
-    embed.set_footer(text=str(holder))
 
-    return {
-        'content': mention_winners,
-        'embed': embed
-    }
+    messages = []
+    for number, fields in enumerate(pages, 1):
+        embed = discord.Embed(
+            colour=colour,
+            title=f'{title} ({number}/{len(pages)})' if len(pages) > 1 else title,
+            description=description if number == 1 else None
+        )
+        if number == 1:
+            embed.add_field(**contact)
+        for value in fields or ['']:
+            embed.add_field(name='Winners:', value=value, inline=False)
+        if number == 1:
+            embed.add_field(name='Jump', value=jump, inline=False)
+            embed.set_footer(text=str(holder))
+
+        if mention_users is True:
+            content = ' '.join(value.replace('\n', ' ') for value in fields)
+        elif mention_users and number == 1:
+            content = ' '.join(mention_users)
+        else:
+            content = ''
+        messages.append({'content': content, 'embed': embed})
+    return messages
 
 
 def __contact_type__(holder: Holder) -> dict:
@@ -140,13 +282,11 @@ def __contact_type__(holder: Holder) -> dict:
     if not str(holder):
         raise Exception('__contact_type__ cannot be used when holder.string is empty or None')
 
-    if re.search('Hosted by: .*', str(holder), re.IGNORECASE):
-        return {'name': 'Hosted by:', 'value': contact, 'inline': True}
-    elif re.search('Contact (.*) to claim your prize', str(holder), re.IGNORECASE):
-        return {'name': 'Item Holder:', 'value': contact, 'inline': True}
+    return {'name': holder.type.value, 'value': contact, 'inline': True}
 
 
 def winner_guide(prize, description, giveaway_link, holder_tag):
+    """Same for every winner of a giveaway, build it once and send it to each of them"""
     if description is None:
         description = ''
     if prize is None:
@@ -156,11 +296,9 @@ def winner_guide(prize, description, giveaway_link, holder_tag):
     if description:
         description += '\n\n'
     embed = discord.Embed(
-        colour=discord.Colour.blue(),
+        colour=RESULT_COLOUR,
         title=f"You won: {prize}",
-        description=f"{description}"
-                    "**Please tell us your ingame name and at what times you are available to trade**\n"
-                    f"[Jump to giveaway]({giveaway_link})"
+        description=f"{description}{GUIDE_INSTRUCTIONS}[Jump to giveaway]({giveaway_link})"
     )
 
     return embed
@@ -197,9 +335,10 @@ async def create_thread(
         name: str,
         messages: List[Union[str, discord.Embed, dict]],
         thread_type=discord.ChannelType.private_thread,
-        auto_archive: int = 10080
+        auto_archive: int = 10080,
+        silent: bool = False
 ) -> Tuple[discord.Thread, discord.Message]:
-    """Creates thread"""
+    """Creates thread, messages are composed into one, see compose()"""
     try:
         thread = await channel.create_thread(
             name=name,
@@ -213,17 +352,28 @@ async def create_thread(
             auto_archive_duration=auto_archive
         )
 
-    sent_message = await send_and_edit(thread, messages)
+    sent_message = await thread.send(**compose(messages, silent))
 
     return thread, sent_message
 
 
+async def ticket_threads(thread_channel: discord.TextChannel) -> List[discord.Thread]:
+    """Active and archived threads of a ticket channel"""
+    return [
+        *thread_channel.threads,
+        *[thread async for thread in thread_channel.archived_threads(private=True)],
+        *[thread async for thread in thread_channel.archived_threads(private=False)]
+    ]
+
+
 async def create_ticket(thread_channel: discord.TextChannel,
                         thread_name: str,
                         user_id: int,
                         messages: List[Union[str, discord.Embed, dict]],
                         delete_starter_message: bool = True,
-                        auto_archive: int = 10080
+                        auto_archive: int = 10080,
+                        silent: bool = False,
+                        threads: List[discord.Thread] = None
                         ) -> Tuple[discord.Thread, discord.Message]:
     """Creates a ticket for user
 
@@ -231,19 +381,18 @@ async def create_ticket(thread_channel: discord.TextChannel,
         thread_channel: text channel to create the ticket in
         thread_name: name of the thread
         user_id: id of the user creating the ticket
-        messages: Initial messages on creating the thread, sends the first one and edits it into following ones.
-            Sends only the last if thread already exists
+        messages: Initial messages of the thread, sent as one message, see compose().
+            Also sent if the thread already exists
         delete_starter_message: deletes public threads' starter message
         auto_archive: auto archive duration of the thread in minutes
+        silent: nobody mentioned is notified, they are still added to the thread
+        threads: ticket_threads(thread_channel) if already fetched, when opening several tickets at once
     Returns:
         Tuple that consist of 2 elements, the thread and the start message
     """
     # Check if user already has ticket open
-    threads = [
-        *thread_channel.threads,
-        *[thread async for thread in thread_channel.archived_threads(private=True)],
-        *[thread async for thread in thread_channel.archived_threads(private=False)]
-    ]
+    if threads is None:
+        threads = await ticket_threads(thread_channel)
     for thread in threads:
         if str(user_id) in thread.name:  # If ticket already exist
             if thread_name != thread.name:
@@ -251,14 +400,15 @@ async def create_ticket(thread_channel: discord.TextChannel,
                 # TODO: restrict usage cause discord doesn't like channel name changes
                 await thread.edit(name=thread_name)
 
-            message = await thread.send(**check_type(messages[-1]))
+            message = await thread.send(**compose(messages, silent))
             return thread, message
 
     thread, message = await create_thread(
         channel=thread_channel,
         name=thread_name,
         messages=messages,
-        auto_archive=auto_archive
+        auto_archive=auto_archive,
+        silent=silent
     )
     if thread.starter_message and delete_starter_message:
         await thread.starter_message.delete()
@@ -275,13 +425,41 @@ def check_type(message_: Union[str, discord.Embed, dict]) -> dict:
         return {'embed': message_}
 
 
-async def send_and_edit(channel: discord.abc.Messageable, messages: List[Union[str, discord.Embed, dict]]):
-    """Sends the first message in list and edits it into following elements in the list"""
-    sent_message = await channel.send(**check_type(messages[0]))
-    for message in messages[1:]:
-        await sent_message.edit(**check_type(message))
+MENTION = re.compile(r'<@([!&]?)(\d+)>')
+
+
+def compose(messages: List[Union[str, discord.Embed, dict]], silent: bool = False) -> dict:
+    """Kwargs for one send that replaces sending messages[0] and editing it into each following message
 
-    return sent_message
+    Shows the last content and the last embed given, like the edits left them. Users and roles mentioned in
+    earlier contents are mentioned in front of it, as mentions only add members to a private thread if they
+    are in the message. allowed_mentions is limited to exactly those mentions unless a message sets it.
+
+    :param silent: nobody is notified of the mentions, like the ones that used to be edited in
+    """
+    composed = {}
+    mentions: Dict[str, discord.Object] = {}  # mention -> user or role, in order of appearance
+    roles = set()
+    for message in messages:
+        kwargs = check_type(message)
+        composed.update(kwargs)
+        for match in MENTION.finditer(kwargs.get('content') or ''):
+            mentions.setdefault(match[0], discord.Object(int(match[2])))
+            if match[1] == '&':
+                roles.add(match[0])
+    content = composed.get('content') or ''
+    earlier = ' '.join(mention for mention in mentions if mention not in content)
+    if earlier:
+        composed['content'] = f'{earlier}\n{content}' if content else earlier
+    if 'allowed_mentions' not in composed:
+        composed['allowed_mentions'] = discord.AllowedMentions(
+            everyone=False,
+            users=[object_ for mention, object_ in mentions.items() if mention not in roles],
+            roles=[object_ for mention, object_ in mentions.items() if mention in roles]
+        )
+    if silent:
+        composed['silent'] = True
+    return composed
 
 
 async def get_channel(bot: commands.Bot, channel_id: int):
@@ -352,28 +530,43 @@ async def get_user(
         raise errors.MemberNotFoundWarning(warning_)
 
 
-def __is_staff(ctx, role_ids):
-    output = False
-    if ctx.author == ctx.guild.owner:
-        output = True
+__default_settings = None
 
-    for role in ctx.author.roles:
-        if role.permissions.administrator:
-            output = True
-        elif role.id in role_ids:
-            output = True
-    return output
+def guild_settings(bot: commands.Bot, guild_id: int) -> GuildSettings:
+    """Settings of a guild from the in-memory cache, config.json until the cache is loaded"""
+    global __default_settings
+    cache = getattr(bot, 'guild_config', None)
+    if cache is not None:
+        return cache.get(guild_id)
+    if __default_settings is None:
+        __default_settings = GuildSettings.from_config(config)
+    return __default_settings if guild_id == __default_settings.guild_id else GuildSettings(guild_id)
+
+async def modmail_channel(bot: commands.Bot, guild_id: int) -> Optional[discord.TextChannel]:
+    """Channel a guild's tickets are opened in, None if it has none
+
+    The modmail channel of config.json is in the home guild, other guilds' tickets are never opened there.
+    """
+    settings = guild_settings(bot, guild_id)
+    if settings.modmail_channel_id:
+        return await get_channel(bot, settings.modmail_channel_id)
+    if guild_id == config['guild_id']:
+        return bot.resources.get('modmail_channel')
+    return None
+
+def __is_staff(ctx, role_ids: FrozenSet[int]):
+    if ctx.author == ctx.guild.owner or ctx.author.guild_permissions.administrator:
+        return True
+    return any(ctx.author.get_role(role_id) is not None for role_id in role_ids)
 
 def is_staff(ctx):
-    role_ids = config['giveaway_role_ids']
-    role_ids.extend(config['mod_role_ids'])
-    return __is_staff(ctx, role_ids)
+    return __is_staff(ctx, guild_settings(ctx.bot, ctx.guild.id).staff_role_ids)
 
 def is_giveaway_staff(ctx):
-    return __is_staff(ctx, config['giveaway_role_ids'])
+    return __is_staff(ctx, guild_settings(ctx.bot, ctx.guild.id).giveaway_role_ids)
 
 def is_mod_staff(ctx):
-    return __is_staff(ctx, config['mod_role_ids'])
+    return __is_staff(ctx, guild_settings(ctx.bot, ctx.guild.id).mod_role_ids)
 
 def is_bot_owner(ctx):
     return ctx.author.id == 468631903390400527
@@ -0,0 +1,34 @@
+"""Startup timing breakdown, stages are recorded in seconds since this module was first imported"""
+import time
+import logging
+from typing import Dict, Iterable
+
+started = time.perf_counter()
+stages: Dict[str, float] = {}
+
+
+def mark(stage: str) -> float:
+    """Records that a stage finished now, returns seconds since start"""
+    stages[stage] = time.perf_counter() - started
+    logging.getLogger(__name__).info(f'startup stage {stage} finished at {stages[stage]:.3f}s')
+    return stages[stage]
+
+
+def breakdown() -> str:
+    """Stages in the order they finished, with the time each took since the previous one"""
+    lines = []
+    previous = 0.0
+    for stage, seconds in sorted(stages.items(), key=lambda item: item[1]):
+        lines.append(f'{stage:<12}{seconds:>8.3f}s  (+{seconds - previous:.3f}s)')
+        previous = seconds
+    return '\n'.join(lines)
+
+
+def percentiles(name: str, samples: Iterable[float]) -> str:
+    """p50, p99 and max of durations in seconds, in one line"""
+    samples = sorted(samples)
+    if not samples:
+        return f'{name}: no samples'
+    return f'{name}: p50 {samples[len(samples) // 2] * 1000:.0f}ms ' \
+           f'p99 {samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000:.0f}ms ' \
+           f'max {samples[-1] * 1000:.0f}ms over the last {len(samples)}'
@@ -0,0 +1,83 @@
+import time
+from typing import Dict, Any, Iterable, List, Optional
+
+from utils.storage import Backend
+
+
+class RecentWins:
+    """Users who won after a timestamp, `user_id in recent_wins` is a dict lookup"""
+
+    def __init__(self, last_win: Dict[int, float], since: float):
+        self.last_win = last_win
+        self.since = since
+
+    def __contains__(self, user_id: int) -> bool:
+        return self.last_win.get(user_id, float('-inf')) >= self.since
+
+    def __bool__(self):
+        return bool(self.last_win)
+
+
+class WinnersIndex:
+    """Every win of every user, one document per win
+
+    Documents have _id `user_id:giveaway_id` so a user's wins are one _id range, and `ending` set to when
+    the win happened so recent wins are one range on the ending index.
+    The latest win of users who won within `window` seconds is cached in memory for cooldown checks.
+    Methods not marked async block, run them in a thread.
+    """
+
+    def __init__(self, collection: Backend, window: float = 30 * 86400):
+        self.collection = collection
+        self.window = window
+        self.last_win: Dict[int, float] = {}
+        self.loaded_until: Optional[float] = None
+
+    def record(self, user_ids: Iterable[int], giveaway_id: str, path: str, timestamp: float = None):
+        """Stores wins of a giveaway (or a reroll of it)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        documents = [
+            {
+                '_id': f'{user_id}:{giveaway_id}',
+                'user_id': str(user_id),
+                'giveaway_id': str(giveaway_id),
+                'path': path,
+                'ending': timestamp
+            }
+            for user_id in user_ids
+        ]
+        self.collection.upsert_many(documents)
+        for document in documents:
+            self.__cache__(int(document['user_id']), timestamp)
+
+    def __cache__(self, user_id: int, timestamp: float):
+        if timestamp > self.last_win.get(user_id, float('-inf')):
+            self.last_win[user_id] = timestamp
+
+    def refresh(self, now: float = None):
+        """Loads wins recorded since the last refresh, also by other processes, and drops wins outside the window"""
+        now = time.time() if now is None else now
+        after = now - self.window if self.loaded_until is None else self.loaded_until - 60  # clock skew margin
+        for document in self.collection.range_by_ending(before=float('inf'), after=after):
+            self.__cache__(int(document['user_id']), document['ending'])
+        self.loaded_until = now
+        oldest = now - self.window
+        self.last_win = {user_id: timestamp for user_id, timestamp in self.last_win.items() if timestamp >= oldest}
+
+    def recent(self, seconds: float, now: float = None) -> RecentWins:
+        """Users who won within the last `seconds`, from the cache if the window covers it"""
+        now = time.time() if now is None else now
+        since = now - seconds
+        if seconds <= self.window:
+            return RecentWins(self.last_win, since)
+        last_win = {}
+        for document in self.collection.range_by_ending(before=float('inf'), after=since):
+            user_id = int(document['user_id'])
+            last_win[user_id] = max(last_win.get(user_id, float('-inf')), document['ending'])
+        return RecentWins(last_win, since)
+
+    def history(self, user_id: int, limit: int = 0) -> List[Dict[str, Any]]:
+        """Wins of a user, latest first"""
+        wins = list(self.collection.stream(id_after=f'{user_id}:', id_before=f'{user_id};'))
+        wins.sort(key=lambda document: document['ending'], reverse=True)
+        return wins[:limit] if limit else wins
@@ -0,0 +1,157 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Set
+
+
+class WriteBehind:
+    """Coalesces frequent updates per _id in memory and writes them in batches
+
+    Changes are flushed when max_pending documents have pending changes, when the oldest pending change
+    is max_staleness seconds old, or interval seconds after the previous flush, whichever comes first.
+
+    Pending changes per _id have the form {'set': dict, 'inc': dict, 'replace': dict or None},
+    the collection must provide bulk_update(pending) to write them.
+    """
+    instances: Set['WriteBehind'] = set()  # buffers with a flusher started since they were last closed
+
+    def __init__(self, collection, interval: float = 5, max_pending: int = 1000, max_staleness: float = 30):
+        self.collection = collection
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_staleness = max_staleness
+        self.pending: Dict[Any, Dict[str, Any]] = {}
+        self.oldest = None  # time.monotonic() of the oldest pending change
+        self.last_flush = time.monotonic()
+        self.flushes = 0
+        self.coalesced = 0  # changes that did not need a write of their own
+        self.__changed = asyncio.Event()
+        self.__full = asyncio.Event()
+        self.__lock = asyncio.Lock()
+        self.__task = None
+
+    def __entry__(self, _id) -> Dict[str, Any]:
+        if _id in self.pending:
+            self.coalesced += 1
+        else:
+            self.pending[_id] = {'set': {}, 'inc': {}, 'replace': None}
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+        if len(self.pending) >= self.max_pending:
+            self.__full.set()
+        self.__changed.set()
+        self.__ensure_running()
+        return self.pending[_id]
+
+    def set(self, _id, dict_: Dict[str, Any]):
+        """Buffers a $set of dict_ on document _id"""
+        entry = self.__entry__(_id)
+        if entry['replace'] is not None:
+            entry['replace'].update(dict_)
+        else:
+            entry['set'].update(dict_)
+            for key in dict_:
+                entry['inc'].pop(key, None)
+
+    def inc(self, _id, dict_: Dict[str, int]):
+        """Buffers an $inc of dict_ on document _id"""
+        entry = self.__entry__(_id)
+        for key, amount in dict_.items():
+            if entry['replace'] is not None:
+                entry['replace'][key] = entry['replace'].get(key, 0) + amount
+            elif key in entry['set']:
+                entry['set'][key] += amount
+            else:
+                entry['inc'][key] = entry['inc'].get(key, 0) + amount
+
+    def replace(self, _id, document: Dict[str, Any]):
+        """Buffers a replacement (upsert) of document _id, discarding earlier pending changes to it"""
+        entry = self.__entry__(_id)
+        entry['set'], entry['inc'], entry['replace'] = {}, {}, dict(document)
+
+    def __ensure_running(self):
+        if self.__task is None or self.__task.done():
+            WriteBehind.instances.add(self)
+            try:
+                self.__task = asyncio.get_running_loop().create_task(self.__run__())
+            except RuntimeError:  # No running loop, changes are written on the next explicit flush
+                pass
+
+    async def __run__(self):
+        while True:
+            await self.__changed.wait()
+            if self.oldest is not None:
+                deadline = min(self.last_flush + self.interval, self.oldest + self.max_staleness)
+                try:
+                    await asyncio.wait_for(self.__full.wait(), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception:
+                logging.getLogger(__name__).exception('Write-behind flush failed, retrying')
+                await asyncio.sleep(self.interval)
+
+    async def get(self, _id) -> Optional[Dict[str, Any]]:
+        """Returns the stored document with pending changes applied, like it will be after the next flush"""
+        async with self.__lock:  # no batch is half written while the document is read
+            document = await asyncio.to_thread(self.collection.get, _id)
+            entry = self.pending.get(_id)
+            if entry is None:
+                return document
+            if entry['replace'] is not None:
+                return {**entry['replace'], '_id': _id}
+            if document is None:
+                return None
+            document = {**document, **entry['set']}
+            for key, amount in entry['inc'].items():
+                document[key] = document.get(key, 0) + amount
+            return document
+
+    async def flush(self):
+        """Writes every pending change, pending changes are kept if the write fails"""
+        async with self.__lock:
+            self.__changed.clear()
+            self.__full.clear()
+            if not self.pending:
+                return
+            batch, self.pending, self.oldest = self.pending, {}, None
+            try:
+                await asyncio.to_thread(self.collection.bulk_update, batch)
+            except Exception:
+                self.__restore__(batch)
+                raise
+            self.last_flush = time.monotonic()
+            self.flushes += 1
+
+    def __restore__(self, batch: Dict[Any, Dict[str, Any]]):
+        """Puts a failed batch back in front of changes made while it was being written"""
+        newer, self.pending = self.pending, {}
+        for _id, entry in batch.items():
+            self.pending[_id] = entry
+            self.oldest = self.oldest or time.monotonic()
+        for _id, entry in newer.items():
+            if entry['replace'] is not None:
+                self.replace(_id, entry['replace'])
+            else:
+                self.set(_id, entry['set'])
+                self.inc(_id, entry['inc'])
+        self.__changed.set()
+
+    async def close(self):
+        """Stops the background flusher and writes everything still pending"""
+        async with self.__lock:  # Don't cancel a flush that is being written
+            if self.__task is not None:
+                self.__task.cancel()
+                self.__task = None
+        WriteBehind.instances.discard(self)
+        await self.flush()
+
+    @classmethod
+    async def close_all(cls):
+        """Durably flushes every buffer, to be called on shutdown"""
+        for instance in list(cls.instances):
+            try:
+                await instance.close()
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to flush write-behind buffer on shutdown')